@@ -0,0 +1,242 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package aggregate
+# Aggregation of time series over time windows (e.g. throughput from packet
+# sizes), so only the aggregated series is handed to the plot script. This
+# implements the aggregation (AGGR) of plot_time_series.R.
+#
+# $Id$
+
+import os
+import re
+import math
+from array import array
+
+import config
+from coldata import read_data_file
+
+
+## Extension for aggregated data file
+AGGR_FILE_EXT = '.aggr'
+## Default window size in seconds (AGGR_WIN_SIZE in plot_time_series.R)
+DEFAULT_WIN_SIZE = 1.0
+## Default number of overlapping windows per window size (AGGR_INT_FACTOR in
+## plot_time_series.R)
+DEFAULT_INT_FACTOR = 4
+## Values greater or equal are ignored (e.g. tcp rtt estimate is set to max int
+## on windows for non-smoothed)
+MAX_VALUE = 4294967295.0
+
+
+## Return true if data should be aggregated before it is passed to the plot
+## script (TPCONF_aggregate_data in config.py, enabled by default)
+#  @return True if aggregation is enabled, otherwise False
+def aggregation_enabled():
+    try:
+        return str(config.TPCONF_aggregate_data) == '1'
+    except AttributeError:
+        return True
+
+
+## Get window size and interpolation factor from plot parameters
+#  @param plot_params Parameters passed to plot function via environment variables
+#  @return Pair of window size and interpolation factor, or None if the
+#          interpolation factor is not an integer
+def get_aggr_params(plot_params):
+    win_size = DEFAULT_WIN_SIZE
+    int_factor = DEFAULT_INT_FACTOR
+
+    res = re.search('AGGR_WIN_SIZE=["\']?([0-9\.eE+-]+)', plot_params)
+    if res:
+        win_size = float(res.group(1))
+    res = re.search('AGGR_INT_FACTOR=["\']?([0-9\.eE+-]+)', plot_params)
+    if res:
+        int_factor = float(res.group(1))
+        if int_factor != int(int_factor) or int_factor < 1:
+            return None
+        int_factor = int(int_factor)
+
+    if win_size <= 0:
+        return None
+
+    return (win_size, int_factor)
+
+
+## Read time series from data file
+#  @param data_file Data file name
+#  @param yindex Index of the value column (starting with 1, as in R)
+#  @param yscaler Scaler for values
+#  @param sep Column separator
+#  @return Pair of arrays of timestamps and values, and flag that is True if all
+#          values are the same
+def read_series(data_file, yindex, yscaler, sep):
+    data = read_data_file(data_file, sep)
+    times = data.get_values(0)
+    values = data.get_values(yindex - 1)
+
+    out_times = array('d')
+    out_values = array('d')
+    const = True
+    first = None
+    for t, v in zip(times, values):
+        # skip NaN, there should not be any
+        if t != t or v != v:
+            continue
+        if first is None:
+            first = v
+        elif v != first:
+            const = False
+        if v < MAX_VALUE:
+            out_times.append(t)
+            out_values.append(v * yscaler)
+    data.close()
+
+    return (out_times, out_values, const and len(times) > 1)
+
+
+## Replace values with differences between consecutive values (the first
+## data point is removed)
+#  @param times Timestamps
+#  @param values Cumulative values
+#  @return Pair of arrays of timestamps and values
+def diff_series(times, values):
+    diff_values = array('d', [ values[i] - values[i - 1] for i in range(1, len(values)) ])
+    return (times[1:], diff_values)
+
+
+## Aggregate values over overlapping time windows. Window n of offset k
+## covers [n * win_size + k * win_size / int_factor, (n + 1) * win_size + ...)
+## for k = 0, ..., int_factor - 1, and only windows with data points are
+## returned. Each window is the sum of int_factor slots of size
+## win_size / int_factor, so every data point is only looked at once.
+#  @param times Timestamps (relative to start of experiment)
+#  @param values Values
+#  @param aggr '1' sum of values per second (throughput),
+#              '2' percentage of values (packet loss)
+#  @param win_size Window size in seconds
+#  @param int_factor Number of windows per window size
+#  @return Pair of arrays of window centre times and aggregated values
+def aggregate_series(times, values, aggr='1', win_size=DEFAULT_WIN_SIZE,
+                     int_factor=DEFAULT_INT_FACTOR):
+    out_times = array('d')
+    out_values = array('d')
+    if len(times) == 0:
+        return (out_times, out_values)
+
+    slot_scale = int_factor / win_size
+    first_slot = int(math.floor(min(times) * slot_scale))
+    last_slot = int(math.floor(max(times) * slot_scale))
+
+    # sum and number of values per slot, with int_factor - 1 empty slots at
+    # both ends, so windows can overlap the first and last slot 
+    pad = int_factor - 1
+    slots = last_slot - first_slot + 1 + 2 * pad
+    sums = array('d', [0.0]) * slots
+    counts = array('l', [0]) * slots
+    base = first_slot - pad
+    floor = math.floor
+    for t, v in zip(times, values):
+        i = int(floor(t * slot_scale)) - base
+        sums[i] += v
+        counts[i] += 1
+
+    slot_size = win_size / int_factor
+    centre = (1.0 / int_factor) / 2 + win_size / 2
+    for i in range(slots - pad):
+        cnt = sum(counts[i:i + int_factor])
+        if cnt == 0:
+            continue
+        total = sum(sums[i:i + int_factor])
+        out_times.append((base + i) * slot_size + centre)
+        if aggr == '2':
+            out_values.append(total / cnt * 100.0)
+        else:
+            out_values.append(total * (1.0 / win_size))
+
+    return (out_times, out_values)
+
+
+## Write time series to file (the file is written under a temporary name first,
+## so parallel processes never read a partially written file)
+#  @param out_file Output file name
+#  @param times Timestamps
+#  @param values Values
+def write_series(out_file, times, values):
+    tmp_name = '%s.%i' % (out_file, os.getpid())
+    with open(tmp_name, 'w') as f:
+        f.writelines([ '%r %r\n' % (t, v) for t, v in zip(times, values) ])
+    os.rename(tmp_name, out_file)
+
+
+## Aggregate data files like plot_time_series.R does. Timestamps are made
+## relative to the start of the experiment (first timestamp of all files of
+## the same group).
+#  @param file_names List of data file names
+#  @param groups List of group numbers of data files
+#  @param yindex Index of the value column (starting with 1)
+#  @param yscaler Scaler for values
+#  @param sep Column separator
+#  @param aggr '1' throughput, '2' packet loss
+#  @param diff '1' use differences between consecutive values
+#  @param omit_const '1' omit data files with constant values
+#  @param win_size Window size in seconds
+#  @param int_factor Number of windows per window size
+#  @return List of aggregated file names (None for omitted data files)
+def aggregate_files(file_names, groups, yindex, yscaler, sep, aggr, diff='0',
+                    omit_const='0', win_size=DEFAULT_WIN_SIZE,
+                    int_factor=DEFAULT_INT_FACTOR):
+    series = []
+    start = {}
+    for data_file, group in zip(file_names, groups):
+        (times, values, const) = read_series(data_file, yindex, yscaler, sep)
+        if (omit_const == '1' and const) or len(times) == 0:
+            series.append(None)
+            continue
+        series.append((times, values))
+        start[group] = min(start.get(group, times[0]), min(times))
+
+    out_files = []
+    for data_file, group, s in zip(file_names, groups, series):
+        if s is None:
+            out_files.append(None)
+            continue
+
+        (times, values) = s
+        times = array('d', [ t - start[group] for t in times ])
+        if diff == '1':
+            (times, values) = diff_series(times, values)
+        (times, values) = aggregate_series(times, values, aggr, win_size,
+                                           int_factor)
+        if len(times) == 0:
+            out_files.append(None)
+            continue
+
+        out_file = data_file + AGGR_FILE_EXT
+        write_series(out_file, times, values)
+        out_files.append(out_file)
+
+    return out_files
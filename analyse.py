@@ -32,11 +32,11 @@
 
 import os
 import errno
+import gzip
 import time
 import datetime
 import re
 import socket
-import imp
 from fabric.api import task, warn, put, puts, get, local, run, execute, \
     settings, abort, hosts, env, runs_once, parallel, hide
 
@@ -44,9 +44,29 @@ import config
 from internalutil import _list, mkdir_p, valid_dir
 from hostint import get_address_pair
 from clockoffset import adjust_timestamps, DATA_CORRECTED_FILE_EXT
-from filefinder import get_testid_file_list
-from flowcache import append_flow_cache, lookup_flow_cache
+from filefinder import get_testid_file_list, lookup_dir_cache
+from oldconfig import get_old_config
+from aggregate import aggregate_files, aggregation_enabled, get_aggr_params
+from pointthin import thin_files, pthin_enabled
+from plotworker import run_plot_script
+from summarystats import get_stats_files
+from metricsdb import record_out_files, record_data_files, lookup_experiments, \
+                      lookup_data_files, get_data_file_rows, decode_test_id, \
+                      lookup_extracted
+from filemeta import read_meta_file, get_file_meta, check_time_window
+from flowcache import append_flow_cache, lookup_flow_cache, lookup_flow_stats
 from sourcefilter import SourceFilter
+from jobpool import Job, FunctionJob, run_jobs
+from buildgraph import BuildGraph
+from pcapreader import PcapDemux, build_index, load_index
+from pcapconsumers import FlowStatsConsumer, PktSizeConsumer, AckSeqConsumer, \
+                          PcapWriterConsumer, IncastQueryConsumer, IncastResponseConsumer, \
+                          LineWriterConsumer
+from siftrreader import SiftrReader, SIFTR_PATCHED_COLUMNS
+from web10greader import Web10gReader, SAMPLE_KEY_COLUMNS
+from extractcache import ExtractCache
+from coldata import read_data_file, get_num_rows
+from seriesmerge import merge_files, merge_totals
 
 
 #############################################################################
@@ -260,6 +280,56 @@ def get_out_dir(fname, out_dir):
     return out_dir 
 
 
+## Get flows in tcpdump file. All TCP and UDP flows are discovered in one pass
+## over the file and cached together with per-flow statistics
+#  @param tcpdump_file tcpdump file name
+#  @param proto '' TCP and UDP flows, 'tcp' only TCP flows, 'udp' only UDP flows
+#  @return List of flows, format <src>,<src_port>,<dst>,<dst_port>,<proto>
+def get_flows(tcpdump_file, proto=''):
+
+    flows = lookup_flow_cache(tcpdump_file)
+    if flows == None:
+        index = load_index(tcpdump_file)
+        if index != None:
+            (flows, stats) = index.get_flows()
+            append_flow_cache(tcpdump_file, flows, stats)
+
+    if flows == None:
+        consumer = FlowStatsConsumer()
+        demux = PcapDemux()
+        demux.add_all(tcpdump_file, consumer)
+        demux.run()
+        (flows, stats) = consumer.get_flows()
+
+        append_flow_cache(tcpdump_file, flows, stats)
+
+    if proto != '':
+        flows = [ flow for flow in flows if flow.endswith(',' + proto) ]
+
+    return flows
+
+
+## Check if tcpdump file has packets for one direction of a flow, based on the 
+## cached flow statistics
+#  @param tcpdump_file tcpdump file name
+#  @param src Source address
+#  @param src_port Source port
+#  @param dst Destination address
+#  @param dst_port Destination port
+#  @return False if there are no packets, True if there are packets or we don't know
+def flow_has_packets(tcpdump_file, src, src_port, dst, dst_port):
+
+    if lookup_flow_cache(tcpdump_file) == None and os.path.isfile(tcpdump_file):
+        get_flows(tcpdump_file)
+
+    stats = lookup_flow_stats(tcpdump_file)
+    if stats == None:
+        return True
+
+    flow = src + ',' + src_port + ',' + dst + ',' + dst_port
+    return (flow + ',tcp') in stats or (flow + ',udp') in stats
+
+
 #############################################################################
 # Plot functions
 #############################################################################
@@ -296,11 +366,15 @@ def get_out_dir(fname, out_dir):
 #  @param plot_script Specify the script used for plotting, must specify full path
 #                     (default is config.TPCONF_script_path/plot_time_series.R)
 #  @param source_filter Source filter
+#  @param diff '0' plot values as they are (default)
+#              '1' plot differences between consecutive values (for cumulative
+#                  values)
 def plot_time_series(title='', files={}, ylab='', yindex=2, yscaler=1.0, otype='',
                      oprefix='', pdf_dir='', sep=' ', aggr='', omit_const='0',
                      ymin=0, ymax=0, lnames='',
                      stime='0.0', etime='0.0', groups={}, sort_flowkey='1',
-                     boxplot='', plot_params='', plot_script='', source_filter=''):
+                     boxplot='', plot_params='', plot_script='', source_filter='',
+                     diff='0'):
 
     file_names = []
     leg_names = []
@@ -341,6 +415,39 @@ def plot_time_series(title='', files={}, ylab='', yindex=2, yscaler=1.0, otype='
         # if pdf_dir specified create if it doesn't exist
         mkdir_p(pdf_dir)
 
+    check_time_window(file_names, float(stime), float(etime), per_file=False)
+
+    # aggregate data here and only pass the aggregated data to the plot script
+    # (our own plot script only, other scripts may aggregate differently)
+    norm_time = '1'
+    aggr_params = get_aggr_params(plot_params)
+    if aggr != '' and aggr != '0' and plot_script == '' and \
+       aggr_params is not None and aggregation_enabled():
+        aggr_files = aggregate_files(file_names, _groups, yindex, yscaler, sep,
+                                     aggr, diff, omit_const, aggr_params[0],
+                                     aggr_params[1])
+
+        # remove omitted data series
+        keep = [ i for i in range(len(aggr_files)) if aggr_files[i] is not None ]
+        if len(keep) == 0:
+            abort('No data to plot after aggregation')
+        file_names = [ aggr_files[i] for i in keep ]
+        if len(leg_names) == len(aggr_files):
+            leg_names = [ leg_names[i] for i in keep ]
+        _groups = [ _groups[i] for i in keep ]
+
+        # aggregated files have timestamps relative to the experiment start
+        # and the scaled values in the second column
+        (yindex, yscaler, sep, aggr, diff, omit_const) = (2, 1.0, ' ', '', '0', '0')
+        norm_time = '0'
+
+    # thin out points here, so the plot script does not have to load all points
+    if aggr == '' and plot_script == '' and pthin_enabled(plot_params):
+        file_names = thin_files(file_names, yindex, yscaler, sep, plot_params,
+                                float(stime), float(etime), float(ymin), float(ymax))
+        (yindex, sep) = (2, ' ')
+        plot_params += ' PTHIN_DIST=0 PTHIN_DIST_FAC=0'
+
     if plot_script == '':
         plot_script = 'R CMD BATCH --vanilla %s/plot_time_series.R' % \
                       config.TPCONF_script_path
@@ -387,16 +494,19 @@ def plot_time_series(title='', files={}, ylab='', yindex=2, yscaler=1.0, otype='
     # BOXPL:  '0' plot each point on time axis
     #         '1' plot a boxplot over all data points from all data seres for each 
     #         distinct timestamp (instead of a point for each a data series) 
+    # DIFF:   '1' plot differences between consecutive values
+    # NORM_TIME: '1' make timestamps relative to the start of the experiment
+    #            '0' timestamps are relative already (aggregated data)
 
     #local('which R')
-    local('TITLE="%s" FNAMES="%s" LNAMES="%s" YLAB="%s" YINDEX="%d" YSCALER="%f" '
+    run_plot_script('TITLE="%s" FNAMES="%s" LNAMES="%s" YLAB="%s" YINDEX="%d" YSCALER="%f" '
           'SEP="%s" OTYPE="%s" OPREFIX="%s" ODIR="%s" AGGR="%s" OMIT_CONST="%s" '
-          'YMIN="%s" YMAX="%s" STIME="%s" ETIME="%s" GROUPS="%s" BOXPL="%s" %s '
-          '%s %s%s_plot_time_series.Rout' %
+          'YMIN="%s" YMAX="%s" STIME="%s" ETIME="%s" GROUPS="%s" BOXPL="%s" '
+          'DIFF="%s" NORM_TIME="%s" %s' %
           (title, ','.join(file_names), ','.join(leg_names), ylab, yindex, yscaler,
            sep, otype, oprefix, pdf_dir, aggr, omit_const, ymin, ymax, stime, etime,
-           ','.join(map(str, _groups)), boxplot, plot_params,
-           plot_script, pdf_dir, oprefix))
+           ','.join(map(str, _groups)), boxplot, diff, norm_time, plot_params),
+          plot_script, '%s%s_plot_time_series.Rout' % (pdf_dir, oprefix))
 
     if config.TPCONF_debug_level == 0:
 	local('rm -f %s%s_plot_time_series.Rout' % (pdf_dir, oprefix))
@@ -487,12 +597,11 @@ def plot_dash_goodput(title='', files={}, groups={}, ylab='', otype='', oprefix=
     #         experiment a determined from the data
 
     #local('which R')
-    local('TITLE="%s" FNAMES="%s" LNAMES="%s" YLAB="%s" SEP="%s" OTYPE="%s" '
-          'OPREFIX="%s" ODIR="%s" YMIN="%s" YMAX="%s" STIME="%s" ETIME="%s" %s '
-          '%s %s%s_plot_dash_goodput.Rout' %
+    run_plot_script('TITLE="%s" FNAMES="%s" LNAMES="%s" YLAB="%s" SEP="%s" OTYPE="%s" '
+          'OPREFIX="%s" ODIR="%s" YMIN="%s" YMAX="%s" STIME="%s" ETIME="%s" %s' %
           (title, ','.join(file_names), ','.join(leg_names), ylab, sep, otype, oprefix,
-           pdf_dir, ymin, ymax, stime, etime, plot_params, plot_script, 
-           pdf_dir, oprefix))
+           pdf_dir, ymin, ymax, stime, etime, plot_params),
+          plot_script, '%s%s_plot_dash_goodput.Rout' % (pdf_dir, oprefix))
 
     if config.TPCONF_debug_level == 0:
         local('rm -f %s%s_plot_dash_goodput.Rout' % (pdf_dir, oprefix))
@@ -605,19 +714,26 @@ def plot_incast_ACK_series(title='', files={}, ylab='', yindex=2, yscaler=1.0, o
         # if pdf_dir specified create if it doesn't exist
         mkdir_p(pdf_dir)
 
+    # thin out points here, so the plot script does not have to load all points
+    if aggr == '' and plot_script == '' and pthin_enabled(plot_params):
+        file_names = thin_files(file_names, yindex, yscaler, sep, plot_params,
+                                float(stime), float(etime), float(ymin), float(ymax))
+        (yindex, sep) = (2, ' ')
+        plot_params += ' PTHIN_DIST=0 PTHIN_DIST_FAC=0'
+
     if plot_script == '':
         plot_script = 'R CMD BATCH --vanilla %s/plot_bursts.R' % \
                        config.TPCONF_script_path
 
     #local('which R')
-    local('TITLE="%s" FNAMES="%s" LNAMES="%s" YLAB="%s" YINDEX="%d" YSCALER="%f" '
+    run_plot_script('TITLE="%s" FNAMES="%s" LNAMES="%s" YLAB="%s" YINDEX="%d" YSCALER="%f" '
           'SEP="%s" OTYPE="%s" OPREFIX="%s" ODIR="%s" AGGR="%s" OMIT_CONST="%s" '
           'YMIN="%s" YMAX="%s" STIME="%s" ETIME="%s" GROUPS="%s" %s '
-          'BURST_SEP=1 '
-          '%s %s%s_plot_bursts.Rout' %
+          'BURST_SEP=1' %
           (title, ','.join(file_names), ','.join(leg_names), ylab, yindex, yscaler,
            sep, otype, oprefix, pdf_dir, aggr, omit_const, ymin, ymax, stime, etime,
-           ','.join(map(str, _groups)), plot_params, plot_script, pdf_dir, oprefix))
+           ','.join(map(str, _groups)), plot_params),
+          plot_script, '%s%s_plot_bursts.Rout' % (pdf_dir, oprefix))
 
     if config.TPCONF_debug_level == 0:
         local('rm -f %s%s_plot_bursts.Rout' % (pdf_dir, oprefix))
@@ -655,6 +771,14 @@ def enough_rows(fname='', min_values='3'):
 
     #rows = int(local('wc -l %s | awk \'{ print $1 }\'' %
     #               fname, capture=True))
+    rows = get_num_rows(fname)
+    if rows >= 0:
+        return rows > min_values
+
+    meta = read_meta_file(fname)
+    if meta is not None:
+        return meta.rows > min_values
+
     rows = 0
     with open(fname, 'r') as f:
         while f.readline():
@@ -699,109 +823,188 @@ def filter_min_values(files={}, groups={}, min_values='3'):
     return (out_files, out_groups)
 
 
-## Extract data per incast burst
+## Extension of file that lists the burst files of a data file
+BURST_LIST_FILE_EXT = '.bursts'
+
+
+## Get burst files previously extracted from data file
+#  @param cache Extraction cache
 #  @param data_file File with data
-#  @param burst_sep Time between bursts (0.0 means no burst separation)
-#  @param normalize 0: leave metric values as they are (default)
-#                  1: normalise metric values on first value or first value
-#                     fo each burst (if burst_sep > 0.0)        
-#  @return List of file names (one file per burst)
-def extract_bursts(data_file='', burst_sep=0.0, normalize=0):
+#  @param params Tuple of burst extraction parameters
+#  @return List of burst file names, or None if bursts must be extracted
+def get_burst_files(cache, data_file, params):
+    list_file = data_file + BURST_LIST_FILE_EXT
+    if not cache.need_update([ list_file ], [ data_file ], params):
+        with open(list_file) as f:
+            burst_files = f.read().split()
+        if len([ fname for fname in burst_files if not os.path.isfile(fname) ]) == 0:
+            return burst_files
 
-    # New filenames (source file + ".0" or ".1,.2,....N" for bursts)
-    new_fnames = [];
+        # burst file was removed
+        cache.need_update([ list_file ], [ data_file ], params, True)
 
-    # Internal variables
-    burstN = 1
-    firstTS = -1
-    prev_data = -1 
+    return None
 
-    try:
-        lines = []
-        # First read the entire contents of a data file
-        with open(data_file) as f:
-            lines = f.readlines()
 
-            if burst_sep != 0 :
-                # Create the first .N output file
-                out_f = open(data_file + "." + "1", "w")
-                new_fnames.append(data_file + "." + "1")
-            else:
-                out_f = open(data_file + "." + "0", "w")
-                new_fnames.append(data_file + "." + "0")
-
-            # Now walk through every line of the data file
-            for oneline in lines:
-                # fields[0] is the timestamp, fields[1] is the statistic 
-                fields = oneline.split()
-
-                if firstTS == -1 :
-                    # This is first time through the loop, so set some baseline
-                    # values for later offsets
-                    firstTS = fields[0]
-                    prevTS = firstTS
-                    if normalize == 1:
-                        first_data = fields[1] 
-                    else:
-                        first_data = '0.0' 
+## Record burst files extracted from data file
+#  @param cache Extraction cache
+#  @param data_file File with data
+#  @param burst_files List of burst file names
+def put_burst_files(cache, data_file, burst_files):
+    with open(data_file + BURST_LIST_FILE_EXT, 'w') as f:
+        f.write('\n'.join(burst_files) + '\n')
+    cache.commit()
 
-                # If burst_sep == 0 the only thing we're calculating is a
-                # cumulative running total, so we only do burst
-                # identification if burst_sep != 0
 
-                if burst_sep != 0 :
+## Find bursts in a time series. A new burst starts when the time since the
+## previous data point (burst_sep > 0) or since the first data point of the
+## current burst (burst_sep < 0) is at least abs(burst_sep)
+#  @param times Timestamps
+#  @param burst_sep Time between bursts (0.0 means no burst separation)
+#  @return List of indices of the first data point of each burst
+def find_burst_starts(times, burst_sep):
+    if burst_sep == 0 or len(times) == 0:
+        return [ 0 ]
+
+    if burst_sep > 0:
+        return [ 0 ] + [ i for i in xrange(1, len(times))
+                         if times[i] - times[i - 1] >= burst_sep ]
+
+    starts = [ 0 ]
+    first = times[0]
+    for i in xrange(1, len(times)):
+        if times[i] - first >= -burst_sep:
+            starts.append(i)
+            first = times[i]
+
+    return starts
+
+
+## Get range of bursts to extract
+#  @param num_bursts Number of bursts
+#  @param sburst First burst (bursts are numbered from 1)
+#  @param eburst Last burst (0 means last burst)
+#  @return Pair of first and last burst number
+def get_burst_range(num_bursts, sburst=1, eburst=0):
+    sburst = int(sburst)
+    eburst = int(eburst)
 
-                    if burst_sep < 0 :
-                        # gap is time since first statistic of this burst
-                        # (i.e. relative to firstTS)
-                        gap = float(fields[0]) - float(firstTS)
-                    else:
-                        gap = float(fields[0]) - float(prevTS)
+    if eburst == 0:
+        eburst = num_bursts
+    # catch case when eburst was set non-zero but also > number of actual bursts
+    eburst = min(eburst, num_bursts)
+    if sburst <= 0:
+        sburst = 1
+    # catch case where sburst set greater than eburst
+    if sburst > eburst:
+        sburst = eburst
 
+    return (sburst, eburst)
 
-                    # New burst begins when time between this statistic and previous
-                    # exceeds abs(burst_sep)
-                    if (gap >= abs(burst_sep)) :
-                        # We've found the first one of the _next_ burst
 
-                        # Close previous burst output file
-                        out_f.close()
+## Make link_name a symbolic link to data_file (in the same directory)
+#  @param data_file Data file name
+#  @param link_name Name of link
+#  @return True if link was created, False otherwise
+def link_data_file(data_file, link_name):
+    try:
+        if os.path.lexists(link_name):
+            os.remove(link_name)
+        os.symlink(os.path.basename(data_file), link_name)
+    except (OSError, AttributeError):
+        return False
+
+    return True
+
+
+## Extract data per incast burst. Burst files are only written for the bursts
+## in the range sburst..eburst.
+#  @param data_file File with data
+#  @param burst_sep Time between bursts (0.0 means no burst separation)
+#  @param normalize 0: leave metric values as they are (default)
+#                  1: normalise metric values on first value or first value
+#                     fo each burst (if burst_sep > 0.0)        
+#  @param sburst First burst to extract (bursts are numbered from 1)
+#  @param eburst Last burst to extract (0 means last burst)
+#  @return List of file names (one file per extracted burst)
+def extract_bursts(data_file='', burst_sep=0.0, normalize=0, sburst=1, eburst=0):
 
-                        # Move on to the next burst
-                        burstN += 1
+    # New filenames (source file + ".0" or ".1,.2,....N" for bursts)
+    new_fnames = []
 
-                        print ("Burst: %3i, ends at %f sec, data: %f bytes, gap: %3.6f sec" %
-                        ( (burstN - 1),  float(prevTS), float(prev_data) - float(first_data), gap ) )
+    # nothing to do if the bursts were already extracted from the current
+    # data file with the same parameters
+    cache = ExtractCache('extract_bursts')
+    params = (burst_sep, normalize, int(sburst), int(eburst))
+    burst_files = get_burst_files(cache, data_file, params)
+    if burst_files is not None:
+        return burst_files
 
-                        # Reset firstTS to the beginning (first timestamp) of this new burst
-                        firstTS = fields[0]
+    try:
+        # read the data (from the column file if there is an up-to-date one)
+        data = read_data_file(data_file)
+        # column 0 is the timestamp, column 1 is the statistic
+        times = data.get_values(0)
+        values = data.get_values(1)
+        num_columns = data.num_columns()
+        data.close()
+
+        # without burst separation and normalisation the output has the same
+        # data as a data file with two columns, so just link to the data file
+        if burst_sep == 0 and normalize == 0 and num_columns == 2 and \
+           link_data_file(data_file, data_file + '.0'):
+            new_fnames.append(data_file + '.0')
+            put_burst_files(cache, data_file, new_fnames)
+            return new_fnames
+
+        starts = find_burst_starts(times, burst_sep)
+        (sburst, eburst) = get_burst_range(len(starts), sburst, eburst)
 
-                        # first data value of next burst must be considered relative to the last 
-                        # data value of the previous burst if we normalize 
-                        if normalize == 1:
-                            first_data = prev_data
+        with open(data_file) as f:
+            # the timestamps are written as they are in the data file
+            stamps = ( line.split(None, 1)[0] for line in f if line.strip() != '' )
+            pos = 0
+
+            for burstN in range(sburst, eburst + 1):
+                first = starts[burstN - 1]
+                if burstN < len(starts):
+                    last = starts[burstN]
+                else:
+                    last = len(times)
 
-                        # Create the next .N output file
-                        out_f = open(data_file + "." + str(burstN), "w")
-                        new_fnames.append(data_file + "." + str(burstN))
+                # values of bursts 2...N are relative to the last value of the
+                # previous burst if we normalize
+                if normalize == 1 and len(values) > 0:
+                    first_data = values[max(first - 1, 0)]
+                else:
+                    first_data = 0.0
 
+                if burst_sep != 0:
+                    fname = data_file + '.' + str(burstN)
+                else:
+                    fname = data_file + '.0'
+                if os.path.islink(fname):
+                    os.remove(fname)
 
-                # data value (potentially normalised based on first value / first value of burst
-                data_gap = float(fields[1]) - float(first_data)
+                # skip data points of bursts not extracted
+                for i in xrange(pos, first):
+                    next(stamps)
 
-                # Write to burst-specific output file
-                # <time>  <data>
-                out_f.write(fields[0] + " " + str(data_gap) + "\n")
+                # <time> <data>
+                with open(fname, 'w') as out_f:
+                    for i in xrange(first, last):
+                        out_f.write('%s %s\n' % (next(stamps), values[i] - first_data))
+                new_fnames.append(fname)
+                pos = last
 
-                # Store the seq number for next time around the loop
-                prev_data = fields[1]
-                prevTS = fields[0]
+        if burst_sep != 0:
+            puts('Extracted bursts %i-%i of %i from %s' %
+                 (sburst, eburst, len(starts), data_file))
 
-            # Close the last output file
-            out_f.close()
+        put_burst_files(cache, data_file, new_fnames)
 
-    except IOError:
-        print('extract_ursts(): File access problem while working on %s' % data_file)
+    except (IOError, OSError):
+        print('extract_bursts(): File access problem while working on %s' % data_file)
 
     return new_fnames
 
@@ -827,7 +1030,9 @@ def select_bursts(name='', group='', data_file='', burst_sep='0.0', sburst='1',
     # return a new vector of one or more filenames, pointing to file(s) containing
     # <time> <statistic> 
     #
-    out_burst_files = extract_bursts(data_file = data_file, burst_sep = burst_sep)
+    # only the bursts in the range sburst..eburst nominated by user are extracted
+    out_burst_files = extract_bursts(data_file = data_file, burst_sep = burst_sep,
+                                     sburst = sburst, eburst = eburst)
     # Incorporate the extracted .N files
     # as a new, expanded set of filenames to be plotted.
     # Update the out_files dictionary (key=interim legend name based on flow, value=file)
@@ -843,25 +1048,15 @@ def select_bursts(name='', group='', data_file='', burst_sep='0.0', sburst='1',
         # This trial has been broken into one or more bursts.
         # plot_incast_ACK_series() knows how to parse a key having a
         # 'vector of strings' value.
-        # Also filter the selection based on sburst/eburst nominated by user
-        if eburst == 0 :
-            eburst = len(out_burst_files)
-        # Catch case when eburst was set non-zero but also > number of actual bursts
-        eburst = min(eburst,len(out_burst_files))
-        if sburst <= 0 :
-            sburst = 1
-        # Catch case where sburst set greater than eburst
-        if sburst > eburst :
-            sburst = eburst
-
-        out_files[name] = out_burst_files[sburst-1:eburst]
-        for tmp_f in out_burst_files[sburst-1:eburst] :
+        out_files[name] = out_burst_files
+        for tmp_f in out_burst_files:
             out_groups[tmp_f] = group
 
     return (out_files, out_groups)
 
 
-## Merge several data files into one data file 
+## Merge several data files into one data file sorted by time (the data files
+## must be sorted by time)
 #  @param in_files List of file names
 #  @return List with merged file name 
 def merge_data_files(in_files):
@@ -873,14 +1068,7 @@ def merge_data_files(in_files):
     merge_fname += '.all'
     #print(merge_fname)
 
-    f_out = open(merge_fname, 'w')
-
-    for fname in sorted(in_files):
-        with open(fname) as f:
-            lines = f.readlines()
-        f_out.writelines(lines)
-
-    f_out.close()
+    merge_files(sorted(in_files), merge_fname)
 
     return [merge_fname]
 
@@ -927,11 +1115,7 @@ def get_address_pair_analysis(test_id, host, do_abort='1'):
     global host_list_cache
     internal = ''
     external = ''
-    TMP_CONF_FILE = '___oldconfig.py'
 
-    # XXX the whole old config access should be moved into separate module as 
-    # similar code is also in clockoffset
-   
     # prior to TEACUP version 0.9 it was required to run the analysis with a config
     # file that had config.TPCONF_host_internal_ip as it was used to run the experiment
     # (or a superset of it). Since version 0.9 we use config.TPCONF_host_internal_ip
@@ -951,32 +1135,16 @@ def get_address_pair_analysis(test_id, host, do_abort='1'):
                 host_list_cache[test_id] = host_list_cache[dir_name] 
         else:
             # try to find old config information
+            oldconfig = get_old_config(dir_name)
 
-            # look for tpconf_vars.log.gz file in that directory 
-            var_file = local('find -L %s -name "*tpconf_vars.log.gz"' % dir_name,
-                             capture=True)
-
-            if len(var_file) > 0:
+            if oldconfig is not None:
                 # new approach without using config.py
 
-                # unzip archived file
-                local('gzip -cd %s > %s' % (var_file, TMP_CONF_FILE))
-
-                # load the TPCONF_variables into oldconfig
-                oldconfig = imp.load_source('oldconfig', TMP_CONF_FILE)
-
-                # remove temporary unzipped file 
-                try:
-                    os.remove(TMP_CONF_FILE)
-                    os.remove(TMP_CONF_FILE + 'c') # remove the compiled file as well
-                except OSError:
-                    pass
-
                 # store data in cache (both under test id and directory name)
-                host_internal_ip_cache[test_id] = oldconfig.TPCONF_host_internal_ip
-                host_list_cache[test_id] = oldconfig.TPCONF_hosts + oldconfig.TPCONF_router
-                host_internal_ip_cache[dir_name] = oldconfig.TPCONF_host_internal_ip
-                host_list_cache[dir_name] = oldconfig.TPCONF_hosts + oldconfig.TPCONF_router
+                host_internal_ip_cache[test_id] = oldconfig['TPCONF_host_internal_ip']
+                host_list_cache[test_id] = oldconfig['TPCONF_hosts'] + oldconfig['TPCONF_router']
+                host_internal_ip_cache[dir_name] = oldconfig['TPCONF_host_internal_ip']
+                host_list_cache[dir_name] = oldconfig['TPCONF_hosts'] + oldconfig['TPCONF_router']
             else:
                 # old approach using the functions in hostint.py that access config.py
                 # store empty value in cache (both under test id and directory name)
@@ -1059,6 +1227,8 @@ def _extract_dash_goodput(test_id='', out_dir='', replot_only='0', dash_log_list
     dash_files = get_testid_file_list(dash_log_list, test_id,
 				      ifile_ext, '') 
 
+    cache = ExtractCache('extract_dash_goodput', replot_only)
+
     for dash_file in dash_files:
         # set and create result directory if necessary
         out_dirname = get_out_dir(dash_file, out_dir)
@@ -1072,12 +1242,13 @@ def _extract_dash_goodput(test_id='', out_dir='', replot_only='0', dash_log_list
         #(requires modified httperf output)
         # the sed here parses the nominal cycle length, nominal rate in kbps
         # and block number from the file name
-        if replot_only == '0' or not os.path.isfile(out):
+        if cache.need_update([ out ], [ dash_file ]):
             local(
                 'zcat %s | grep video_files | grep -v NA | '
                 'awk \'{ print $1 "," $5 "," $7 "," $10 "," $14 }\' | '
                 'sed "s/\/video_files-\([0-9]*\)-\([0-9]*\)\/\([0-9]*\)/\\1,\\2,\\3/" > %s' %
                 (dash_file, out))
+            cache.commit()
 
         host = local(
             'echo %s | sed "s/.*_\([a-z0-9\.]*\)_[0-9]*%s/\\1/"' %
@@ -1101,6 +1272,8 @@ def _extract_dash_goodput(test_id='', out_dir='', replot_only='0', dash_log_list
         out_files[name] = out
         out_groups[out] = group
 
+    record_out_files(out_files)
+
     return (test_id_arr, out_files, out_groups)
 
 
@@ -1236,6 +1409,8 @@ def _extract_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
             udp_reverse_map[k] = v
             udp_reverse_map[v] = k
 
+    cache = ExtractCache('extract_rtt', replot_only)
+
     group = 1
     for test_id in test_id_arr:
 
@@ -1244,28 +1419,20 @@ def _extract_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
                                 ifile_ext, 
                                 'grep -v "router.dmp.gz" | grep -v "ctl.dmp.gz"')
 
+        # the filtered tcpdumps for all flows are written in one pass over each
+        # tcpdump file, then spp is run for each flow
+        demux = PcapDemux()
+        spp_runs = []
+        extracted = []
+        pending = {}
+
         for tcpdump_file in tcpdump_files:
             # get input directory name and create result directory if necessary
             out_dirname = get_out_dir(tcpdump_file, out_dir) 
             dir_name = os.path.dirname(tcpdump_file)
 
             # get unique flows
-            flows = lookup_flow_cache(tcpdump_file)
-            if flows == None:
-                flows = _list(local('zcat %s | tcpdump -nr - "tcp" | '
-                                'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " tcp" } }\' | '
-                                'sed "s/://" | '
-                                'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                'LC_ALL=C sort -u' %
-                                tcpdump_file, capture=True))
-                flows += _list(local('zcat %s | tcpdump -nr - "udp" | '
-                                 'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " udp" } }\' | '
-                                 'sed "s/://" | '
-                                 'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                 'LC_ALL=C sort -u' %
-                                 tcpdump_file, capture=True))
-
-                append_flow_cache(tcpdump_file, flows)
+            flows = get_flows(tcpdump_file)
 
             # since client sends first packet to server, client-to-server flows
             # will always be first
@@ -1307,10 +1474,12 @@ def _extract_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
                     else:
                         pid_fields = 511
 
+                    # the filtered tcpdumps contain the same packets as 
+                    # the tcpdump filters
+                    # tcp: (src host <src> && src port <sport>) || (dst host <src> && dst port <sport>)
+                    # udp: (src host <src> && src port <sport>) || (src host <src2> && src port <sport2>)
                     if proto == 'tcp':
-                        filter1 = '(src host ' + src_internal + ' && src port ' + src_port + \
-                                  ') || (' + \
-                                  'dst host ' + src_internal + ' && dst port ' + src_port + ')'
+                        filter1 = [ ('src', src_internal, src_port), ('dst', src_internal, src_port) ]
                         filter2 = filter1 
                     else:
                         entry = udp_reverse_map.get(
@@ -1321,11 +1490,9 @@ def _extract_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
                                 '_' + src2_internal + '_' + src2_port
                             rev_name = src2_internal + '_' + src2_port + \
                                 '_' + src_internal + '_' + src_port
-                            filter1 = '(src host ' + src_internal + ' && src port ' + src_port + \
-                                ') || ( ' + \
-                                'src host ' + src2_internal + ' && src port ' + src2_port + ')'
+                            filter1 = [ ('src', src_internal, src_port), ('src', src2_internal, src2_port) ]
                             filter2 = filter1 
-                            if rev_name in out_files:
+                            if rev_name in out_files or rev_name in pending:
                                 continue
                         else:
                             warn('No entry in udp_map for %s:%s' % (src_internal, src_port)) 
@@ -1338,54 +1505,70 @@ def _extract_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
                     out_rtt = out_dirname + test_id + '_' + name + ofile_ext 
                     rev_out_rtt = out_dirname + test_id + '_' + rev_name + ofile_ext 
 
-                    if replot_only == '0' or not ( os.path.isfile(out_rtt) and \
-                                                   os.path.isfile(rev_out_rtt) ): 
+                    if cache.need_update([ out_rtt, rev_out_rtt ], [ dump1, dump2 ]):
                         # create filtered tcpdumps
-                        local(
-                            'zcat %s | tcpdump -nr - -w %s "%s"' %
-                            (dump1, out1, filter1))
-                        local(
-                            'zcat %s | tcpdump -nr - -w %s "%s"' %
-                            (dump2, out2, filter2))
-
-                        # compute rtts with spp
-                        local(
-                            'spp -# %s -a %s -f %s -A %s -F %s > %s' %
-                            (pid_fields, src_internal, out1, dst_internal, out2, out_rtt))
-                        local(
-                            'spp -# %s -a %s -f %s -A %s -F %s > %s' %
-                            (pid_fields,
-                             dst_internal,
-                             out2,
-                             src_internal,
-                             out1,
-                             rev_out_rtt))
+                        demux.add_endpoints(dump1, filter1, PcapWriterConsumer(out1))
+                        demux.add_endpoints(dump2, filter2, PcapWriterConsumer(out2))
 
-                        # remove filtered tcpdumps
-                        local('rm -f %s %s' % (out1, out2))
+                        spp_runs.append((pid_fields, src_internal, dst_internal, out1, 
+                                         out2, out_rtt, rev_out_rtt))
 
                     already_done[long_name] = 1
                     already_done[long_rev_name] = 1
 
                     if sfil.is_in(name):
-                        if ts_correct == '1':
-                            out_rtt = adjust_timestamps(test_id, out_rtt, src, ' ', out_dir)
+                        pending[long_name] = 1
+                    if sfil.is_in(rev_name):
+                        pending[long_rev_name] = 1
 
-                        (out_files, 
-                         out_groups) = select_bursts(long_name, group, out_rtt, burst_sep, sburst, eburst,
-                                      out_files, out_groups)
+                    extracted.append((name, long_name, out_rtt, src, 
+                                      rev_name, long_rev_name, rev_out_rtt, dst))
 
-                    if sfil.is_in(rev_name):
-                        if ts_correct == '1':
-                            rev_out_rtt = adjust_timestamps(test_id, rev_out_rtt, dst, ' ',
-                                          out_dir)
+        demux.run()
 
-                        (out_files, 
-                         out_groups) = select_bursts(long_rev_name, group, rev_out_rtt, burst_sep, sburst, 
-                                      eburst, out_files, out_groups)
+        for (pid_fields, src_internal, dst_internal, out1, out2, out_rtt, 
+             rev_out_rtt) in spp_runs:
+            # compute rtts with spp
+            local(
+                'spp -# %s -a %s -f %s -A %s -F %s > %s' %
+                (pid_fields, src_internal, out1, dst_internal, out2, out_rtt))
+            local(
+                'spp -# %s -a %s -f %s -A %s -F %s > %s' %
+                (pid_fields,
+                 dst_internal,
+                 out2,
+                 src_internal,
+                 out1,
+                 rev_out_rtt))
+
+            # remove filtered tcpdumps
+            local('rm -f %s %s' % (out1, out2))
+
+        cache.commit()
+
+        for (name, long_name, out_rtt, src, rev_name, long_rev_name, rev_out_rtt, 
+             dst) in extracted:
+            if sfil.is_in(name):
+                if ts_correct == '1':
+                    out_rtt = adjust_timestamps(test_id, out_rtt, src, ' ', out_dir)
+
+                (out_files, 
+                 out_groups) = select_bursts(long_name, group, out_rtt, burst_sep, sburst, eburst,
+                              out_files, out_groups)
+
+            if sfil.is_in(rev_name):
+                if ts_correct == '1':
+                    rev_out_rtt = adjust_timestamps(test_id, rev_out_rtt, dst, ' ',
+                                  out_dir)
+
+                (out_files, 
+                 out_groups) = select_bursts(long_rev_name, group, rev_out_rtt, burst_sep, sburst, 
+                              eburst, out_files, out_groups)
 
         group += 1
 
+    record_out_files(out_files, source_filter)
+
     return (test_id_arr, out_files, out_groups)
 
 
@@ -1475,41 +1658,93 @@ def analyse_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
     puts('\n[MAIN] COMPLETED plotting RTTs %s \n' % out_name)
 
 
-## Extract data from siftr files
+## Get output files for a flow in a siftr or web10g log file and create writers
+## for the output files that need to be extracted
+#  @param test_id Test ID
+#  @param flow Flow <src>,<src_port>,<dst>,<dst_port>
+#  @param out_prefix Prefix of output file names (<out_dir><test_id>_)
+#  @param log_type 'siftr' or 'web10g'
+#  @param log_file Log file name
+#  @param outputs List of (attributes, out_file_ext, post_proc) tuples
+#  @param params Tuple of extractor parameters used for all outputs
+#  @param cache Extraction cache 
+#  @return None if the flow is not part of the experiment, otherwise pair of
+#          list of output file names and list of writers (None if file is not
+#          extracted)
+def get_log_flow_outputs(test_id, flow, out_prefix, log_type, log_file, outputs,
+                         params, cache):
+
+    src, src_port, dst, dst_port = flow.split(',')
+
+    # get external and internal addresses
+    src, src_internal = get_address_pair_analysis(test_id, src, do_abort='0')
+    dst, dst_internal = get_address_pair_analysis(test_id, dst, do_abort='0')
+
+    if src == '' or dst == '':
+        return None
+
+    flow_name = flow.replace(',', '_')
+    outs = []
+    writers = []
+    for (attributes, out_file_ext, post_proc) in outputs:
+        out = out_prefix + flow_name + '_' + log_type + '.' + out_file_ext
+        outs.append(out)
+        if post_proc is not None:
+            post_proc = post_proc.__name__
+        if cache.need_update([ out ], [ log_file ], (attributes, post_proc) + params):
+            writer = LineWriterConsumer(out)
+            writer.start(None)
+            writers.append(writer)
+        else:
+            writers.append(None)
+
+    return (outs, writers)
+
+
+## Extract data from siftr files for several sets of attributes. Each siftr
+## file is read only once. 
 #  @param test_id Test ID prefix of experiment to analyse
 #  @param out_dir Output directory for results
 #  @param replot_only Don't extract data again, just redo the plot
 #  @param source_filter Filter on specific sources
-#  @param attributes Comma-separated list of attributes to extract from siftr file,
-#                    start index is 1
-#                    (refer to siftr documentation for column description)
-#  @param out_file_ext Extension for the output file containing the extracted data
-#  @param post_proc Name of function used for post-processing the extracted data
+#  @param outputs List of (attributes, out_file_ext, post_proc) tuples, where
+#                 attributes is a comma-separated list of attributes to extract from
+#                 siftr file, start index is 1 (refer to siftr documentation for 
+#                 column description), out_file_ext the extension for the output
+#                 file containing the extracted data, and post_proc the name of the
+#                 function used for post-processing the extracted data (or None)
 #  @param ts_correct '0' use timestamps as they are (default)
 #                    '1' correct timestamps based on clock offsets estimated
 #                        from broadcast pings
 #  @param io_filter  'i' only use statistics from incoming packets
 #                    'o' only use statistics from outgoing packets
 #                    'io' use statistics from incooming and outgoing packets
-#  @return Map of flow names to interim data file names and 
-#          map of file names and group IDs
-def extract_siftr(test_id='', out_dir='', replot_only='0', source_filter='',
-                  attributes='', out_file_ext='', post_proc=None, 
-                  ts_correct='1', io_filter='o'):
+#  @return List with one pair of map of flow names to interim data file names and 
+#          map of file names and group IDs per output
+def extract_siftr_multi(test_id='', out_dir='', replot_only='0', source_filter='',
+                        outputs=[], ts_correct='1', io_filter='o'):
 
-    out_files = {}
-    out_groups = {}
+    results = [ ({}, {}) for output in outputs ]
 
     if io_filter != 'i' and io_filter != 'o' and io_filter != 'io':
         abort('Invalid parameter value for io_filter')
-    if io_filter == 'io':
-        io_filter = '(i|o)'
 
     test_id_arr = test_id.split(';')
 
     # Initialise source filter data structure
     sfil = SourceFilter(source_filter)
 
+    # columns of each output, the same as selected by
+    # cut -d',' -f 3,4,5,6,7,<attributes> | cut -d',' -f 1,6-
+    # (note that cut always outputs columns in ascending order)
+    selections = []
+    for (attributes, out_file_ext, post_proc) in outputs:
+        cols = sorted(set([ 3, 4, 5, 6, 7 ] + 
+                          [ int(a) for a in attributes.split(',') ]))
+        selections.append([ cols[0] - 1 ] + [ c - 1 for c in cols[5:] ])
+
+    cache = ExtractCache('extract_siftr', replot_only)
+
     group = 1
     for test_id in test_id_arr:
 
@@ -1520,52 +1755,76 @@ def extract_siftr(test_id='', out_dir='', replot_only='0', source_filter='',
         for siftr_file in siftr_files:
             # get input directory name and create result directory if necessary
             out_dirname = get_out_dir(siftr_file, out_dir)
+            out_prefix = out_dirname + test_id + '_'
 
-            if replot_only == '0':
-                # check that file is complete, i.e. we have the disable line
-                with settings(warn_only=True):
-                    last_line = local(
-                        'zcat %s | tail -1 | grep disable_time_secs' %
-                        siftr_file,
-                        capture=True)
-                if last_line == '':
-                    abort('Incomplete siftr file %s' % siftr_file)
-
-                # check that we have patched siftr (27 columns)
-                cols = int(
-                    local(
-                        'zcat %s | head -2 | tail -1 | sed "s/,/ /g" | wc -w' %
-                        siftr_file,
-                        capture=True))
-                if cols < 27:
-                    abort('siftr needs to be patched to output ertt estimates')
-
-            # we need to stop reading before the log disable line
-            rows = str(int(
-                local('zcat %s | wc -l | awk \'{ print $1 }\'' %
-                      (siftr_file), capture=True)) - 3)
+            # map of flows to output files and writers, None for flows that are
+            # not part of the experiment
+            flow_outputs = {}
 
             # unique flows
             flows = lookup_flow_cache(siftr_file)
-            if flows == None:
-                flows = _list(
-                    local(
-                        'zcat %s | grep -v enable | head -%s | '
-                        'egrep "^%s" | '
-                        'cut -d\',\' -f 4,5,6,7 | LC_ALL=C sort -u' %
-                        (siftr_file, rows, io_filter), capture=True))
+            if flows != None:
+                for flow in flows:
+                    flow_outputs[flow] = get_log_flow_outputs(test_id, flow, 
+                        out_prefix, 'siftr', siftr_file, outputs, (io_filter, ), cache)
+
+            need_read = flows == None
+            for outs_writers in flow_outputs.values():
+                if outs_writers != None and outs_writers[1].count(None) < len(outputs):
+                    need_read = True
+
+            if need_read:
+                reader = SiftrReader(siftr_file)
+                checked = False
+                for fields in reader.rows(io_filter):
+                    if not checked and replot_only == '0':
+                        # check that we have patched siftr (27 columns)
+                        if reader.columns < SIFTR_PATCHED_COLUMNS:
+                            abort('siftr needs to be patched to output ertt estimates')
+                        checked = True
+
+                    flow = ','.join(fields[3:7])
+                    if flow not in flow_outputs:
+                        if flows != None:
+                            continue
+                        flow_outputs[flow] = get_log_flow_outputs(test_id, flow, 
+                            out_prefix, 'siftr', siftr_file, outputs, (io_filter, ), cache)
 
-                append_flow_cache(siftr_file, flows)
+                    outs_writers = flow_outputs[flow]
+                    if outs_writers == None:
+                        continue
 
-            for flow in flows:
+                    n = len(fields)
+                    for writer, selection in zip(outs_writers[1], selections):
+                        if writer != None:
+                            writer.write(','.join([ fields[i] for i in selection 
+                                                    if i < n ]) + '\n')
 
-                src, src_port, dst, dst_port = flow.split(',')
+                reader.close()
 
-                # get external and internal addresses
-                src, src_internal = get_address_pair_analysis(test_id, src, do_abort='0')
-                dst, dst_internal = get_address_pair_analysis(test_id, dst, do_abort='0')
+                # check that file is complete, i.e. we have the disable line
+                if replot_only == '0' and not reader.complete:
+                    abort('Incomplete siftr file %s' % siftr_file)
 
-                if src == '' or dst == '':
+                for outs_writers in flow_outputs.values():
+                    if outs_writers == None:
+                        continue
+                    for out, writer, output in zip(outs_writers[0], outs_writers[1],
+                                                   outputs):
+                        if writer != None:
+                            writer.finish()
+                            post_proc = output[2]
+                            if post_proc is not None:
+                                post_proc(siftr_file, out)
+
+                cache.commit()
+
+                if flows == None:
+                    flows = sorted(flow_outputs.keys())
+                    append_flow_cache(siftr_file, flows)
+
+            for flow in flows:
+                if flow_outputs[flow] == None:
                     continue
 
                 flow_name = flow.replace(',', '_')
@@ -1574,32 +1833,47 @@ def extract_siftr(test_id='', out_dir='', replot_only='0', source_filter='',
                     long_flow_name = test_id + '_' + flow_name
                 else:
                     long_flow_name = flow_name
-                out = out_dirname + test_id + '_' + flow_name + '_siftr.' + out_file_ext
-                if replot_only == '0' or not os.path.isfile(out) :
-                    local(
-                        'zcat %s | grep -v enable | head -%s | '
-                        'egrep "^%s" | '
-                        'cut -d\',\' -f 3,4,5,6,7,%s | '
-                        'grep "%s" | cut -d\',\' -f 1,6- > %s' %
-                        (siftr_file, rows, io_filter, attributes, flow, out))
-
-                    if post_proc is not None:
-                        post_proc(siftr_file, out)
 
                 if sfil.is_in(flow_name):
-                    if ts_correct == '1':
-                        host = local(
-                            'echo %s | sed "s/.*_\([a-z0-9\.]*\)_siftr.log.gz/\\1/"' %
-                            siftr_file,
-                            capture=True)
-                        out = adjust_timestamps(test_id, out, host, ',', out_dir)
+                    for out, result in zip(flow_outputs[flow][0], results):
+                        if ts_correct == '1':
+                            host = re.sub('.*_([a-z0-9\.]*)_siftr.log.gz', '\\1',
+                                          siftr_file, 1)
+                            out = adjust_timestamps(test_id, out, host, ',', out_dir)
 
-                    out_files[long_flow_name] = out
-                    out_groups[out] = group
+                        result[0][long_flow_name] = out
+                        result[1][out] = group
 
         group += 1
 
-    return (out_files, out_groups)
+    return results
+
+
+## Extract data from siftr files
+#  @param test_id Test ID prefix of experiment to analyse
+#  @param out_dir Output directory for results
+#  @param replot_only Don't extract data again, just redo the plot
+#  @param source_filter Filter on specific sources
+#  @param attributes Comma-separated list of attributes to extract from siftr file,
+#                    start index is 1
+#                    (refer to siftr documentation for column description)
+#  @param out_file_ext Extension for the output file containing the extracted data
+#  @param post_proc Name of function used for post-processing the extracted data
+#  @param ts_correct '0' use timestamps as they are (default)
+#                    '1' correct timestamps based on clock offsets estimated
+#                        from broadcast pings
+#  @param io_filter  'i' only use statistics from incoming packets
+#                    'o' only use statistics from outgoing packets
+#                    'io' use statistics from incooming and outgoing packets
+#  @return Map of flow names to interim data file names and 
+#          map of file names and group IDs
+def extract_siftr(test_id='', out_dir='', replot_only='0', source_filter='',
+                  attributes='', out_file_ext='', post_proc=None, 
+                  ts_correct='1', io_filter='o'):
+
+    return extract_siftr_multi(test_id, out_dir, replot_only, source_filter,
+                               [ (attributes, out_file_ext, post_proc) ],
+                               ts_correct, io_filter)[0]
 
 
 ## Guess web10g version (based on first file only!)
@@ -1614,47 +1888,49 @@ def guess_version_web10g(test_id=''):
     # if there are no web10g files the following will return '2.0.7', but in this
     # case we don't care anyway 
     try:
-        web10g_file = web10g_files[0]
-        colnum = local('zcat %s | sed -e "s/,/ /g" | head -1 | wc -w' % web10g_file,
-		capture=True)
-
-        if int(colnum) == 122:
-	    return '2.0.7'
-	elif int(colnum) == 128:
-	    return '2.0.9'
-	else:
-	    return '2.0.7'
+        # only reads the first line
+        reader = Web10gReader(web10g_files[0])
+        reader.close()
+        if reader.version == '2.0.9':
+            return '2.0.9'
+        else:
+            return '2.0.7'
     except:
         return '2.0.7'
 
 
-## Extract data from web10g files
+## Extract data from web10g files for several sets of attributes. Each web10g
+## file is read only once. 
 #  @param test_id Test ID prefix of experiment to analyse
 #  @param out_dir Output directory for results
 #  @param replot_only Don't extract data again, just redo the plot
 #  @param source_filter Filter on specific sources
-#  @param attributes Comma-separated list of attributes to extract from web10g file,
-#                    start index is 1
-#                    (refer to web10g documentation for column description)
-#  @param out_file_ext Extension for the output file containing the extracted data
-#  @param post_proc Name of function used for post-processing the extracted data
+#  @param outputs List of (attributes, out_file_ext, post_proc) tuples, where
+#                 attributes is a comma-separated list of attribute names or numbers
+#                 (start index is 1) to extract from web10g file (refer to web10g
+#                 documentation for column description), out_file_ext the
+#                 extension for the output file containing the extracted data,
+#                 and post_proc the name of the function used for post-processing
+#                 the extracted data (or None)
 #  @param ts_correct '0' use timestamps as they are (default)
 #                    '1' correct timestamps based on clock offsets estimated
 #                        from broadcast pings
-#  @return Map of flow names to interim data file names and 
-#          map of file names and group IDs
-def extract_web10g(test_id='', out_dir='', replot_only='0', source_filter='',
-                   attributes='', out_file_ext='', post_proc=None,
-                   ts_correct='1'):
+#  @return List with one pair of map of flow names to interim data file names and 
+#          map of file names and group IDs per output
+def extract_web10g_multi(test_id='', out_dir='', replot_only='0', source_filter='',
+                         outputs=[], ts_correct='1'):
 
-    out_files = {}
-    out_groups = {}
+    results = [ ({}, {}) for output in outputs ]
 
     test_id_arr = test_id.split(';')
 
     # Initialise source filter data structure
     sfil = SourceFilter(source_filter)
 
+    key_cols = [ c - 1 for c in SAMPLE_KEY_COLUMNS ]
+
+    cache = ExtractCache('extract_web10g', replot_only)
+
     group = 1
     for test_id in test_id_arr:
 
@@ -1665,41 +1941,98 @@ def extract_web10g(test_id='', out_dir='', replot_only='0', source_filter='',
         for web10g_file in web10g_files:
             # get input directory name and create result directory if necessary
             out_dirname = get_out_dir(web10g_file, out_dir)
+            out_prefix = out_dirname + test_id + '_'
 
-            # check for errors, unless we replot
-            # make sure we have exit status 0 for this, hence the final echo
-            if replot_only == '0':
-                errors = local(
-                    'zcat %s | grep -v "runbg_wrapper.sh" | grep -v "Timestamp" ' 
-                    'egrep "[a-z]+" ; echo -n ""' %
-                    web10g_file,
-                    capture=True)
-                if errors != '':
-                    warn('Errors in %s:\n%s' % (web10g_file, errors))
+            # map of flows to output files and writers, None for flows that are
+            # not part of the experiment
+            flow_outputs = {}
 
             # unique flows
-            # the sed command here suppresses the last line, cause that can be
-            # incomplete
             flows = lookup_flow_cache(web10g_file)
-            if flows == None:
-                flows = _list(
-                    local(
-                        'zcat %s | egrep -v "[a-z]+" | sed -n \'$!p\' | '
-                        'cut -d\',\' -f 3,4,5,6 | LC_ALL=C sort -u' %
-                        (web10g_file),
-                        capture=True))
-
-                append_flow_cache(web10g_file, flows)
+            if flows != None:
+                for flow in flows:
+                    flow_outputs[flow] = get_log_flow_outputs(test_id, flow, 
+                        out_prefix, 'web10g', web10g_file, outputs, (), cache)
+
+            # without cache we always read the file if we don't replot to check
+            # for errors
+            need_read = flows == None or (replot_only == '0' and not cache.enabled)
+            for outs_writers in flow_outputs.values():
+                if outs_writers != None and outs_writers[1].count(None) < len(outputs):
+                    need_read = True
+
+            if need_read:
+                reader = Web10gReader(web10g_file)
+
+                # columns of each output (in ascending order like cut outputs them)
+                selections = []
+                for output in outputs:
+                    cols = sorted(set([ reader.get_column(a) 
+                                        for a in output[0].split(',') ]))
+                    selections.append([ c - 1 for c in cols ])
+                min_len = max([ key_cols[-1] ] + 
+                              [ selection[-1] for selection in selections ]) + 1
+
+                # last sample key of each flow
+                last_keys = {}
+
+                for fields in reader.rows():
+                    if len(fields) < min_len:
+                        continue
+
+                    flow = ','.join(fields[2:6])
+                    if flow not in flow_outputs:
+                        if flows != None:
+                            continue
+                        flow_outputs[flow] = get_log_flow_outputs(test_id, flow, 
+                            out_prefix, 'web10g', web10g_file, outputs, (), cache)
+
+                    outs_writers = flow_outputs[flow]
+                    if outs_writers == None:
+                        continue
+
+                    # do not output samples if there is no change in the number
+                    # of segments sent or received. this makes the output
+                    # comparable to siftr where we only have output if data is
+                    # flying around
+                    key = [ fields[i] for i in key_cols ]
+                    if last_keys.get(flow) == key:
+                        continue
+                    last_keys[flow] = key
+
+                    for writer, selection in zip(outs_writers[1], selections):
+                        if writer != None:
+                            writer.write(fields[0] + ',' + 
+                                         ','.join([ fields[i] for i in selection ]) + '\n')
+
+                reader.close()
+
+                # check for errors, unless we replot
+                if replot_only == '0' and reader.num_errors > 0:
+                    warn('Errors in %s:\n%s' % (web10g_file, '\n'.join(reader.errors)))
+                    if reader.num_errors > len(reader.errors):
+                        warn('%i more errors not shown' % 
+                             (reader.num_errors - len(reader.errors)))
+
+                for outs_writers in flow_outputs.values():
+                    if outs_writers == None:
+                        continue
+                    for out, writer, output in zip(outs_writers[0], outs_writers[1],
+                                                   outputs):
+                        if writer != None:
+                            writer.finish()
+                            post_proc = output[2]
+                            if post_proc is not None:
+                                post_proc(web10g_file, out)
+
+                cache.commit()
+
+                if flows == None:
+                    flows = sorted(flow_outputs.keys())
+                    append_flow_cache(web10g_file, flows)
 
             for flow in flows:
-
-                src, src_port, dst, dst_port = flow.split(',')
-
-                # get external aNd internal addresses
-                src, src_internal = get_address_pair_analysis(test_id, src, do_abort='0')
-                dst, dst_internal = get_address_pair_analysis(test_id, dst, do_abort='0')
-
-                if src == '' or dst == '':
+                if flow_outputs[flow] == None:
                     continue
 
                 flow_name = flow.replace(',', '_')
@@ -1708,39 +2041,44 @@ def extract_web10g(test_id='', out_dir='', replot_only='0', source_filter='',
                     long_flow_name = test_id + '_' + flow_name
                 else:
                     long_flow_name = flow_name
-                out = out_dirname + test_id + '_' + flow_name + '_web10g.' + out_file_ext
-                if replot_only == '0' or not os.path.isfile(out) :
-                    # the first grep removes lines with netlink errors printed out
-                    # or last incomplete lines (sed '$d')
-                    # (not sure how to suppress them in web10g)
-                    # the awk command here is a little trick to not print out lines when
-                    # no data is flying around; basically it does suppress lines if
-                    # there is no change with respect to the fields specified.
-                    # this makes the output comparable to siftr where we only
-                    # have output if data is flying around.
-                    local('zcat %s | egrep -v "[a-z]+" | sed \'$d\' | '
-                          'cut -d\',\' -f 1,3,4,5,6,7,8,13,14,%s | grep "%s" | '
-                          'awk -F \',\' \'!a[$2$3$4$5$6$7$8$9]++\' | cut -d\',\' -f 1,10- > %s' %
-                          (web10g_file, attributes, flow, out))
-
-                    if post_proc is not None:
-                        post_proc(web10g_file, out)
 
                 if sfil.is_in(flow_name):
-		    if ts_correct == '1':
-                        host = local(
-                            'echo %s | sed "s/.*_\([a-z0-9\.]*\)_web10g.log.gz/\\1/"' %
-                            web10g_file,
-                            capture=True)
-
-                        out = adjust_timestamps(test_id, out, host, ',', out_dir) 
+                    for out, result in zip(flow_outputs[flow][0], results):
+                        if ts_correct == '1':
+                            host = re.sub('.*_([a-z0-9\.]*)_web10g.log.gz', '\\1',
+                                          web10g_file, 1)
+                            out = adjust_timestamps(test_id, out, host, ',', out_dir) 
 
-                    out_files[long_flow_name] = out
-                    out_groups[out] = group
+                        result[0][long_flow_name] = out
+                        result[1][out] = group
 
         group += 1
 
-    return (out_files, out_groups)
+    return results
+
+
+## Extract data from web10g files
+#  @param test_id Test ID prefix of experiment to analyse
+#  @param out_dir Output directory for results
+#  @param replot_only Don't extract data again, just redo the plot
+#  @param source_filter Filter on specific sources
+#  @param attributes Comma-separated list of attribute names or numbers to
+#                    extract from web10g file, start index is 1
+#                    (refer to web10g documentation for column description)
+#  @param out_file_ext Extension for the output file containing the extracted data
+#  @param post_proc Name of function used for post-processing the extracted data
+#  @param ts_correct '0' use timestamps as they are (default)
+#                    '1' correct timestamps based on clock offsets estimated
+#                        from broadcast pings
+#  @return Map of flow names to interim data file names and 
+#          map of file names and group IDs
+def extract_web10g(test_id='', out_dir='', replot_only='0', source_filter='',
+                   attributes='', out_file_ext='', post_proc=None,
+                   ts_correct='1'):
+
+    return extract_web10g_multi(test_id, out_dir, replot_only, source_filter,
+                                [ (attributes, out_file_ext, post_proc) ],
+                                ts_correct)[0]
 
 
 ## SIFTR prints out very high cwnd (max cwnd?) values for some tcp algorithms
@@ -1748,10 +2086,11 @@ def extract_web10g(test_id='', out_dir='', replot_only='0', source_filter='',
 #  @param siftr_file Data extracted from siftr log
 #  @param out_file File name for post processed data
 def post_proc_siftr_cwnd(siftr_file, out_file):
-    tmp_file = local('mktemp "tmp.XXXXXXXXXX"', capture=True)
-    local(
-        'cat %s | sed -e "1,2d\" > %s && mv %s %s' %
-        (out_file, tmp_file, tmp_file, out_file))
+    with open(out_file) as f:
+        lines = f.readlines()
+    with open(out_file + '.tmp', 'w') as f:
+        f.writelines(lines[2:])
+    os.rename(out_file + '.tmp', out_file)
 
 
 ## Extract cwnd over time
@@ -1802,6 +2141,8 @@ def _extract_cwnd(test_id='', out_dir='', replot_only='0', source_filter='',
     all_files = dict(files1.items() + files2.items())
     all_groups = dict(groups1.items() + groups2.items())
 
+    record_out_files(all_files, source_filter)
+
     return (test_id_arr, all_files, all_groups)
 
 
@@ -1879,20 +2220,39 @@ def analyse_cwnd(test_id='', out_dir='', replot_only='0', source_filter='',
 #  @param out_file File name for post processed data
 def post_proc_siftr_rtt(siftr_file, out_file):
 
-    hz = local(
-        'zcat %s | head -1 | awk \'{ print $4 }\' | cut -d\'=\' -f 2' %
-        siftr_file,
-        capture=True)
-    tcp_rtt_scale = local(
-        'zcat %s | head -1 | awk \'{ print $5 }\' | cut -d\'=\' -f 2' %
-        siftr_file,
-        capture=True)
-    scaler = str(float(hz) * float(tcp_rtt_scale) / 1000)
-    # XXX hmm maybe do the following in python
-    tmp_file = local('mktemp "tmp.XXXXXXXXXX"', capture=True)
-    local('cat %s | awk -v scaler=%s \'BEGIN { FS = "," } ; '
-          '{ printf("%%s,%%.0f,%%s\\n", $1, $2/scaler, $3) }\' > %s && mv %s %s' %
-          (out_file, scaler, tmp_file, tmp_file, out_file))
+    # only reads the first line of the siftr file
+    reader = SiftrReader(siftr_file)
+    hz = reader.get_header('hz')
+    tcp_rtt_scale = reader.get_header('tcp_rtt_scale')
+    reader.close()
+
+    scaler = float(hz) * float(tcp_rtt_scale) / 1000
+    with open(out_file) as f_in:
+        with open(out_file + '.tmp', 'w') as f_out:
+            for line in f_in:
+                fields = line.rstrip('\n').split(',') + [ '', '' ]
+                f_out.write('%s,%.0f,%s\n' % (fields[0], float(fields[1] or 0) / scaler,
+                            fields[2]))
+    os.rename(out_file + '.tmp', out_file)
+
+
+## Get web10g columns of smoothed RTT and sample RTT
+#  @param test_id Test ID prefix of experiment to analyse
+#  @param web10g_version web10g version string, '2.0.9' (default) means the
+#                        columns are looked up by name in each file
+#  @return Comma-separated list of columns
+def get_web10g_rtt_columns(test_id, web10g_version):
+
+    if web10g_version == '2.0.9':
+        # 2.0.9 logs have a header with the column names, for older logs the
+        # names of the 2.0.7 columns are used
+        data_columns = 'SmoothedRTT,SampleRTT'
+    elif web10g_version == '2.0.7':
+        data_columns = '23,45'
+    else:
+        data_columns = '23,45'
+
+    return data_columns
 
 
 ## Extract RTT over time estimated by TCP 
@@ -1937,16 +2297,7 @@ def _extract_tcp_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
                               io_filter=io_filter)
 
     # output smoothed RTT and sample RTT in milliseconds
-    
-    if web10g_version == '2.0.9':
-        web10g_version = guess_version_web10g(test_id)
-
-    if web10g_version == '2.0.7':
-        data_columns = '23,45'
-    elif web10g_version == '2.0.9':
-        data_columns = '23,47'
-    else:
-        data_columns = '23,45'
+    data_columns = get_web10g_rtt_columns(test_id, web10g_version)
 
     (files2,
      groups2) = extract_web10g(test_id,
@@ -1960,6 +2311,8 @@ def _extract_tcp_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
     all_files = dict(files1.items() + files2.items())
     all_groups = dict(groups1.items() + groups2.items())
 
+    record_out_files(all_files, source_filter)
+
     return (test_id_arr, all_files, all_groups)
 
 
@@ -2057,7 +2410,7 @@ def analyse_tcp_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
 #  @param siftr_index Integer number of the column in siftr log files
 #                     (note if you have sitfr and web10g logs, you must also
 #                     specify web10g_index) (default = 9, CWND)
-#  @param web10g_index Integer number of the column in web10g log files (note if
+#  @param web10g_index Integer number or name of the column in web10g log files (note if
 #                      you have web10g and siftr logs, you must also specify siftr_index)
 #                      (default = 26, CWND)
 #                      example: analyse_tcp_stat(siftr_index=17,web10_index=23,...)
@@ -2105,6 +2458,8 @@ def _extract_tcp_stat(test_id='', out_dir='', replot_only='0', source_filter='',
     all_files = dict(files1.items() + files2.items())
     all_groups = dict(groups1.items() + groups2.items())
 
+    record_out_files(all_files, source_filter)
+
     return (test_id_arr, all_files, all_groups)
 
 
@@ -2123,6 +2478,84 @@ def extract_tcp_stat(test_id='', out_dir='', replot_only='0', source_filter='',
     puts('\n[MAIN] COMPLETED extracting TCP Statistic %s \n' % test_id)
 
 
+## Extract CWND, RTT estimated by TCP and optionally a TCP statistic from siftr and
+## web10g logs. The output files are the same as the ones of _extract_cwnd,
+## _extract_tcp_rtt and _extract_tcp_stat, but each siftr and web10g log is read
+## only once for all metrics.
+#  @param test_id Test ID prefix of experiment to analyse
+#  @param out_dir Output directory for results
+#  @param replot_only Don't extract data again that is already extracted
+#  @param source_filter Filter on specific sources
+#  @param ts_correct '0' use timestamps as they are (default)
+#                    '1' correct timestamps based on clock offsets estimated
+#                        from broadcast pings
+#  @param io_filter  'i' only use statistics from incoming packets
+#                    'o' only use statistics from outgoing packets
+#                    'io' use statistics from incooming and outgoing packets
+#                    (only effective for SIFTR files)
+#  @param web10g_version web10g version string (default is 2.0.9) 
+#  @param siftr_index Integer number of the column in siftr log files extracted
+#                     as TCP statistic (default is '', no TCP statistic)
+#  @param web10g_index Integer number or name of the column in web10g log files extracted
+#                      as TCP statistic (default is '', no TCP statistic)
+#  @return Test ID list and map of metrics ('cwnd', 'tcp_rtt', 'tcpstat') to 
+#          pairs of map of flow names to interim data file names and
+#          map of file names and group IDs
+def _extract_tcp_logs(test_id='', out_dir='', replot_only='0', source_filter='',
+                      ts_correct='1', io_filter='o', web10g_version='2.0.9',
+                      siftr_index='', web10g_index=''):
+
+    test_id_arr = test_id.split(';')
+    if len(test_id_arr) == 0 or test_id_arr[0] == '':
+        abort('Must specify test_id parameter')
+
+    metrics = [ 'cwnd', 'tcp_rtt' ]
+    siftr_outputs = [ ('9', 'cwnd', post_proc_siftr_cwnd),
+                      ('17,27', 'tcp_rtt', post_proc_siftr_rtt) ]
+    web10g_outputs = [ ('26', 'cwnd', None),
+                       (get_web10g_rtt_columns(test_id, web10g_version), 'tcp_rtt', None) ]
+    if siftr_index != '' or web10g_index != '':
+        # defaults as in _extract_tcp_stat
+        if siftr_index == '':
+            siftr_index = '9'
+        if web10g_index == '':
+            web10g_index = '26'
+        metrics.append('tcpstat')
+        siftr_outputs.append((siftr_index, 'tcpstat_' + siftr_index, None))
+        web10g_outputs.append((web10g_index, 'tcpstat_' + web10g_index, None))
+
+    siftr_results = extract_siftr_multi(test_id, out_dir, replot_only, source_filter,
+                                        siftr_outputs, ts_correct, io_filter)
+    web10g_results = extract_web10g_multi(test_id, out_dir, replot_only, source_filter,
+                                          web10g_outputs, ts_correct)
+
+    results = {}
+    for metric, siftr_result, web10g_result in zip(metrics, siftr_results, 
+                                                   web10g_results):
+        (files1, groups1) = siftr_result
+        (files2, groups2) = web10g_result
+
+        results[metric] = (dict(files1.items() + files2.items()),
+                           dict(groups1.items() + groups2.items()))
+
+    return (test_id_arr, results)
+
+
+## Extract CWND, RTT estimated by TCP and optionally a TCP statistic
+## SEE _extract_tcp_logs
+@task
+def extract_tcp_logs(test_id='', out_dir='', replot_only='0', source_filter='',
+                     ts_correct='1', io_filter='o', web10g_version='2.0.9',
+                     siftr_index='', web10g_index=''):
+    "Extract CWND, TCP RTT and TCP statistic from siftr/web10g logs"
+
+    _extract_tcp_logs(test_id, out_dir, replot_only, source_filter, ts_correct,
+                      io_filter, web10g_version, siftr_index, web10g_index)
+
+    # done
+    puts('\n[MAIN] COMPLETED extracting TCP logs %s \n' % test_id)
+
+
 ## Plot some TCP statistic (based on siftr/web10g output)
 #  @param test_id Test ID prefix of experiment to analyse
 #  @param out_dir Output directory for results
@@ -2136,7 +2569,7 @@ def extract_tcp_stat(test_id='', out_dir='', replot_only='0', source_filter='',
 #  @param siftr_index Integer number of the column in siftr log files
 #                     (note if you have sitfr and web10g logs, you must also
 #                     specify web10g_index) (default = 9, CWND)
-#  @param web10g_index Integer number of the column in web10g log files (note if
+#  @param web10g_index Integer number or name of the column in web10g log files (note if
 #                      you have web10g and siftr logs, you must also specify siftr_index)
 #                      (default = 26, CWND)
 #		       example: analyse_tcp_stat(siftr_index=17,web10_index=23,...)
@@ -2222,6 +2655,8 @@ def _extract_pktsizes(test_id='', out_dir='', replot_only='0', source_filter='',
     # Initialise source filter data structure
     sfil = SourceFilter(source_filter)
 
+    cache = ExtractCache('extract_pktsizes', replot_only)
+
     group = 1
     for test_id in test_id_arr:
 
@@ -2230,28 +2665,18 @@ def _extract_pktsizes(test_id='', out_dir='', replot_only='0', source_filter='',
                                        ifile_ext,
                                        'grep -v "router.dmp.gz" | grep -v "ctl.dmp.gz"')
 
+        # the packet sizes of all flows are extracted in one pass over each
+        # tcpdump file
+        demux = PcapDemux()
+        extracted = []
+
         for tcpdump_file in tcpdump_files:
             # get input directory name and create result directory if necessary
             out_dirname = get_out_dir(tcpdump_file, out_dir)
             dir_name = os.path.dirname(tcpdump_file)
 
             # unique flows
-            flows = lookup_flow_cache(tcpdump_file)
-            if flows == None:
-                flows = _list(local('zcat %s | tcpdump -nr - "tcp" | '
-                                'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " tcp" } }\' | '
-                                'sed "s/://" | '
-                                'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                'LC_ALL=C sort -u' %
-                                tcpdump_file, capture=True))
-                flows += _list(local('zcat %s | tcpdump -nr - "udp" | '
-                                 'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " udp" } }\' | '
-                                 'sed "s/://" | '
-                                 'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                 'LC_ALL=C sort -u' %
-                                 tcpdump_file, capture=True))
-             
-                append_flow_cache(tcpdump_file, flows)
+            flows = get_flows(tcpdump_file)
 
             # since client sends first packet to server, client-to-server flows
             # will always be first
@@ -2284,64 +2709,61 @@ def _extract_pktsizes(test_id='', out_dir='', replot_only='0', source_filter='',
                 dump1 = dir_name + '/' + test_id + '_' + src + ifile_ext 
                 dump2 = dir_name + '/' + test_id + '_' + dst + ifile_ext 
 
-                # tcpdump filters and output file names
-                filter1 = 'src host ' + src_internal + ' && src port ' + src_port + \
-                    ' && dst host ' + dst_internal + ' && dst port ' + dst_port
-                filter2 = 'src host ' + dst_internal + ' && src port ' + dst_port + \
-                    ' && dst host ' + src_internal + ' && dst port ' + src_port
+                # flow filters and output file names
+                filter1 = (src_internal, src_port, dst_internal, dst_port)
+                filter2 = (dst_internal, dst_port, src_internal, src_port)
                 out_size1 = out_dirname + test_id + '_' + name + ofile_ext 
                 out_size2 = out_dirname + test_id + '_' + rev_name + ofile_ext 
 
                 if long_name not in already_done and long_rev_name not in already_done:
-                    if replot_only == '0' or not ( os.path.isfile(out_size1) and \
-                                               os.path.isfile(out_size2) ):
+                    if cache.need_update([ out_size1, out_size2 ], [ dump1, dump2 ],
+                                         (link_len, )):
                         # make sure for each flow we get the packet sizes captured
                         # at the _receiver_, hence we use filter1 with dump2 ...
-                        if link_len == '0':
-                            local(
-                                'zcat %s | tcpdump -v -tt -nr - "%s" | '
-                                'awk \'{ print $1 " " $NF }\' | grep ")$" | sed -e "s/)//" > %s' %
-                                (dump2, filter1, out_size1))
-                            local(
-                                'zcat %s | tcpdump -v -tt -nr - "%s" | '
-                                'awk \'{ print $1 " " $NF }\' | grep ")$" | sed -e "s/)//" > %s' %
-                                (dump1, filter2, out_size2))
+                        # (no need to read files without packets of the flow)
+                        if flow_has_packets(dump2, *filter1):
+                            demux.add_flow(dump2, filter1, PktSizeConsumer(out_size1, link_len))
                         else:
-                            local(
-                                'zcat %s | tcpdump -e -tt -nr - "%s" | grep "ethertype IP" | '
-                                'awk \'{ print $1 " " $9 }\' | sed -e "s/://" > %s' %
-                                (dump2, filter1, out_size1))
-                            local(
-                                'zcat %s | tcpdump -e -tt -nr - "%s" | grep "ethertype IP" | '
-                                'awk \'{ print $1 " " $9 }\' | sed -e "s/://" > %s' %
-                                (dump1, filter2, out_size2))
+                            open(out_size1, 'w').close()
+                        if flow_has_packets(dump1, *filter2):
+                            demux.add_flow(dump1, filter2, PktSizeConsumer(out_size2, link_len))
+                        else:
+                            open(out_size2, 'w').close()
    
                     already_done[long_name] = 1
                     already_done[long_rev_name] = 1
 
-                    if sfil.is_in(name):
-                        if ts_correct == '1':
-                            out_size1 = adjust_timestamps(test_id, out_size1, dst, ' ', out_dir)
-                        out_files[long_name] = out_size1
-                        out_groups[out_size1] = group
+                    extracted.append((name, long_name, out_size1, dst,
+                                      rev_name, long_rev_name, out_size2, src))
 
-                    if sfil.is_in(rev_name):
-                        if ts_correct == '1':
-                            out_size2 = adjust_timestamps(test_id, out_size2, src, ' ', out_dir)
-                        out_files[long_rev_name] = out_size2
-                        out_groups[out_size2] = group
+        demux.run()
+        cache.commit()
+
+        for (name, long_name, out_size1, dst, rev_name, long_rev_name, out_size2,
+             src) in extracted:
+            if sfil.is_in(name):
+                if ts_correct == '1':
+                    out_size1 = adjust_timestamps(test_id, out_size1, dst, ' ', out_dir)
+                out_files[long_name] = out_size1
+                out_groups[out_size1] = group
+
+            if sfil.is_in(rev_name):
+                if ts_correct == '1':
+                    out_size2 = adjust_timestamps(test_id, out_size2, src, ' ', out_dir)
+                out_files[long_rev_name] = out_size2
+                out_groups[out_size2] = group
 
         # if desired compute aggregate packet kength data for each experiment
         if total_per_experiment == '1':
 
-            files_list = ''
+            files_list = []
             for name in out_files:
                 if out_groups[out_files[name]] == group:
-                    files_list += out_files[name] + ' '
+                    files_list.append(out_files[name])
 
             out_size1 = out_dirname + test_id + '_total' + ofile_ext
-            # cat everything together and sort by timestamp
-            local('cat %s | sort -k 1,1 > %s' % (files_list, out_size1))
+            # merge everything together sorted by timestamp
+            merge_files(files_list, out_size1)
 
             # replace all files for separate flows with total
             delete_list = []
@@ -2359,6 +2781,8 @@ def _extract_pktsizes(test_id='', out_dir='', replot_only='0', source_filter='',
 
         group += 1
 
+    record_out_files(out_files, source_filter)
+
     return (test_id_arr, out_files, out_groups)
 
 
@@ -2472,10 +2896,13 @@ def get_experiment_list(exp_list='', test_id=''):
 #                   'io' use statistics from incooming and outgoing packets
 #                   (only effective for SIFTR files)
 #  @param web10g_version web10g version string (default is 2.0.9)
+#  @param jobs Number of worker processes, experiments and metrics are
+#              extracted in parallel if more than one (default is 1)
 @task
 def extract_all(exp_list='experiments_completed.txt', test_id='', out_dir='',
                 replot_only='0', source_filter='', resume_id='', 
-                link_len='0', ts_correct='1', io_filter='o', web10g_version='2.0.9'):
+                link_len='0', ts_correct='1', io_filter='o', web10g_version='2.0.9',
+                jobs='1'):
     "Extract SPP RTT, TCP RTT, CWND and throughput statistics"
 
     experiments = get_experiment_list(exp_list, test_id)
@@ -2485,20 +2912,46 @@ def extract_all(exp_list='experiments_completed.txt', test_id='', out_dir='',
         puts('Resuming analysis with test_id %s' % resume_id)
         do_analyse = False
 
+    job_list = []
     for test_id in experiments:
 
         if test_id == resume_id:
             do_analyse = True
 
         if do_analyse:
-            execute(extract_rtt, test_id, out_dir, replot_only, source_filter,
-                    ts_correct=ts_correct)
-            execute(extract_cwnd, test_id, out_dir, replot_only, source_filter, 
-                    ts_correct=ts_correct, io_filter=io_filter)
-            execute(extract_tcp_rtt, test_id, out_dir, replot_only, source_filter, 
-                    ts_correct=ts_correct, io_filter=io_filter, web10g_version=web10g_version)
-            execute(extract_pktsizes, test_id, out_dir, replot_only, source_filter,
-                    link_len=link_len, ts_correct=ts_correct)
+            job_list.append(Job('analyse', 'extract_rtt', test_id, out_dir,
+                    replot_only, source_filter, ts_correct=ts_correct))
+            # cwnd and tcp rtt are extracted in one pass over the logs
+            job_list.append(Job('analyse', 'extract_tcp_logs', test_id, out_dir,
+                    replot_only, source_filter, ts_correct=ts_correct,
+                    io_filter=io_filter, web10g_version=web10g_version))
+            job_list.append(Job('analyse', 'extract_pktsizes', test_id, out_dir,
+                    replot_only, source_filter, link_len=link_len,
+                    ts_correct=ts_correct))
+
+    run_jobs(job_list, jobs)
+
+
+## File extensions of the input files of the tcpdump extraction jobs
+DUMP_INPUT_EXTS = [ '.dmp.gz', 'uname.log.gz', 'tpconf_vars.log.gz' ]
+## File extensions of the input files of the siftr/web10g extraction job
+## (the control interface tcpdumps are needed for the timestamp correction)
+LOG_INPUT_EXTS = [ 'siftr.log.gz', 'web10g.log.gz', '_ctl.dmp.gz',
+                   'uname.log.gz', 'tpconf_vars.log.gz' ]
+
+
+## Get input files of experiment
+#  @param test_id Test ID
+#  @param file_exts List of characteristic rightmost parts of the files
+#  @return List of files found
+def get_experiment_files(test_id, file_exts):
+
+    files = []
+    for file_ext in file_exts:
+        files += get_testid_file_list('', test_id, file_ext, 'LC_ALL=C sort',
+                                      no_abort=True)
+
+    return files
 
 
 ## Do all analysis
@@ -2535,12 +2988,15 @@ def extract_all(exp_list='experiments_completed.txt', test_id='', out_dir='',
 #  @param web10g_version web10g version string (default is 2.0.9)
 #  @param plot_params Parameters passed to plot function via environment variables
 #  @param plot_script Specify the script used for plotting, must specify full path
+#  @param jobs Number of worker processes, experiments and metrics are
+#              analysed in parallel if more than one (default is 1)
 @task
 def analyse_all(exp_list='experiments_completed.txt', test_id='', out_dir='',
                 replot_only='0', source_filter='', min_values='3', omit_const='0',
                 smoothed='1', resume_id='', lnames='', link_len='0', stime='0.0',
                 etime='0.0', out_name='', pdf_dir='', ts_correct='1',
-                io_filter='o', web10g_version='2.0.9', plot_params='', plot_script=''):
+                io_filter='o', web10g_version='2.0.9', plot_params='', plot_script='',
+                jobs='1'):
     "Compute SPP RTT, TCP RTT, CWND and throughput statistics"
 
     experiments = get_experiment_list(exp_list, test_id)
@@ -2550,29 +3006,72 @@ def analyse_all(exp_list='experiments_completed.txt', test_id='', out_dir='',
         puts('Resuming analysis with test_id %s' % resume_id)
         do_analyse = False
 
+    # the data is extracted first (cwnd and tcp rtt in one pass over the logs),
+    # then the plots are made from the extracted data. extraction jobs are only
+    # executed if their input files or parameters changed, plot jobs only if
+    # their parameters changed or the data was extracted again
+    graph = BuildGraph()
     for test_id in experiments:
 
         if test_id == resume_id:
             do_analyse = True
 
         if do_analyse:
-            execute(analyse_rtt, test_id, out_dir, replot_only, source_filter,
-                    min_values, omit_const=omit_const, lnames=lnames, stime=stime,
-                    etime=etime, out_name=out_name, pdf_dir=pdf_dir,
-                    ts_correct=ts_correct, plot_params=plot_params, plot_script=plot_script)
-            execute(analyse_cwnd, test_id, out_dir, replot_only, source_filter, min_values,
-                    omit_const=omit_const, lnames=lnames, stime=stime, etime=etime,
+            dump_files = get_experiment_files(test_id, DUMP_INPUT_EXTS)
+            log_files = get_experiment_files(test_id, LOG_INPUT_EXTS)
+            if len(dump_files + log_files) > 0:
+                res_dir = get_out_dir((dump_files + log_files)[0], out_dir)
+            else:
+                # without files the jobs are always executed (and fail)
+                res_dir = ''
+
+            def _add(job, inputs=[], deps=[]):
+                if res_dir == '':
+                    return graph.add(job, deps=deps)
+                stamp = '%steacup_build_%s_%s.txt' % (res_dir, job.name, test_id)
+                return graph.add(job, inputs, stamp=stamp, deps=deps)
+
+            if replot_only == '0':
+                rtt_deps = [ _add(Job('analyse', 'extract_rtt', test_id, out_dir,
+                        replot_only, source_filter, ts_correct=ts_correct),
+                        dump_files) ]
+                log_deps = [ _add(Job('analyse', 'extract_tcp_logs', test_id,
+                        out_dir, replot_only, source_filter, ts_correct=ts_correct,
+                        io_filter=io_filter, web10g_version=web10g_version),
+                        log_files) ]
+                size_deps = [ _add(Job('analyse', 'extract_pktsizes', test_id,
+                        out_dir, replot_only, source_filter, link_len=link_len,
+                        ts_correct=ts_correct), dump_files) ]
+                plot_replot_only = '1'
+            else:
+                rtt_deps = []
+                log_deps = []
+                size_deps = []
+                plot_replot_only = replot_only
+
+            _add(Job('analyse', 'analyse_rtt', test_id, out_dir,
+                    plot_replot_only, source_filter, min_values, omit_const=omit_const,
+                    lnames=lnames, stime=stime, etime=etime, out_name=out_name,
+                    pdf_dir=pdf_dir, ts_correct=ts_correct, plot_params=plot_params,
+                    plot_script=plot_script), deps=rtt_deps)
+            _add(Job('analyse', 'analyse_cwnd', test_id, out_dir,
+                    plot_replot_only, source_filter, min_values, omit_const=omit_const,
+                    lnames=lnames, stime=stime, etime=etime, out_name=out_name,
+                    pdf_dir=pdf_dir, ts_correct=ts_correct, io_filter=io_filter,
+                    plot_params=plot_params, plot_script=plot_script), deps=log_deps)
+            _add(Job('analyse', 'analyse_tcp_rtt', test_id, out_dir,
+                    plot_replot_only, source_filter, min_values, omit_const=omit_const,
+                    smoothed=smoothed, lnames=lnames, stime=stime, etime=etime,
                     out_name=out_name, pdf_dir=pdf_dir, ts_correct=ts_correct,
-                    io_filter=io_filter, plot_params=plot_params, plot_script=plot_script)
-            execute(analyse_tcp_rtt, test_id, out_dir, replot_only, source_filter, min_values,
-                    omit_const=omit_const, smoothed=smoothed, lnames=lnames,
-                    stime=stime, etime=etime, out_name=out_name, pdf_dir=pdf_dir,
-                    ts_correct=ts_correct, io_filter=io_filter, web10g_version=web10g_version,
-                    plot_params=plot_params, plot_script=plot_script)
-            execute(analyse_throughput, test_id, out_dir, replot_only, source_filter,
-                    min_values, omit_const=omit_const, lnames=lnames, link_len=link_len,
-                    stime=stime, etime=etime, out_name=out_name, pdf_dir=pdf_dir,
-                    ts_correct=ts_correct, plot_params=plot_params, plot_script=plot_script)
+                    io_filter=io_filter, web10g_version=web10g_version,
+                    plot_params=plot_params, plot_script=plot_script), deps=log_deps)
+            _add(Job('analyse', 'analyse_throughput', test_id, out_dir,
+                    plot_replot_only, source_filter, min_values, omit_const=omit_const,
+                    lnames=lnames, link_len=link_len, stime=stime, etime=etime,
+                    out_name=out_name, pdf_dir=pdf_dir, ts_correct=ts_correct,
+                    plot_params=plot_params, plot_script=plot_script), deps=size_deps)
+
+    graph.run(jobs)
 
 
 ## Read experiment IDs from file
@@ -2608,8 +3107,7 @@ def get_first_experiment_path(experiments):
     if len(files) > 0:
         dir_name = os.path.dirname(files[0])
     else:
-        abort('Cannot find experiment %s\n'
-              'Remove outdated teacup_dir_cache.txt if files were moved.' % experiments[0])
+        abort('Cannot find experiment %s' % experiments[0])
 
     return dir_name
 
@@ -2695,6 +3193,112 @@ def filter_experiments(experiments, match_str, match_str2):
     return (fil_experiments, test_id_pfx, xlabs)
 
 
+## Select experiments based on the variables and also return test id prefix
+## and list of labels to plot underneath x-axis. The experiments are selected
+## by parameter values from the metrics database, if the database cannot be
+## used the test IDs are matched with regular expressions (see
+## build_match_strings() and filter_experiments())
+#  @param res_dir Directory with result files
+#  @param experiments Experiment list
+#  @param variables Semicolon-separated list of <var>=<value> where <value> means
+#                   we only want experiments where <var> had the specific value
+#  @param test_id_prefix Regular expression matching the test ID prefix
+#  @return List of selected experiments, test ID prefix, x-axis labels
+def select_experiments(res_dir, experiments, variables, test_id_prefix):
+
+    (match_str, match_str2) = build_match_strings(experiments[0], variables,
+                                  test_id_prefix)
+
+    var_dict = {}
+    if variables != '':
+        for var in variables.split(';'):
+            name, val = var.split('=')
+            var_dict[name] = val
+
+    # parameter names of the first experiment, if the test ID cannot be split
+    # into name value pairs (odd number of fields) fall back to matching
+    param_names = []
+    (prefix, params) = decode_test_id(experiments[0], test_id_prefix)
+    if len(params) * 2 == len(experiments[0][len(prefix):].lstrip('_').split('_')):
+        param_names = [ name for (name, val) in params ]
+
+    selected = None
+    if len(param_names) > 0:
+        selected = lookup_experiments(res_dir, experiments,
+                                      [ (name, var_dict.get(name, ''))
+                                        for name in param_names ],
+                                      test_id_prefix)
+    if selected is None:
+        return filter_experiments(experiments, match_str, match_str2)
+
+    fil_experiments = []
+    test_id_pfx = ''
+    xlabs = []
+
+    for (experiment, params) in selected:
+        fil_experiments.append(experiment)
+        xlabs.append('\n'.join([ name + ' ' + params[name] for name in param_names ]))
+        if test_id_pfx == '':
+            res = re.search(match_str2, experiment)
+            if res:
+                test_id_pfx = res.group(1)
+
+    xlabs = [x.replace('_', ' ') for x in xlabs]
+
+    return (fil_experiments, test_id_pfx, xlabs)
+
+
+## Get data files of an experiment for the flows selected by source filter that
+## have more than min_values data points. The data files and their number of rows
+## are looked up in the metrics database. The result directory is searched if
+## the database does not know the data files of all selected flows, or if the
+## data files are merged (merging needs all data files of the experiment).
+#  @param res_dir Directory with result files
+#  @param test_id Test ID
+#  @param ext File extension of data files
+#  @param sfil SourceFilter
+#  @param min_values Minimum number of data points required
+#  @param merge_data '1' merge the data files of the experiment
+#  @param min_flows Number of flows expected
+#  @param use_db True if the database may be used to get the data files
+#  @return Map of flow names to file names
+def get_exp_data_files(res_dir, test_id, ext, sfil, min_values='3', merge_data='0',
+                       min_flows=1, use_db=True):
+
+    files = []
+    if use_db and merge_data != '1':
+        files = lookup_data_files(res_dir, test_id, ext)
+    if len(files) == 0:
+        use_db = False
+        files = get_testid_file_list('', test_id, ext, 'LC_ALL=C sort', res_dir)
+
+    if merge_data == '1':
+        # change extension
+        ext += '.all'
+        files = merge_data_files(files)
+
+    sel_files = []
+    match_str = '.*_([0-9\.]*_[0-9]*_[0-9\.]*_[0-9]*)[0-9a-z_.]*' + ext
+    for f in files:
+        res = re.search(match_str, f)
+        if res and sfil.is_in(res.group(1)):
+            sel_files.append((res.group(1), f))
+
+    if use_db and len(set([ name for (name, f) in sel_files ])) < min_flows:
+        # the database may not know all data files, e.g. files extracted
+        # by older versions
+        return get_exp_data_files(res_dir, test_id, ext, sfil, min_values,
+                                  merge_data, min_flows, False)
+
+    out_files = {}
+    for (name, f) in sel_files:
+        # only add file if enough data points
+        if get_data_file_rows(f) > int(min_values):
+            out_files[name] = f
+
+    return out_files
+
+
 ## Get plot parameters based on metric
 #  @param metric Metric name
 #  @param smoothed If '1' plot smoothed RTT, if '0' plot unsmoothed RTT
@@ -2860,6 +3464,76 @@ def get_extract_function(metric='', link_len='0', stat_index='0', slowest_only='
     return (extract_functions[metric], extract_kwargs[metric])
 
 
+## Check if data of an experiment has already been extracted completely by
+## an earlier run. This only looks at the metrics database of the result
+## directory and does not run any external commands, so it only works if the
+## experiment directory is in the directory cache
+#  @param test_id Test ID
+#  @param out_dir Output directory as passed to the extract functions
+#  @param ext File extension of the extracted data files
+#  @param source_filter Source filter as passed to the extract functions
+#  @return True if extracted data files exist, False if not or we don't know
+def is_extracted(test_id, out_dir, ext, source_filter):
+
+    dir_name = lookup_dir_cache(test_id)
+    if dir_name == '.':
+        return False
+
+    if out_dir == '' or out_dir[0] != '/':
+        res_dir = dir_name + '/' + out_dir
+    else:
+        res_dir = out_dir
+
+    return lookup_extracted(res_dir, test_id, ext, source_filter)
+
+
+## Extract the data of one or more metrics for a list of experiments. If 
+## replot_only is '1' experiments that have already been extracted are skipped
+#  @param experiments List of test IDs
+#  @param metrics List of (metric, stat_index) tuples
+#  @param jobs Number of worker processes that extract experiments in parallel
+#  @param out_dir Output directory for result files
+#  @param source_filter Filter on specific sources
+#  @param replot_only '0' extract data, '1' don't extract data again
+#  @param ts_correct '0' use timestamps as they are, '1' correct timestamps
+#  @param smoothed See analyse_cmpexp
+#  @param link_len See analyse_cmpexp
+#  @param sburst See analyse_cmpexp
+#  @param eburst See analyse_cmpexp
+#  @param slowest_only See analyse_cmpexp
+#  @param query_host See analyse_cmpexp
+def extract_experiments(experiments, metrics, jobs='1', out_dir='', source_filter='',
+                        replot_only='0', ts_correct='1', smoothed='1', link_len='0',
+                        sburst='1', eburst='0', slowest_only='0', query_host=''):
+
+    job_list = []
+    skipped = 0
+    for experiment in experiments:
+        for (metric, stat_index) in metrics:
+            if replot_only == '1':
+                ext = get_metric_params(metric, smoothed, ts_correct, stat_index,
+                                        slowest_only=slowest_only)[0]
+                if is_extracted(experiment, out_dir, ext, source_filter):
+                    skipped += 1
+                    continue
+
+            (ex_function, kwargs) = get_extract_function(metric, link_len,
+                                    stat_index, sburst=sburst, eburst=eburst,
+                                    slowest_only=slowest_only, query_host=query_host)
+
+            job_list.append(FunctionJob('analyse', ex_function.__name__,
+                test_id=experiment, out_dir=out_dir,
+                source_filter=source_filter,
+                replot_only=replot_only,
+                ts_correct=ts_correct,
+                **kwargs))
+
+    if skipped > 0:
+        puts('Skipping %i already extracted experiment/metric pairs' % skipped)
+
+    run_jobs(job_list, jobs)
+
+
 ## Function that plots mean, median, boxplot of throughput, RTT and other metrics 
 ## for different parameter combinations
 ## XXX currently can't reorder the experiment parameters, order is the one given by
@@ -2927,6 +3601,8 @@ def get_extract_function(metric='', link_len='0', stat_index='0', slowest_only='
 #                       '2' plot ratio of median/mean (as per ptype) and nominal response
 #                           time
 #  @param query_host Name of querier (only for iqtime metric)
+#  @param jobs Number of worker processes used to extract the experiments
+#              in parallel (default is 1)
 @task
 def analyse_cmpexp(exp_list='experiments_completed.txt', res_dir='', out_dir='',
                    source_filter='', min_values='3', omit_const='0', metric='throughput',
@@ -2936,7 +3612,7 @@ def analyse_cmpexp(exp_list='experiments_completed.txt', res_dir='', out_dir='',
                    link_len='0', plot_params='', plot_script='', stat_index='',
                    dupacks='0', cum_ackseq='1', merge_data='0', sburst='1', 
                    eburst='0', test_id_prefix='[0-9]{8}\-[0-9]{6}_experiment_',
-                   slowest_only='0', res_time_mode='0', query_host=''):
+                   slowest_only='0', res_time_mode='0', query_host='', jobs='1'):
     "Compare metrics for different experiments"
 
     if ptype != 'box' and ptype != 'mean' and ptype != 'median':
@@ -2971,18 +3647,9 @@ def analyse_cmpexp(exp_list='experiments_completed.txt', res_dir='', out_dir='',
 
     # if we haven' got the extracted data run extract method(s) first
     if res_dir == '':
-        for experiment in experiments:
-            
-            (ex_function, kwargs) = get_extract_function(metric, link_len,
-                                    stat_index, sburst=sburst, eburst=eburst,
-                                    slowest_only=slowest_only, query_host=query_host)
-
-            (dummy, out_files, out_groups) = ex_function(
-                test_id=experiment, out_dir=out_dir,  
-                source_filter=source_filter, 
-                replot_only=replot_only, 
-                ts_correct=ts_correct,
-                **kwargs)
+        extract_experiments(experiments, [ (metric, stat_index) ], jobs, out_dir,
+                            source_filter, replot_only, ts_correct, smoothed,
+                            link_len, sburst, eburst, slowest_only, query_host)
 
         if out_dir == '' or out_dir[0] != '/':
             res_dir = dir_name + '/' + out_dir 
@@ -3005,19 +3672,12 @@ def analyse_cmpexp(exp_list='experiments_completed.txt', res_dir='', out_dir='',
         mkdir_p(pdf_dir)
 
     #
-    # build match string from variables
-    #
-
-    (match_str, match_str2) = build_match_strings(experiments[0], variables,
-                                  test_id_prefix)
-
-    #
-    # filter out the experiments to plot, generate x-axis labels, get test id prefix
+    # select the experiments to plot, generate x-axis labels, get test id prefix
     #
 
     (fil_experiments, 
      test_id_pfx,
-     xlabs) = filter_experiments(experiments, match_str, match_str2)
+     xlabs) = select_experiments(res_dir, experiments, variables, test_id_prefix)
 
     #
     # get out data files based on filtered experiment list and source_filter
@@ -3055,30 +3715,8 @@ def analyse_cmpexp(exp_list='experiments_completed.txt', res_dir='', out_dir='',
 
     file_names = []
     for experiment in fil_experiments:
-        out_files = {}
-        _ext = ext
- 
-        files = get_testid_file_list('', experiment, 
-                                      '%s' % _ext,
-                                      'LC_ALL=C sort', res_dir)
-        if merge_data == '1':
-            # change extension
-            _ext += '.all'
-            files = merge_data_files(files)
-
-        #print(files)
-        match_str = '.*_([0-9\.]*_[0-9]*_[0-9\.]*_[0-9]*)[0-9a-z_.]*' + _ext
-        for f in files:
-            # print(f)
-            res = re.search(match_str, f)
-            #print(res.group(1))
-            if res and sfil.is_in(res.group(1)):
-                # only add file if enough data points
-                rows = int(
-                    local('wc -l %s | awk \'{ print $1 }\'' %
-                          f, capture=True))
-                if rows > int(min_values):
-                    out_files[res.group(1)] = f
+        out_files = get_exp_data_files(res_dir, experiment, ext, sfil, min_values,
+                                       merge_data, len(leg_names))
 
         #print(out_files)
         #print(leg_names)
@@ -3182,6 +3820,19 @@ def analyse_cmpexp(exp_list='experiments_completed.txt', res_dir='', out_dir='',
         oprefix = test_id_pfx + '_' + metric + '_' + ptype
     title = oprefix
 
+    check_time_window(file_names, float(stime), float(etime))
+
+    # compute summary statistics here and only pass the statistics to the
+    # plot script (our own plot script only)
+    stats = '0'
+    if plot_script == '':
+        stats_files = get_stats_files(file_names, yindex, yscaler, sep, aggr, diff,
+                                      omit_const, float(stime), float(etime),
+                                      plot_params)
+        if stats_files is not None:
+            file_names = stats_files
+            stats = '1'
+
     if plot_script == '':
         plot_script = 'R CMD BATCH --vanilla %s/plot_cmp_experiments.R' % \
                       config.TPCONF_script_path
@@ -3222,17 +3873,18 @@ def analyse_cmpexp(exp_list='experiments_completed.txt', res_dir='', out_dir='',
     #         of an experiment
     # ETIME:  end time on x-axis (for zooming in), default is 0.0 meaning the end of an
     #         experiment a determined from the data
+    # STATS:  '1' FNAMES are summary statistics files instead of data files
 
     #local('which R')
-    local('TITLE="%s" FNAMES="%s" LNAMES="%s" XLABS="%s" YLAB="%s" YINDEX="%d" '
+    run_plot_script('TITLE="%s" FNAMES="%s" LNAMES="%s" XLABS="%s" YLAB="%s" YINDEX="%d" '
           'YSCALER="%f" SEP="%s" OTYPE="%s" OPREFIX="%s" ODIR="%s" AGGR="%s" DIFF="%s" '
-          'OMIT_CONST="%s" PTYPE="%s" YMIN="%s" YMAX="%s" STIME="%s" ETIME="%s" %s '
-          '%s '
-          '%s %s%s_plot_cmp_experiments.Rout' %
+          'OMIT_CONST="%s" PTYPE="%s" YMIN="%s" YMAX="%s" STIME="%s" ETIME="%s" '
+          'STATS="%s" %s %s' %
           (title, ','.join(file_names), ','.join(leg_names), ','.join(xlabs), ylab,
            yindex, yscaler, sep, 'pdf', oprefix, pdf_dir, aggr, diff,
-           omit_const, ptype, ymin, ymax, stime, etime, res_time_env, plot_params,
-           plot_script, pdf_dir, oprefix))
+           omit_const, ptype, ymin, ymax, stime, etime, stats, res_time_env,
+           plot_params),
+          plot_script, '%s%s_plot_cmp_experiments.Rout' % (pdf_dir, oprefix))
 
     if config.TPCONF_debug_level == 0:
         local('rm -f %s%s_plot_cmp_experiments.Rout' % (pdf_dir, oprefix)) 
@@ -3241,6 +3893,32 @@ def analyse_cmpexp(exp_list='experiments_completed.txt', res_dir='', out_dir='',
     puts('\n[MAIN] COMPLETED analyse_cmpexp %s \n' % test_id_pfx)
 
 
+## Read httperf incast log in one pass
+#  @param log_file Gzipped httperf incast log file
+#  @return List of (ip, port) tuples of the responders (in order of responder
+#          ids), map of responder ids to lists of
+#          (request_ts, response_time, interval, timed_out) tuples
+def read_incast_log(log_file):
+
+    responders = []
+    responses = {}
+
+    f = gzip.open(log_file, 'rb')
+    for line in f:
+        if line.find('hash_enter') >= 0 and line.find('localhost') < 0:
+            fields = line.rstrip('\n').split(' ')
+            responders.append((fields[1], fields[2]))
+
+        if line.find('incast_files') >= 0:
+            fields = line.split()
+            responses.setdefault(int(fields[2]), []).append(
+                (float(fields[0]), fields[9], float(fields[11]), fields[12]))
+
+    f.close()
+
+    return (responders, responses)
+
+
 ## Extract incast response times from httperf files 
 ## The extracted files have an extension of .rtimes. The format is CSV with the
 ## columns:
@@ -3273,6 +3951,8 @@ def _extract_incast(test_id='', out_dir='', replot_only='0', source_filter='',
 
     out_files = {}
     out_groups = {}
+    # response times of newly extracted files, keyed by file name
+    rtimes = {}
 
     sburst = int(sburst)
     eburst = int(eburst)
@@ -3284,6 +3964,8 @@ def _extract_incast(test_id='', out_dir='', replot_only='0', source_filter='',
     # Initialise source filter data structure
     sfil = SourceFilter(source_filter)
 
+    cache = ExtractCache('extract_incast', replot_only)
+
     group = 1
     for test_id in test_id_arr:
 
@@ -3296,27 +3978,19 @@ def _extract_incast(test_id='', out_dir='', replot_only='0', source_filter='',
             out_dirname = get_out_dir(log_file, out_dir)
 
             # get src ip from file name
-            src = local(
-                'echo %s | sed "s/.*_\([a-z0-9\.]*\)_[0-9]*_httperf_incast.log.gz/\\1/"' %
-                log_file,
-                capture=True)
+            src = re.sub('.*_([a-z0-9\.]*)_[0-9]*_httperf_incast.log.gz', '\\1',
+                         log_file)
             # don't know source port, use it to differentiate experiments
             # must use high port otherwise the later sorting will fail
             src_port = str(50000 + group)
 
-            # get destination ip and port from log file
-            responders = _list(
-                local(
-                    'zcat %s | grep "hash_enter" | grep -v localhost | cut -d" " -f 2,3' %
-                    log_file, capture=True))
+            # get external and internal addresses
+            src, src_internal = get_address_pair_analysis(test_id, src, do_abort='0')
 
-            cnt = 0
-            for _resp in responders:
-                dst = _resp.split(' ')[0]
-                dst_port = _resp.split(' ')[1]
+            # get destination ips and ports and all responses from log file
+            (responders, responses) = read_incast_log(log_file)
 
-                # get external and internal addresses
-                src, src_internal = get_address_pair_analysis(test_id, src, do_abort='0')
+            for cnt, (dst, dst_port) in enumerate(responders):
                 dst, dst_internal = get_address_pair_analysis(test_id, dst, do_abort='0')
 
                 #print(src, src_port, dst, dst_port)
@@ -3341,53 +4015,47 @@ def _extract_incast(test_id='', out_dir='', replot_only='0', source_filter='',
                 out_files[long_name] = out_fname
                 out_groups[out_fname] = group
 
-                if replot_only == '0' or not os.path.isfile(out_fname) :
+                if cache.need_update([ out_fname ], [ log_file ], (sburst, eburst)):
                     f = open(out_fname, 'w')
 
-                    responses = _list(local('zcat %s | grep "incast_files"' %
-                        log_file, capture=True))
-
                     time = 0.0
-                    bursts = {} 
-                    for response in responses:
-                        request_ts = float(response.split()[0])
-                        responder_id = int(response.split()[2])
-                        response_time = response.split()[9]
-                        interval = float(response.split()[11])
-                        timed_out = response.split()[12]
-
-                        if responder_id == cnt:
-
-                            if not responder_id in bursts:
-                                bursts[responder_id] = 0                            
-                            bursts[responder_id] += 1
-
-                            # do only write the times for burst >= sburst and burst <= eburst
-                            # but sburst=0/eburst=0 means no lower/upper limit 
-                            if bursts[responder_id] >= sburst and \
-                               (eburst == 0 or bursts[responder_id] <= eburst):
-                                if timed_out == 'no':
-                                    f.write('%f %i %s\n' % (request_ts, bursts[responder_id],
-                                                            response_time))
-                                else:
-                                    f.write('%f NA NA\n' % time)
-                                    abort_extract = True
-
-                            time += interval
+                    burst = 0
+                    rows = []
+                    for request_ts, response_time, interval, timed_out in \
+                            responses.get(cnt, []):
+                        burst += 1
+
+                        # do only write the times for burst >= sburst and burst <= eburst
+                        # but sburst=0/eburst=0 means no lower/upper limit 
+                        if burst >= sburst and (eburst == 0 or burst <= eburst):
+                            if timed_out == 'no':
+                                ts = '%f' % request_ts
+                                f.write('%s %i %s\n' % (ts, burst, response_time))
+                                rows.append((float(ts), burst, float(response_time)))
+                            else:
+                                f.write('%f NA NA\n' % time)
+                                abort_extract = True
+
+                        time += interval
 
                     f.close()
 
-                cnt += 1
+                    rtimes[out_fname] = rows
 
         # abort but only after we fully processed the problematic experiment
+        # (files with timeouts are not cached)
         if abort_extract:
             abort('Responder timed out in experiment %s' % test_id)
 
+        cache.commit()
+
         group += 1
 
     if slowest_only != '0':
         (out_files, out_groups) = get_slowest_response_time(out_files, out_groups,
-                                  int(slowest_only) - 1)
+                                  int(slowest_only) - 1, rtimes)
+
+    record_out_files(out_files, source_filter)
 
     return (test_id_arr, out_files, out_groups)
 
@@ -3411,8 +4079,10 @@ def extract_incast(test_id='', out_dir='', replot_only='0', source_filter='',
 #  @param out_groups Map of files to groups
 #  @param mode '0' slowest response time
 #              '1' time between first request and last response finished
+#  @param rtimes Map of file names to lists of (time, burst, response time)
+#                tuples, files not in the map are read from disk
 #  @return Map of flow names to file names, map of file names to group IDs
-def get_slowest_response_time(out_files, out_groups, mode=0):
+def get_slowest_response_time(out_files, out_groups, mode=0, rtimes=None):
 
     ofile_ext = '.rtimes'
     slowest = {}
@@ -3425,14 +4095,24 @@ def get_slowest_response_time(out_files, out_groups, mode=0):
         for name in out_files.keys():
             if out_groups[out_files[name]] == group:
 
-                # read data file and adjust slowest
-                f = open(out_files[name], 'r')
-                for line in f.readlines():
-                    _time = float(line.split()[0])
-                    _burst = float(line.split()[1])
-                    # response time is in last column, but column number differs
-                    # for httperf vs tcpdump extracted data
-                    _res_time = float(line.split()[-1])
+                # read data file (unless we have it already) and adjust slowest
+                if rtimes is not None and out_files[name] in rtimes:
+                    rows = rtimes[out_files[name]]
+                else:
+                    data = read_data_file(out_files[name])
+                    if data.rows > 0:
+                        # response time is in last column, but column number
+                        # differs for httperf vs tcpdump extracted data
+                        rows = zip(data.get_values(0), data.get_values(1),
+                                   data.get_values(-1))
+                    else:
+                        rows = []
+                    data.close()
+
+                for _time, _burst, _res_time in rows:
+                    # skip lines without response (NA values)
+                    if _burst != _burst or _res_time != _res_time:
+                        continue
 
                     _time_finished = _time + _res_time
 
@@ -3458,8 +4138,6 @@ def get_slowest_response_time(out_files, out_groups, mode=0):
                         if _time_finished > latest[_burst]:
                             latest[_burst] = _time_finished
 
-                f.close()
-
                 if fname == '':
                     fname = out_files[name]
 
@@ -3582,8 +4260,13 @@ def analyse_incast(test_id='', out_dir='', replot_only='0', source_filter='',
 #                     where burst starts @ t=0 and then burst_sep seconds after start of previous burst
 #                  > 0, extract bursts into acks_file+".N" outputfiles (for burst N)
 #                     where burst starts @ t=0 and then burst_sep seconds after end of previous burst
+#  @param sburst First burst to extract (bursts are numbered from 1)
+#  @param eburst Last burst to extract (0 means last burst)
 #  @return Vector of file names (one for each file generated)
 #
+# The .acks file is read line by line in one pass and only the lines of the
+# bursts sburst..eburst are written.
+#
 # First task is to calculate the number of duplicate ACKs. Define
 # them as ACKs whose sequence number is unchanged from the immediately
 # preceding ACK.
@@ -3610,119 +4293,154 @@ def analyse_incast(test_id='', out_dir='', replot_only='0', source_filter='',
 # NOTE: This function relies on there being no re-ordering of ACK packets on
 #       the return path.
 #
-def extract_dupACKs_bursts(acks_file='', burst_sep=0):
-
-    # New filenames (source file + ".0" or ".1,.2,....N" for bursts)
-    new_fnames = [];
+def extract_dupACKs_bursts(acks_file='', burst_sep=0, sburst=1, eburst=0):
 
-    # Internal variables
-    burstN = 1
-    firstTS = -1
+    # nothing to do if the bursts were already extracted from the current
+    # data file with the same parameters
+    cache = ExtractCache('extract_dupACKs_bursts')
+    params = (burst_sep, int(sburst), int(eburst))
+    burst_files = get_burst_files(cache, acks_file, params)
+    if burst_files is not None:
+        return burst_files
 
+    new_fnames = []
     try:
-        _acks = []
-        # First read the entire contents of a .acks file
-        with open(acks_file) as f:
-            _acks = f.readlines()
-            #print _acks
-
-            if burst_sep != 0 :
-                # Create the first .acks.N output file
-                out_f = open(acks_file+"."+"1","w")
-                new_fnames.append(acks_file+"."+"1")
-            else:
-                out_f = open(acks_file+"."+"0","w")
-                new_fnames.append(acks_file+"."+"0")
-
-            # Now walk through every line of the .acks file
-            for oneline in _acks:
-                # ackdetails[0] is the timestamp, ackdetails[1] is the seq number
-                ackdetails = oneline.split()
-
-                if firstTS == -1 :
-                    # This is first time through the loop, so set some baseline
-                    # values for later offsets
-                    firstTS = ackdetails[0]
-                    prev_ACKTS = firstTS
-                    firstBytes = 0
-
-                # Is this ACK a dupACK ?
-                if int(ackdetails[1]) == 0 :
-                    # Only the first ACK line has zero seq number. Special case, reset dupACKs count
-                    dupACKs = 0
-                    prev_seqno = ackdetails[1]
-                else:
-                    # Define dupACK as an ACK with unchanged seq number wrt preceding ACK
-                    if (int(ackdetails[1]) - int(prev_seqno)) == 0 :
-                        dupACKs += 1
+        (new_fnames, bursts) = _write_dupACKs_bursts(acks_file, burst_sep, sburst,
+                                                     eburst)
+        if len(new_fnames) == 0:
+            # sburst was larger than the number of bursts, extract last burst
+            (sburst, eburst) = get_burst_range(bursts, sburst, eburst)
+            (new_fnames, bursts) = _write_dupACKs_bursts(acks_file, burst_sep,
+                                                         sburst, eburst)
 
-                # If burst_sep == 0 the only thing we're calculating is a
-                # cumulative running total of dupACKs, so we only do burst
-                # identification if burst_sep != 0
+        put_burst_files(cache, acks_file, new_fnames)
 
-                if burst_sep != 0 :
+    except IOError:
+        print('extract_dupACKs_bursts(): File access problem while working on %s' % acks_file)
 
-                    if burst_sep < 0 :
-                        # ack_gap is time since first ACK of this burst
-                        # (i.e. relative to firstTS)
-                        ack_gap = float(ackdetails[0]) - float(firstTS)
-                    else:
-                        # ack_gap is time since previous ACK in this burst
-                        # (i.e. relative to prev_ACKTS)
-                        ack_gap = float(ackdetails[0]) - float(prev_ACKTS)
+    return new_fnames
 
-                    # New burst begins when time between this ACK and previous
-                    # exceeds abs(burst_sep)
-                    if (ack_gap >= abs(burst_sep)) :
-                        # We've found the first ACK of the _next_ burst
 
-                        # Close previous burst output file
-                        out_f.close()
+## Write the dupACKs files for bursts sburst..eburst (see extract_dupACKs_bursts)
+#  @param acks_file .acks file
+#  @param burst_sep See extract_dupACKs_bursts
+#  @param sburst First burst to write
+#  @param eburst Last burst to write (0 means last burst)
+#  @return Pair of list of written file names and number of bursts 
+def _write_dupACKs_bursts(acks_file, burst_sep, sburst, eburst):
+
+    # New filenames (source file + ".0" or ".1,.2,....N" for bursts)
+    new_fnames = []
+
+    sburst = max(int(sburst), 1)
+    eburst = int(eburst)
 
-                        # Move on to the next burst
-                        burstN += 1
+    # Internal variables
+    burstN = 1
+    firstTS = None
+    firstBytes = 0
+    prev_seqno = None
+    dupACKs = 0
+    out_f = None
+
+    with open(acks_file) as f:
+        # Now walk through every line of the .acks file
+        for oneline in f:
+            # ackdetails[0] is the timestamp, ackdetails[1] is the seq number
+            ackdetails = oneline.split()
+            ts = float(ackdetails[0])
+            seqno = int(ackdetails[1])
+
+            if firstTS is None:
+                # This is first time through the loop, so set some baseline
+                # values for later offsets
+                firstTS = ts
+                prev_ACKTS = ts
+
+            # Is this ACK a dupACK ?
+            if seqno == 0:
+                # Only the first ACK line has zero seq number. Special case, reset dupACKs count
+                dupACKs = 0
+            elif seqno == prev_seqno:
+                # Define dupACK as an ACK with unchanged seq number wrt preceding ACK
+                dupACKs += 1
+
+            # If burst_sep == 0 the only thing we're calculating is a
+            # cumulative running total of dupACKs, so we only do burst
+            # identification if burst_sep != 0
+            if burst_sep != 0:
+
+                if burst_sep < 0:
+                    # ack_gap is time since first ACK of this burst
+                    ack_gap = ts - firstTS
+                else:
+                    # ack_gap is time since previous ACK in this burst
+                    ack_gap = ts - prev_ACKTS
 
-                        print ("Burst: %3i, ends at %f sec, data: %i bytes, gap: %3.6f sec, dupACKs: %i" %
-                        ( (burstN-1),  float(prev_ACKTS), int(prev_seqno) - int(firstBytes), ack_gap, dupACKs ) )
+                # New burst begins when time between this ACK and previous
+                # exceeds abs(burst_sep)
+                if ack_gap >= abs(burst_sep):
+                    # We've found the first ACK of the _next_ burst
+                    burstN += 1
 
-                        # Reset firstTS to the beginning (first timestamp) of this new burst
-                        firstTS = ackdetails[0]
+                    # Reset firstTS to the beginning (first timestamp) of this new burst
+                    firstTS = ts
 
-                        # The sequence number of first ACK of bursts 2...N must be considered
-                        # relative to LAST seq number of PREVIOUS burst in order to calculate
-                        # how many bytes were fully sent in bursts 2...N.
-                        firstBytes = prev_seqno
+                    # The sequence number of first ACK of bursts 2...N must be considered
+                    # relative to LAST seq number of PREVIOUS burst in order to calculate
+                    # how many bytes were fully sent in bursts 2...N.
+                    firstBytes = prev_seqno
 
-                        # Reset the dupACKs counter
-                        dupACKs = 0
+                    # Reset the dupACKs counter
+                    dupACKs = 0
 
-                        # Create the next .acks.N output file
-                        out_f = open(acks_file+"."+str(burstN),"w")
-                        new_fnames.append(acks_file+"."+str(burstN))
+                    # Close previous burst output file
+                    if out_f is not None:
+                        out_f.close()
+                        out_f = None
 
+            if burstN >= sburst and (eburst == 0 or burstN <= eburst):
+                if out_f is None:
+                    # Create the .acks.N output file
+                    if burst_sep != 0:
+                        fname = acks_file + '.' + str(burstN)
+                    else:
+                        fname = acks_file + '.0'
+                    out_f = open(fname, 'w')
+                    new_fnames.append(fname)
 
                 # How many bytes were ACK'ed since beginning? (Of entire file or of burst N)
                 # This must be calculated _after_ firstBytes is potentially reset on
                 # the boundary between bursts.
-                bytes_gap = int(ackdetails[1]) - int(firstBytes)
-
-                #print "Burst: ", burstN, "  Time ", ackdetails[0] ," Bytes ", bytes_gap, "   DupACKS ", dupACKs
+                bytes_gap = seqno - firstBytes
 
                 # Write to burst-specific output file
                 # <time>  <ACK seq number>  <dupACK count>
-                out_f.write(ackdetails[0]+" "+str(bytes_gap)+" "+str(dupACKs)+"\n")
+                out_f.write(ackdetails[0] + ' ' + str(bytes_gap) + ' ' + str(dupACKs) + '\n')
 
-                # Store the seq number for next time around the loop
-                prev_seqno = ackdetails[1]
-                prev_ACKTS = ackdetails[0]
+            # Store the seq number for next time around the loop
+            prev_seqno = seqno
+            prev_ACKTS = ts
 
-            # Close the last output file
-            out_f.close()
+    # Close the last output file
+    if out_f is not None:
+        out_f.close()
 
-    except IOError:
-        print('extract_dupACKs_bursts(): File access problem while working on %s' % acks_file)
+    if firstTS is None and sburst == 1:
+        # no ACKs, create empty output file
+        if burst_sep != 0:
+            fname = acks_file + '.1'
+        else:
+            fname = acks_file + '.0'
+        open(fname, 'w').close()
+        new_fnames.append(fname)
 
-    return new_fnames
+    if burst_sep != 0 and len(new_fnames) > 0:
+        puts('Extracted bursts %s-%s of %i from %s' %
+             (new_fnames[0].split('.')[-1], new_fnames[-1].split('.')[-1], burstN,
+              acks_file))
+
+    return (new_fnames, burstN)
 
 
 
@@ -3771,6 +4489,8 @@ def _extract_ackseq(test_id='', out_dir='', replot_only='0', source_filter='',
     # Initialise source filter data structure
     sfil = SourceFilter(source_filter)
 
+    cache = ExtractCache('extract_ackseq', replot_only)
+
     group = 1
     for test_id in test_id_arr:
 
@@ -3779,22 +4499,17 @@ def _extract_ackseq(test_id='', out_dir='', replot_only='0', source_filter='',
                                        ifile_ext,
                                        'grep -v "router.dmp.gz" | grep -v "ctl.dmp.gz"')
 
+        # the ACKs of all flows are extracted in one pass over each tcpdump file
+        demux = PcapDemux()
+        extracted = []
+
         for tcpdump_file in tcpdump_files:
             # get input directory name and create result directory if necessary
             dir_name = os.path.dirname(tcpdump_file)
             out_dirname = get_out_dir(tcpdump_file, out_dir)
 
             # unique flows
-            flows = lookup_flow_cache(tcpdump_file)
-            if flows == None:
-                flows = _list(local('zcat %s | tcpdump -nr - "tcp" | '
-                                'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " tcp" } }\' | '
-                                'sed "s/://" | '
-                                'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                'LC_ALL=C sort -u' %
-                                tcpdump_file, capture=True))
-
-                append_flow_cache(tcpdump_file, flows)
+            flows = get_flows(tcpdump_file, 'tcp')
 
             # since client sends first packet to server, client-to-server flows
             # will always be first
@@ -3827,194 +4542,116 @@ def _extract_ackseq(test_id='', out_dir='', replot_only='0', source_filter='',
                 dump1 = dir_name + '/' + test_id + '_' + src + ifile_ext 
                 dump2 = dir_name + '/' + test_id + '_' + dst + ifile_ext 
 
-                # tcpdump filters and output file names
-                # 'tcp[tcpflags] == tcp-ack' rule to extract only ACK packets (eliminate SYN and FIN, even if ACK also set)
-                filter1 = 'src host ' + src_internal + ' && src port ' + src_port + \
-                    ' && dst host ' + dst_internal + ' && dst port ' + dst_port + \
-                    ' && tcp[tcpflags] == tcp-ack'
-                filter2 = 'src host ' + dst_internal + ' && src port ' + dst_port + \
-                    ' && dst host ' + src_internal + ' && dst port ' + src_port + \
-                    ' && tcp[tcpflags] == tcp-ack'
+                # flow filters and output file names
+                # only pure ACK packets are extracted (like tcpdump filter 
+                # 'tcp[tcpflags] == tcp-ack', eliminate SYN and FIN, even if ACK also set)
+                filter1 = (src_internal, src_port, dst_internal, dst_port)
+                filter2 = (dst_internal, dst_port, src_internal, src_port)
 
                 out_acks1 = out_dirname + test_id + '_' + name + ofile_ext 
                 out_acks2 = out_dirname + test_id + '_' + rev_name + ofile_ext 
 
                 if long_name not in already_done and long_rev_name not in already_done:
-                    if replot_only == '0' or not ( os.path.isfile(out_acks1) and \
-                                               os.path.isfile(out_acks2) ):
+                    if cache.need_update([ out_acks1, out_acks2 ], [ dump1, dump2 ]):
 
                         # make sure for each flow we get the ACKs captured
                         # at the _receiver_, hence we use filter1 with dump2 ...
-                        # Use "-S" option to tcpdump so ACK sequence numbers are always absolute
-
-                        # Grab first ACK sequence numbers for later use as a baseline
-
-                        baseACK1 = local(
-                            'zcat %s | tcpdump -c 1 -S -tt -nr - "%s" | '
-                            'awk \'{ FS=" " ; for(i=2;i<=NF;i++) { if ( $i  == "ack") { print $(i+1) }  } ; }\' | sed \'s/,//\' ' %
-                            (dump2, filter1), capture=True)
-                        baseACK2 = local(
-                            'zcat %s | tcpdump -c 1 -S -tt -nr - "%s" | '
-                            'awk \'{ FS=" " ; for(i=2;i<=NF;i++) { if ( $i  == "ack") { print $(i+1) }  } ; }\' | sed \'s/,//\' ' %
-                            (dump1, filter2), capture=True)
-
-                        #puts('\n[MAIN] BASEACKs %s %s\n' % (baseACK1, baseACK2))
-
-                        # Now extract all ACK sequence numbers, normalised to baseACK{1,2}
-
-                        local(
-                            'zcat %s | tcpdump -S -tt -nr - "%s" | '
-                            'awk \'{ FS=" " ; for(i=2;i<=NF;i++) { if ( $i  == "ack") { print $1 " " $(i+1) - %s }  } ; }\' | sed \'s/,//\'  > %s' %
-                            (dump2, filter1, baseACK1, out_acks1))
-                        local(
-                            'zcat %s | tcpdump -S -tt -nr - "%s" | '
-                            'awk \'{ FS=" " ; for(i=2;i<=NF;i++) { if ( $i  == "ack") { print $1 " " $(i+1) - %s }  } ; }\' | sed \'s/,//\'  > %s' %
-                            (dump1, filter2, baseACK2, out_acks2))
+                        # ACK sequence numbers are normalised to the first ACK 
+                        # (no need to read files without packets of the flow)
+                        if flow_has_packets(dump2, *filter1):
+                            demux.add_flow(dump2, filter1, AckSeqConsumer(out_acks1))
+                        else:
+                            open(out_acks1, 'w').close()
+                        if flow_has_packets(dump1, *filter2):
+                            demux.add_flow(dump1, filter2, AckSeqConsumer(out_acks2))
+                        else:
+                            open(out_acks2, 'w').close()
 
                     already_done[long_name] = 1
                     already_done[long_rev_name] = 1
 
-                    if sfil.is_in(name):
-                        if ts_correct == '1':
-                            out_acks1 = adjust_timestamps(test_id, out_acks1, dst, ' ', out_dir)
-
-                        # do the dupACK calculations and burst extraction here,
-                        # return a new vector of one or more filenames, pointing to file(s) containing
-                        # <time> <seq_no> <dupACKs>
-                        #
-                        out_acks1_dups_bursts = extract_dupACKs_bursts(acks_file = out_acks1, 
-                                                          burst_sep = burst_sep)
-                        # Incorporate the extracted .N files
-                        # as a new, expanded set of filenames to be plotted.
-                        # Update the out_files dictionary (key=interim legend name based on flow, value=file)
-                        # and out_groups dictionary (key=file name, value=group)
-                        if burst_sep == 0.0:
-                            # Assume this is a single plot (not broken into bursts)
-                            # The plot_time_series() function expects key to have a single string
-                            # value rather than a vector. Take the first (and presumably only)
-                            # entry in the vector returned by extract_dupACKs_bursts()
-                            out_files[long_name] = out_acks1_dups_bursts[0]
-                            out_groups[out_acks1_dups_bursts[0]] = group
-                        else:
-                            # This trial has been broken into one or more bursts.
-                            # plot_incast_ACK_series() knows how to parse a key having a
-                            # 'vector of strings' value.
-                            # Also filter the selection based on sburst/eburst nominated by user
-                            if eburst == 0 :
-                                eburst = len(out_acks1_dups_bursts)
-                            # Catch case when eburst was set non-zero but also > number of actual bursts
-                            eburst = min(eburst,len(out_acks1_dups_bursts))
-                            if sburst <= 0 :
-                                sburst = 1
-                            # Catch case where sburst set greater than eburst
-                            if sburst > eburst :
-                                sburst = eburst
-
-                            out_files[long_name] = out_acks1_dups_bursts[sburst-1:eburst]
-                            for tmp_f in out_acks1_dups_bursts[sburst-1:eburst] :
-                                out_groups[tmp_f] = group
-
-                    if sfil.is_in(rev_name):
-                        if ts_correct == '1':
-                            out_acks2 = adjust_timestamps(test_id, out_acks2, src, ' ', out_dir)
-
-                        # do the dupACK calculations burst extraction here
-                        # return a new vector of one or more filenames, pointing to file(s) containing
-                        # <time> <seq_no> <dupACKs>
-                        #
-                        out_acks2_dups_bursts = extract_dupACKs_bursts(acks_file = out_acks2, 
-                                                          burst_sep = burst_sep)
-
-                        # Incorporate the extracted .N files
-                        # as a new, expanded set of filenames to be plotted.
-                        # Update the out_files dictionary (key=interim legend name based on flow, value=file)
-                        # and out_groups dictionary (key=file name, value=group)
-                        if burst_sep == 0.0:
-                            # Assume this is a single plot (not broken into bursts)
-                            # The plot_time_series() function expects key to have a single string
-                            # value rather than a vector. Take the first (and presumably only)
-                            # entry in the vector returned by extract_dupACKs_bursts()
-                            out_files[long_rev_name] = out_acks2_dups_bursts[0]
-                            out_groups[out_acks2_dups_bursts[0]] = group
-                        else:
-                            # This trial has been broken into bursts.
-                            # plot_incast_ACK_series() knows how to parse a key having a
-                            # 'vector of strings' value.
-                            # Also filter the selection based on sburst/eburst nominated by user
-                            if eburst == 0 :
-                                eburst = len(out_acks2_dups_bursts)
-                            # Catch case when eburst was set non-zero but also > number of actual bursts
-                            eburst = min(eburst,len(out_acks2_dups_bursts))
-                            if sburst <= 0 :
-                                sburst = 1
-                            # Catch case where sburst set greater than eburst
-                            if sburst > eburst :
-                                sburst = eburst
-
-                            out_files[long_rev_name] = out_acks2_dups_bursts[sburst-1:eburst]
-                            for tmp_f in out_acks2_dups_bursts[sburst-1:eburst] :
-                                out_groups[tmp_f] = group
+                    extracted.append((name, long_name, out_acks1, dst, 
+                                      rev_name, long_rev_name, out_acks2, src))
+
+        demux.run()
+        cache.commit()
+
+        for (name, long_name, out_acks1, dst, rev_name, long_rev_name, out_acks2,
+             src) in extracted:
+            if sfil.is_in(name):
+                if ts_correct == '1':
+                    out_acks1 = adjust_timestamps(test_id, out_acks1, dst, ' ', out_dir)
+
+                # do the dupACK calculations and burst extraction here,
+                # return a new vector of one or more filenames, pointing to file(s) containing
+                # <time> <seq_no> <dupACKs>
+                #
+                out_acks1_dups_bursts = extract_dupACKs_bursts(acks_file = out_acks1, 
+                                                  burst_sep = burst_sep,
+                                                  sburst = sburst, eburst = eburst)
+                # Incorporate the extracted .N files
+                # as a new, expanded set of filenames to be plotted.
+                # Update the out_files dictionary (key=interim legend name based on flow, value=file)
+                # and out_groups dictionary (key=file name, value=group)
+                if burst_sep == 0.0:
+                    # Assume this is a single plot (not broken into bursts)
+                    # The plot_time_series() function expects key to have a single string
+                    # value rather than a vector. Take the first (and presumably only)
+                    # entry in the vector returned by extract_dupACKs_bursts()
+                    out_files[long_name] = out_acks1_dups_bursts[0]
+                    out_groups[out_acks1_dups_bursts[0]] = group
+                else:
+                    # This trial has been broken into one or more bursts.
+                    # plot_incast_ACK_series() knows how to parse a key having a
+                    # 'vector of strings' value.
+                    out_files[long_name] = out_acks1_dups_bursts
+                    for tmp_f in out_acks1_dups_bursts:
+                        out_groups[tmp_f] = group
+
+            if sfil.is_in(rev_name):
+                if ts_correct == '1':
+                    out_acks2 = adjust_timestamps(test_id, out_acks2, src, ' ', out_dir)
+
+                # do the dupACK calculations burst extraction here
+                # return a new vector of one or more filenames, pointing to file(s) containing
+                # <time> <seq_no> <dupACKs>
+                #
+                out_acks2_dups_bursts = extract_dupACKs_bursts(acks_file = out_acks2, 
+                                                  burst_sep = burst_sep,
+                                                  sburst = sburst, eburst = eburst)
+
+                # Incorporate the extracted .N files
+                # as a new, expanded set of filenames to be plotted.
+                # Update the out_files dictionary (key=interim legend name based on flow, value=file)
+                # and out_groups dictionary (key=file name, value=group)
+                if burst_sep == 0.0:
+                    # Assume this is a single plot (not broken into bursts)
+                    # The plot_time_series() function expects key to have a single string
+                    # value rather than a vector. Take the first (and presumably only)
+                    # entry in the vector returned by extract_dupACKs_bursts()
+                    out_files[long_rev_name] = out_acks2_dups_bursts[0]
+                    out_groups[out_acks2_dups_bursts[0]] = group
+                else:
+                    # This trial has been broken into bursts.
+                    # plot_incast_ACK_series() knows how to parse a key having a
+                    # 'vector of strings' value.
+                    out_files[long_rev_name] = out_acks2_dups_bursts
+                    for tmp_f in out_acks2_dups_bursts:
+                        out_groups[tmp_f] = group
 
         # if desired compute aggregate acked bytes for each experiment
         # XXX only do this for burst_sep=0 now
         if burst_sep == 0.0 and total_per_experiment == '1':
 
-            aggregated = {}
-
-            # first read everything in one dictionary indexed by time
-            flow = 0
+            files_list = []
             for name in out_files:
                 if out_groups[out_files[name]] == group:
-                    with open(out_files[name], 'r') as f:
-                        lines = f.readlines()
-                        for line in lines:
-                            fields = line.split()
-                            curr_time = float(fields[0])
-                            if curr_time not in aggregated:
-                                aggregated[curr_time] = [] 
-                            aggregated[curr_time].append((flow, int(fields[1]), int(fields[2])))
-
-                    flow += 1
-
-            total = {} # total cumulative values 
-            last_flow_val = {} # last values per flow (ackbyte, dupack) tuples
-            last_val = (0, 0)  # value from last time
-
-            # second go through by time and total 
-            for t in sorted(aggregated.keys()):
-
-                # if there is no entry for time t, then create one
-                if t not in total:
-                    total[t] = last_val # start with the last value (cumulative total) 
- 
-                # get delta values for ackbytes and dupacks for each value and add
-                for (flow, cum_byte, cum_ack) in aggregated[t]:
+                    files_list.append(out_files[name])
 
-                    #print(t, flow, cum_byte, cum_ack)
-
-                    if flow in last_flow_val:
-                        byte = cum_byte - last_flow_val[flow][0]
-                        ack = cum_ack - last_flow_val[flow][1]
-                    else:
-                        byte = cum_byte
-                        ack = cum_ack
-
-                    #if flow in last_flow_val:
-                    #    print(cum_byte, last_flow_val[flow][0], byte)
-
-                    # add delta values to value at current time t
-                    total[t] = (total[t][0] + byte, total[t][1] + ack) 
- 
-                    # memorise last value
-                    last_flow_val[flow] = (cum_byte, cum_ack)
-
-                last_val = total[t]
-
-            # write output file
+            # merge the files by time and add up the cumulative ACKed bytes
+            # and dupACKs of all flows
             out_acks1 = out_dirname + test_id + '_total' + ofile_ext
-            with open(out_acks1, 'w') as f:
-                for t in sorted(total.keys()):
-                    f.write('%f %i %i\n' % (t, total[t][0], total[t][1]))
+            merge_totals(files_list, out_acks1, 2, '%f %i %i\n')
 
             # replace all files for separate flows with total
             delete_list = []
@@ -4041,6 +4678,8 @@ def _extract_ackseq(test_id='', out_dir='', replot_only='0', source_filter='',
 
         group += 1
 
+    record_out_files(out_files, source_filter)
+
     return (test_id_arr, out_files, out_groups)
 
 
@@ -4200,23 +4839,20 @@ def analyse_goodput(test_id='', out_dir='', replot_only='0', source_filter='',
     yaxisscale = 0.008 
     oname = '_goodput'
 
-    # ackseq always delivers cumulative values, instruct plot code to use the
-    # differences
-    plot_params = plot_params + 'DIFF=1'
-
     if total_per_experiment == '0':
         sort_flowkey='1'
     else:
         sort_flowkey='0'
 
     # Regular plots, each trial has one file containing data
+    # (ackseq always delivers cumulative values, so plot the differences)
     plot_time_series(out_name, out_files, yaxistitle, ycolumn, yaxisscale, 'pdf',
                      out_name + oname, pdf_dir=pdf_dir, aggr='1',
                      omit_const=omit_const, ymin=float(ymin), ymax=float(ymax),
                      lnames=lnames, stime=stime, etime=etime, groups=out_groups,
                      sort_flowkey=sort_flowkey,
                      plot_params=plot_params, plot_script=plot_script,
-                     source_filter=source_filter)
+                     source_filter=source_filter, diff='1')
 
     # done
     puts('\n[MAIN] COMPLETED plotting ackseq %s \n' % out_name)
@@ -4275,6 +4911,8 @@ def analyse_goodput(test_id='', out_dir='', replot_only='0', source_filter='',
 #  @param slowest_only '0' plot all response times (metric restime)
 #                      '1' plot only the slowest response times for each burst
 #  @param query_host Name of querier (only for iqtime metric)
+#  @param jobs Number of worker processes used to extract the experiments
+#              in parallel (default is 1)
 # NOTE: that xmin, xmax, ymin and ymax don't just zoom, but govern the selection of data points
 #       used for the density estimation. this is how ggplot2 works by default, although possibly
 #       can be changed
@@ -4287,7 +4925,7 @@ def analyse_2d_density(exp_list='experiments_completed.txt', res_dir='', out_dir
                    plot_params='', plot_script='', xstat_index='', ystat_index='',
                    dupacks='0', cum_ackseq='1', merge_data='0', 
                    sburst='1', eburst='0', test_id_prefix='[0-9]{8}\-[0-9]{6}_experiment_',
-                   slowest_only='0', query_host=''):
+                   slowest_only='0', query_host='', jobs='1'):
     "Bubble plot for different experiments"
 
     test_id_pfx = ''
@@ -4321,29 +4959,9 @@ def analyse_2d_density(exp_list='experiments_completed.txt', res_dir='', out_dir
 
     # if we haven' got the extracted data run extract method(s) first
     if res_dir == '':
-        for experiment in experiments:
-
-            (ex_function, kwargs) = get_extract_function(xmetric, link_len,
-                                    xstat_index, sburst=sburst, eburst=eburst,
-                                    slowest_only=slowest_only, query_host=query_host)
-            
-            (dummy, out_files, out_groups) = ex_function(
-                test_id=experiment, out_dir=out_dir,
-                source_filter=source_filter,
-                replot_only=replot_only,
-                ts_correct=ts_correct,
-                **kwargs)
-
-            (ex_function, kwargs) = get_extract_function(ymetric, link_len,
-                                    ystat_index, sburst=sburst, eburst=eburst,
-                                    slowest_only=slowest_only, query_host=query_host)
-   
-            (dummy, out_files, out_groups) = ex_function(
-                test_id=experiment, out_dir=out_dir,
-                source_filter=source_filter,
-                replot_only=replot_only,
-                ts_correct=ts_correct,
-                **kwargs)
+        extract_experiments(experiments, [ (xmetric, xstat_index), (ymetric, ystat_index) ],
+                            jobs, out_dir, source_filter, replot_only, ts_correct,
+                            smoothed, link_len, sburst, eburst, slowest_only, query_host)
 
         if out_dir == '' or out_dir[0] != '/':
             res_dir = dir_name + '/' + out_dir
@@ -4366,19 +4984,12 @@ def analyse_2d_density(exp_list='experiments_completed.txt', res_dir='', out_dir
         mkdir_p(pdf_dir)
 
     #
-    # build match string from variables
-    #
-
-    (match_str, match_str2) = build_match_strings(experiments[0], variables,
-                                  test_id_prefix)
-
-    #
-    # filter out the experiments to plot, generate x-axis labels, get test id prefix
+    # select the experiments to plot, get test id prefix
     #
 
     (fil_experiments,
      test_id_pfx,
-     dummy) = filter_experiments(experiments, match_str, match_str2)
+     dummy) = select_experiments(res_dir, experiments, variables, test_id_prefix)
 
     #
     # get groups based on group_by variable
@@ -4445,49 +5056,13 @@ def analyse_2d_density(exp_list='experiments_completed.txt', res_dir='', out_dir
     x_files = []
     y_files = []
     for experiment in fil_experiments:
-        _x_files = []
-        _y_files = []
-        _x_ext = x_ext
-        _y_ext = y_ext
-
-        _files = get_testid_file_list('', experiment, _x_ext,
-                                      'LC_ALL=C sort', res_dir)
-        if merge_data == '1':
-            _x_ext += '.all'
-            _files = merge_data_files(_files)
-        _x_files += _files
-
-        _files = get_testid_file_list('', experiment, _y_ext,
-                                      'LC_ALL=C sort', res_dir)
-        if merge_data == '1':
-            _y_ext += '.all'
-            _files = merge_data_files(_files)
-        _y_files += _files
-
-        match_str = '.*_([0-9\.]*_[0-9]*_[0-9\.]*_[0-9]*)[0-9a-z_.]*' + _x_ext
-        for f in _x_files:
-            #print(f)
-            res = re.search(match_str, f)
-            #print(res.group(1))
-            if res and sfil.is_in(res.group(1)):
-                # only add file if enough data points
-                rows = int(
-                    local('wc -l %s | awk \'{ print $1 }\'' %
-                          f, capture=True))
-                if rows > int(min_values):
-                    x_files.append(f)
-   
-        match_str = '.*_([0-9\.]*_[0-9]*_[0-9\.]*_[0-9]*)[0-9a-z_.]*' + _y_ext
-        for f in _y_files:
-            # print(f)
-            res = re.search(match_str, f)
-            if res and sfil.is_in(res.group(1)):
-                # only add file if enough data points
-                rows = int(
-                    local('wc -l %s | awk \'{ print $1 }\'' %
-                          f, capture=True))
-                if rows > int(min_values):
-                    y_files.append(f)
+        _x_files = get_exp_data_files(res_dir, experiment, x_ext, sfil, min_values,
+                                      merge_data, len(source_filter.split(';')))
+        x_files += sorted(_x_files.values())
+
+        _y_files = get_exp_data_files(res_dir, experiment, y_ext, sfil, min_values,
+                                      merge_data, len(source_filter.split(';')))
+        y_files += sorted(_y_files.values())
 
     yindexes = [str(x_axis_params[2]), str(y_axis_params[2])]
     yscalers = [str(x_axis_params[3]), str(y_axis_params[3])]
@@ -4520,15 +5095,15 @@ def analyse_2d_density(exp_list='experiments_completed.txt', res_dir='', out_dir
         plot_script = 'R CMD BATCH --vanilla %s/plot_contour.R' % config.TPCONF_script_path
 
     #local('which R')
-    local('TITLE="%s" XFNAMES="%s" YFNAMES="%s", LNAMES="%s" XLAB="%s" YLAB="%s" YINDEXES="%s" '
+    run_plot_script('TITLE="%s" XFNAMES="%s" YFNAMES="%s", LNAMES="%s" XLAB="%s" YLAB="%s" YINDEXES="%s" '
           'YSCALERS="%s" XSEP="%s" YSEP="%s" OTYPE="%s" OPREFIX="%s" ODIR="%s" AGGRS="%s" '
-          'DIFFS="%s" XMIN="%s" XMAX="%s" YMIN="%s" YMAX="%s" GROUPS="%s" %s '
-          '%s %s%s_plot_contour.Rout' %
+          'DIFFS="%s" XMIN="%s" XMAX="%s" YMIN="%s" YMAX="%s" GROUPS="%s" %s' %
           (title, ','.join(x_files), ','.join(y_files), ','.join(leg_names),
            x_axis_params[1], y_axis_params[1], ','.join(yindexes), ','.join(yscalers),
            x_axis_params[4], y_axis_params[4], 'pdf', oprefix, pdf_dir, ','.join(aggr_flags),
            ','.join(diff_flags), xmin, xmax, ymin, ymax, ','.join([str(x) for x in groups]), 
-           plot_params, plot_script, pdf_dir, oprefix))
+           plot_params),
+          plot_script, '%s%s_plot_contour.Rout' % (pdf_dir, oprefix))
 
     if config.TPCONF_debug_level == 0:
         local('rm -f %s%s_plot_contour.Rout' % (pdf_dir, oprefix))
@@ -4588,6 +5163,8 @@ def _extract_incast_iqtimes(test_id='', out_dir='', replot_only='0', source_filt
     # Initialise source filter data structure
     sfil = SourceFilter(source_filter)
 
+    cache = ExtractCache('extract_incast_iqtimes', replot_only)
+
     group = 1
     for test_id in test_id_arr:
 
@@ -4604,10 +5181,9 @@ def _extract_incast_iqtimes(test_id='', out_dir='', replot_only='0', source_filt
                 # ignore all dump files not taken at query host
                 continue
 
-            # tcpdump filters and output file names
-            # 'tcp[tcpflags] & tcp-push != 0' rule to extract only packets with push flag set (eliminate SYN, FIN, or ACKs
+            # only packets with push flag set are used (like tcpdump filter
+            # 'tcp[tcpflags] & tcp-push != 0', eliminate SYN, FIN, or ACKs
             # without data)
-            filter1 = 'tcp[tcpflags] & tcp-push != 0'
 
             (dummy, query_host_internal) = get_address_pair_analysis(test_id, query_host, do_abort='0') 
             flow_name = query_host_internal + '_0_0.0.0.0_0'
@@ -4615,14 +5191,14 @@ def _extract_incast_iqtimes(test_id='', out_dir='', replot_only='0', source_filt
             out1 = out_dirname + name + ofile_ext
 
             if name not in already_done:
-                if replot_only == '0' or not (os.path.isfile(out1)):
+                if cache.need_update([ out1 ], [ tcpdump_file ]):
 
-                    # Use "-A" option to tcpdump so we get the payload bytes and can check for GET 
-                    # XXX this command fails if default snap length is changed because of the magic -B 4
-                    local(
-                       'zcat %s | tcpdump -A -tt -nr - "%s" | grep -B 5 "GET" | egrep "IP" | '
-                       'awk \'{ print $1 " " $5; }\' | sed \'s/\.\([0-9]*\):/ \\1/\'  > %s' %
-                       (tcpdump_file, filter1, out1))
+                    # Use the payload bytes to check for GET 
+                    # XXX this fails if default snap length is changed because of the magic -B 5
+                    demux = PcapDemux()
+                    demux.add_all(tcpdump_file, IncastQueryConsumer(out1))
+                    demux.run()
+                    cache.commit()
 
                 already_done[name] = 1
 
@@ -4634,7 +5210,8 @@ def _extract_incast_iqtimes(test_id='', out_dir='', replot_only='0', source_filt
                         # all responders in in one output file
                         out_name = out1 + '.all'
 
-                        if replot_only == '0' or not (os.path.isfile(out_name)):
+                        if cache.need_update([ out_name ], [ out1 ], 
+                                             (cumulative, burst_sep)):
                             last_time = 0.0
                             burst_start = 0.0
                             cum_time = 0.0 
@@ -4666,6 +5243,7 @@ def _extract_incast_iqtimes(test_id='', out_dir='', replot_only='0', source_filt
                                     last_time = float(time)
 
                             out_f.close()
+                            cache.commit()
 
                         out_files[name] = out_name
                         out_groups[out_name] = group
@@ -4726,6 +5304,7 @@ def _extract_incast_iqtimes(test_id='', out_dir='', replot_only='0', source_filt
         else:
             group = 1
 
+    record_out_files(out_files, source_filter)
 
     return (test_id_arr, out_files, out_groups)
 
@@ -4880,6 +5459,8 @@ def _extract_incast_restimes(test_id='', out_dir='', replot_only='0', source_fil
     # Initialise source filter data structure
     sfil = SourceFilter(source_filter)
 
+    cache = ExtractCache('extract_incast_restimes', replot_only)
+
     group = 1
     for test_id in test_id_arr:
 
@@ -4888,6 +5469,12 @@ def _extract_incast_restimes(test_id='', out_dir='', replot_only='0', source_fil
                                        ifile_ext,
                                        'grep -v "router.dmp.gz" | grep -v "ctl.dmp.gz"')
 
+        # the packets of all responders are extracted in one pass over the 
+        # tcpdump file
+        demux = PcapDemux()
+        restimes = []
+        extracted = []
+
         for tcpdump_file in tcpdump_files:
             # get input directory name and create result directory if necessary
             out_dirname = get_out_dir(tcpdump_file, out_dir)
@@ -4898,16 +5485,7 @@ def _extract_incast_restimes(test_id='', out_dir='', replot_only='0', source_fil
                 continue
 
             # unique flows
-            flows = lookup_flow_cache(tcpdump_file)
-            if flows == None:
-                flows = _list(local('zcat %s | tcpdump -nr - "tcp" | '
-                                'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " tcp" } }\' | '
-                                'sed "s/://" | '
-                                'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                'LC_ALL=C sort -u' %
-                                tcpdump_file, capture=True))
-
-                append_flow_cache(tcpdump_file, flows)
+            flows = get_flows(tcpdump_file, 'tcp')
 
             # since client sends first packet to server, client-to-server flows
             # will always be first
@@ -4936,71 +5514,68 @@ def _extract_incast_restimes(test_id='', out_dir='', replot_only='0', source_fil
                 else:
                     long_name = name
 
-                # the two dump files
+                # the dump file
                 dump1 = dir_name + '/' + test_id + '_' + src + ifile_ext
 
-                # tcpdump filters and output file names
-                # 'tcp[tcpflags] & tcp-push != 0' rule to extract only packets with push flag set 
-                # (eliminate SYN, FIN, or ACKs without data)
-                filter1 = 'host ' + dst_internal + ' && port ' + dst_port + \
-                    ' && tcp[tcpflags] & tcp-push != 0'
-
-                out1_tmp = out_dirname + test_id + '_' + name + ofile_ext + '.tmp'
+                # packets of the flow with push flag set are used (like tcpdump filter 
+                # 'host <dst> && port <dport> && tcp[tcpflags] & tcp-push != 0',
+                # eliminate SYN, FIN, or ACKs without data)
                 out1 = out_dirname + test_id + '_' + name + ofile_ext
                 
                 if long_name not in already_done:
-                    if replot_only == '0' or not ( os.path.isfile(out1) ):
+                    if cache.need_update([ out1 ], [ dump1 ]):
  
-                        # Use "-A" option to tcpdump so we get the payload bytes 
-                        # XXX this falls apart if snap size is not the default because of the magic -B 8
-                        local(
-                            'zcat %s | tcpdump -A -tt -nr - "%s" | grep -B 10 "GET" | egrep "IP" | '
-                            'awk \'{ print $1 " " $3 " " $5; }\' | sed \'s/://\' > %s' %
-                            (dump1, filter1, out1_tmp))
-                        # get the last line, assume this is last packet of last request
-                        local('zcat %s | tcpdump -tt -nr - "%s" | tail -1 | '
-                              'awk \'{ print $1 " " $3 " " $5; }\' | sed \'s/://\' >> %s' % 
-                            (dump1, filter1, out1_tmp))
-
-                        # compute response times from each GET packet and corresponding final data packet
-                        out_f = open(out1, 'w')
-                        with open(out1_tmp) as f:
-                            lines = f.readlines()
-                            cnt = 0
-                            last_src = ''
-                            for line in lines:
-                                fields = line.split()
-                                if cnt % 2 == 0:
-                                    # request
-			            req_time = float(line.split()[0])
-                                elif fields[1] != last_src:
-                                    # response, unless the source is the same as for the last packet
-                                    # (then we possibly have no response)
-                                    res_time = float(fields[0]) - req_time
-                                    out_f.write('%f %i %s %s %s\n' %  (req_time, int(cnt/2) + 1, fields[2], 
-                                                                       fields[1], res_time))
-
-                                last_src = fields[1] 
-                                cnt += 1
-
-                        out_f.close()
-                        os.remove(out1_tmp)
+                        # Use the payload bytes to find the GET packets and the last packet 
+                        # before each GET, the last packet is assumed to be the last packet 
+                        # of the last request
+                        # XXX this falls apart if snap size is not the default because of the magic -B 10
+                        consumer = IncastResponseConsumer()
+                        demux.add_host_port(dump1, dst_internal, dst_port, consumer)
+                        restimes.append((out1, consumer))
 
                     already_done[long_name] = 1
 
-                    if sfil.is_in(name):
-                        if ts_correct == '1':
-                            out1 = adjust_timestamps(test_id, out1, dst, ' ', out_dir)
+                    extracted.append((name, long_name, out1, dst))
 
-                        out_files[long_name] = out1 
-                        out_groups[out1] = group
+        demux.run()
+
+        for (out1, consumer) in restimes:
+            # compute response times from each GET packet and corresponding final data packet
+            out_f = open(out1, 'w')
+            cnt = 0
+            last_src = ''
+            for line in consumer.lines:
+                fields = line.split()
+                if cnt % 2 == 0:
+                    # request
+                    req_time = float(line.split()[0])
+                elif fields[1] != last_src:
+                    # response, unless the source is the same as for the last packet
+                    # (then we possibly have no response)
+                    res_time = float(fields[0]) - req_time
+                    out_f.write('%f %i %s %s %s\n' %  (req_time, int(cnt/2) + 1, fields[2], 
+                                                       fields[1], res_time))
+
+                last_src = fields[1] 
+                cnt += 1
+
+            out_f.close()
+
+        cache.commit()
+
+        for (name, long_name, out1, dst) in extracted:
+            if sfil.is_in(name):
+                if ts_correct == '1':
+                    out1 = adjust_timestamps(test_id, out1, dst, ' ', out_dir)
+
+                out_files[long_name] = out1 
+                out_groups[out1] = group
 
         # check for consistency and abort if we see less response times for one responder
         max_cnt = 0
         for name in out_files:
             if out_groups[out_files[name]] == group:
-                cnt = int(local('wc -l %s | awk \'{ print $1 }\'' %
-                                out_files[name], capture=True)) 
+                cnt = get_file_meta(out_files[name]).rows
                 if max_cnt > 0 and cnt < max_cnt:
                     abort('Responder timed out in experiment %s' % test_id)
                 if cnt > max_cnt:
@@ -5012,6 +5587,7 @@ def _extract_incast_restimes(test_id='', out_dir='', replot_only='0', source_fil
         (out_files, out_groups) = get_slowest_response_time(out_files, out_groups,
                                   int(slowest_only) - 1)
 
+    record_out_files(out_files, source_filter)
 
     return (test_id_arr, out_files, out_groups)
 
@@ -5066,6 +5642,8 @@ def _extract_pktloss(test_id='', out_dir='', replot_only='0', source_filter='',
 
     #local('which pktloss.py')
 
+    cache = ExtractCache('extract_pktloss', replot_only)
+
     group = 1
     for test_id in test_id_arr:
 
@@ -5080,22 +5658,7 @@ def _extract_pktloss(test_id='', out_dir='', replot_only='0', source_filter='',
             dir_name = os.path.dirname(tcpdump_file)
 
             # get unique flows
-            flows = lookup_flow_cache(tcpdump_file)
-            if flows == None:
-                flows = _list(local('zcat %s | tcpdump -nr - "tcp" | '
-                                'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " tcp" } }\' | '
-                                'sed "s/://" | '
-                                'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                'LC_ALL=C sort -u' %
-                                tcpdump_file, capture=True))
-                flows += _list(local('zcat %s | tcpdump -nr - "udp" | '
-                                 'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " udp" } }\' | '
-                                 'sed "s/://" | '
-                                 'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                 'LC_ALL=C sort -u' %
-                                 tcpdump_file, capture=True))
-
-                append_flow_cache(tcpdump_file, flows)
+            flows = get_flows(tcpdump_file)
 
             # since client sends first packet to server, client-to-server flows
             # will always be first
@@ -5138,8 +5701,7 @@ def _extract_pktloss(test_id='', out_dir='', replot_only='0', source_filter='',
                     out_loss = out_dirname + test_id + '_' + name + ofile_ext
                     rev_out_loss = out_dirname + test_id + '_' + rev_name + ofile_ext
 
-                    if replot_only == '0' or not ( os.path.isfile(out_loss) and \
-                                                   os.path.isfile(rev_out_loss) ):
+                    if cache.need_update([ out_loss, rev_out_loss ], [ dump1, dump2 ]):
                         # compute loss 
                         local(
                             'pktloss.py -t %s -T %s -f %s > %s' %
@@ -5147,6 +5709,7 @@ def _extract_pktloss(test_id='', out_dir='', replot_only='0', source_filter='',
                         local(
                             'pktloss.py -t %s -T %s -f %s > %s' %
                             (dump2, dump1, filter2, rev_out_loss))
+                        cache.commit()
 
                     already_done[long_name] = 1
                     already_done[long_rev_name] = 1
@@ -5166,9 +5729,42 @@ def _extract_pktloss(test_id='', out_dir='', replot_only='0', source_filter='',
 
         group += 1
 
+    record_out_files(out_files, source_filter)
+
     return (test_id_arr, out_files, out_groups)
 
 
+## Build flow indexes for tcpdump files. For each tcpdump file an index with the
+## packet offsets and timestamps of each flow is created, so subsequent extracts
+## only decode the packets of the flows they need. Indexes are also built the
+## first time an extract reads a tcpdump file, this task builds them in advance.
+#  @param test_id Semicolon-separated list of test ID prefixes of experiments
+#  @param force '0' only build index if there is no valid index,
+#               '1' always rebuild index
+#  @param copy '0' read indexed packets from the compressed tcpdump files (default),
+#              '1' also create uncompressed copies of the tcpdump files, so
+#              indexed packets are read with seeks (needs more disk space)
+@task
+def build_flow_index(test_id='', force='0', copy='0'):
+    "Build per-flow packet index for tcpdump files"
+
+    test_id_arr = test_id.split(';')
+    if len(test_id_arr) == 0 or test_id_arr[0] == '':
+        abort('Must specify test_id parameter')
+
+    for test_id in test_id_arr:
+        tcpdump_files = get_testid_file_list('', test_id, '.dmp.gz', '')
+
+        for tcpdump_file in tcpdump_files:
+            index = load_index(tcpdump_file)
+            if force == '1' or index == None or \
+               (copy == '1' and index.get_pcap_file(tcpdump_file) == tcpdump_file):
+                build_index(tcpdump_file, copy == '1')
+
+    # done
+    puts('\n[MAIN] COMPLETED building flow index %s \n' % test_id)
+
+
 ## Extract packet loss for flows
 ## SEE _extract_pktloss()
 @task
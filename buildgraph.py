@@ -0,0 +1,185 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package buildgraph
+# Make-like execution of analysis jobs. Each node of the graph is a job (see
+# jobpool) that declares its input files, its output files and the nodes it
+# depends on. A node is only executed if it is stale, i.e. one of its outputs
+# is missing or older than one of its inputs, the parameters of the job changed
+# since it was last executed, or a node it depends on was executed. Nodes
+# without outputs are always executed. Independent nodes are executed
+# concurrently.
+#
+# The outputs of a node include a stamp file that is written by the graph after
+# the job has been executed successfully and contains the job's parameters.
+# The outputs of the nodes a node depends on are inputs of the node.
+#
+# $Id$
+
+import os
+from fabric.api import puts, abort
+from jobpool import run_jobs
+
+
+## Node of a build graph
+class Node:
+
+    ## Create node
+    #  @param job Job executed for the node
+    #  @param inputs List of input file names
+    #  @param outputs List of output file names
+    #  @param stamp Name of stamp file (no stamp file if empty)
+    #  @param deps List of nodes this node depends on
+    def __init__(self, job, inputs=[], outputs=[], stamp='', deps=[]):
+        self.job = job
+        self.inputs = inputs
+        self.outputs = outputs
+        self.stamp = stamp
+        self.deps = deps
+
+    def __str__(self):
+        return str(self.job)
+
+    ## Get all output file names including the stamp file
+    #  @return List of output file names
+    def get_outputs(self):
+        if self.stamp != '':
+            return self.outputs + [ self.stamp ]
+
+        return self.outputs
+
+    ## Get parameters of the job as stored in the stamp file
+    #  @return Parameter string
+    def get_params(self):
+        return repr((self.job.module, self.job.name, self.job.args,
+                     sorted(self.job.kwargs.items()))) + '\n'
+
+    ## Write stamp file (under a temporary name first, so an interrupted write
+    ## never leaves a valid stamp file)
+    def write_stamp(self):
+        if self.stamp == '':
+            return
+
+        tmp_name = '%s.%i' % (self.stamp, os.getpid())
+        try:
+            with open(tmp_name, 'w') as f:
+                f.write(self.get_params())
+            os.rename(tmp_name, self.stamp)
+        except (IOError, OSError) as e:
+            abort('Cannot write stamp file %s: %s' % (self.stamp, str(e)))
+
+    ## Check whether node must be executed
+    #  @param executed Set of nodes that have been executed
+    #  @return True if node is stale, otherwise False
+    def is_stale(self, executed):
+        outputs = self.get_outputs()
+        if len(outputs) == 0:
+            return True
+
+        # a node is also stale if a node it depends on was executed
+        for dep in self.deps:
+            if dep in executed:
+                return True
+
+        try:
+            oldest = min([ os.stat(fname).st_mtime for fname in outputs ])
+        except OSError:
+            # output missing
+            return True
+
+        inputs = list(self.inputs)
+        for dep in self.deps:
+            inputs += dep.get_outputs()
+
+        for fname in inputs:
+            try:
+                if os.stat(fname).st_mtime > oldest:
+                    return True
+            except OSError:
+                # input missing, the job decides what to do
+                return True
+
+        if self.stamp != '':
+            try:
+                with open(self.stamp) as f:
+                    if f.read() != self.get_params():
+                        return True
+            except IOError:
+                return True
+
+        return False
+
+
+## Build graph
+class BuildGraph:
+
+    def __init__(self):
+        self.nodes = []
+
+    ## Add node to graph
+    #  @param job Job executed for the node
+    #  @param inputs List of input file names
+    #  @param outputs List of output file names
+    #  @param stamp Name of stamp file (no stamp file if empty)
+    #  @param deps List of nodes the new node depends on (must have been added
+    #              before)
+    #  @return New node
+    def add(self, job, inputs=[], outputs=[], stamp='', deps=[]):
+        node = Node(job, inputs, outputs, stamp, deps)
+        self.nodes.append(node)
+        return node
+
+    ## Execute all stale nodes. Nodes are executed in waves, each wave consists
+    ## of the nodes whose dependencies have all been processed.
+    #  @param jobs Number of worker processes
+    def run(self, jobs='1'):
+        processed = set()
+        executed = set()
+        remaining = list(self.nodes)
+        skipped = 0
+
+        while len(remaining) > 0:
+            ready = [ node for node in remaining 
+                      if len([ dep for dep in node.deps if dep not in processed ]) == 0 ]
+            if len(ready) == 0:
+                abort('Build graph has cyclic dependencies: %s' %
+                      ', '.join([ str(node) for node in remaining ]))
+
+            stale = [ node for node in ready if node.is_stale(executed) ]
+            skipped += len(ready) - len(stale)
+
+            # run_jobs aborts if a job failed, so no stamp file is written for
+            # the jobs of a failed wave
+            run_jobs([ node.job for node in stale ], jobs)
+
+            for node in stale:
+                node.write_stamp()
+            executed.update(stale)
+            processed.update(ready)
+            remaining = [ node for node in remaining if node not in processed ]
+
+        if skipped > 0:
+            puts('Skipped %i up-to-date jobs' % skipped)
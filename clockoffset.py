@@ -41,15 +41,22 @@
 
 import os
 import socket
-import csv
 import tempfile
-import imp
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+import re
+import struct
+from multiprocessing import Pool, cpu_count, current_process
 from subprocess import *
 from fabric.api import task, warn, put, puts, get, local, run, execute, \
     settings, abort, hosts, env, runs_once, parallel
 import config
+from extractcache import ExtractCache
+from pcapreader import PcapReader, IPPROTO_ICMP
 from internalutil import _list, mkdir_p
 from filefinder import get_testid_file_list
+from oldconfig import get_old_config
 
 ## Create safe place to dump output from stderr of various shell processes
 stderrhack = os.tmpfile()
@@ -60,8 +67,119 @@ CLOCK_OFFSET_FILE_EXT = '_clock_offsets.txt'
 ## Extension for modified data file
 DATA_CORRECTED_FILE_EXT = '.tscorr'
 
-## Temporary unzipped config
-TMP_CONF_FILE = '___oldconfig.py'
+## Number of lines of a data file corrected at once
+CORRECT_CHUNK_LINES = 65536
+
+
+## Read timestamps of broadcast pings from tcpdump file
+#  @param tcpdump_file tcpdump file of control interface
+#  @param bc_addr Broadcast or multicast address pinged
+#  @param pkt_filter tcpdump filter string (if not empty tcpdump is used to
+#                    read the file)
+#  @return Pair of list of ICMP sequence numbers and list of timestamps
+#          (as printed by tcpdump -tt)
+def read_ping_times(tcpdump_file, bc_addr, pkt_filter=''):
+    seqs = array('l')
+    times = []
+
+    if pkt_filter == '':
+        # only ICMP echo request/reply have sequence numbers
+        reader = PcapReader(tcpdump_file)
+        for pkt in reader.packets():
+            if pkt.proto != IPPROTO_ICMP or pkt.dst != bc_addr or \
+               pkt.payload_off is None or ord(pkt.data[pkt.payload_off]) not in (0, 8):
+                continue
+            seqs.append(struct.unpack_from('!H', pkt.data, pkt.payload_off + 6)[0])
+            times.append(pkt.ts())
+        reader.close()
+    else:
+        # user-specified filter, so pipe through tcpdump
+        init_zcat = Popen(['zcat ' + tcpdump_file], stdin=None,
+                          stdout=PIPE, stderr=stderrhack, shell=True)
+        init_tcpdump = Popen(['tcpdump -tt -r - -n ' + pkt_filter],
+                             stdin=init_zcat.stdout,
+                             stdout=PIPE,
+                             stderr=stderrhack,
+                             shell=True)
+
+        for line in init_tcpdump.stdout:
+            fields = line.split(' ')
+            seqs.append(int(fields[11].replace(',', '')))
+            times.append(fields[0])
+        init_tcpdump.wait()
+
+    # sort by sequence number, for duplicate sequence numbers the last
+    # timestamp counts
+    order = sorted(range(len(seqs)), key=seqs.__getitem__)
+    sorted_seqs = array('l')
+    sorted_times = []
+    for i in order:
+        if len(sorted_seqs) > 0 and sorted_seqs[-1] == seqs[i]:
+            sorted_times[-1] = times[i]
+        else:
+            sorted_seqs.append(seqs[i])
+            sorted_times.append(times[i])
+
+    return (sorted_seqs, sorted_times)
+
+
+## Wrapper for read_ping_times() used by worker processes
+#  @param args Tuple of parameters
+#  @return See read_ping_times()
+def _read_ping_times(args):
+    return read_ping_times(*args)
+
+
+## Read timestamps of broadcast pings from tcpdump files in parallel
+#  @param tcpdump_files List of tcpdump files of control interfaces
+#  @param bc_addr Broadcast or multicast address pinged
+#  @param pkt_filter tcpdump filter string (if not empty tcpdump is used)
+#  @param jobs Number of worker processes ('0' means one per CPU)
+#  @return List of (sequence numbers, timestamps) pairs, one per file
+def read_all_ping_times(tcpdump_files, bc_addr, pkt_filter, jobs='0'):
+    args = [ (tcpdump_file, bc_addr, pkt_filter) for tcpdump_file in tcpdump_files ]
+
+    jobs = int(jobs)
+    if jobs < 1:
+        jobs = cpu_count()
+    jobs = min(jobs, len(args))
+    # worker processes cannot have worker processes themselves
+    if jobs <= 1 or current_process().daemon:
+        return [ _read_ping_times(arg) for arg in args ]
+
+    pool = Pool(jobs)
+    try:
+        results = pool.map(_read_ping_times, args)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        pool.join()
+        abort('Interrupted')
+    pool.join()
+
+    return results
+
+
+## Compute clock offsets of host relative to baseline host
+#  @param ref_seqs Sorted sequence numbers of baseline host
+#  @param ref_times Timestamps of baseline host
+#  @param host_times Pair of sorted sequence numbers and timestamps of host
+#  @return List of offsets formatted for the offset file ('NA' if there is
+#          no timestamp for a sequence number)
+def join_ping_times(ref_seqs, ref_times, host_times):
+    seqs, times = host_times
+    offsets = []
+    i = 0
+    n = len(seqs)
+    for ref_seq, ref_time in zip(ref_seqs, ref_times):
+        while i < n and seqs[i] < ref_seq:
+            i += 1
+        if i < n and seqs[i] == ref_seq:
+            offsets.append('{0:.6f}'.format(float(times[i]) - float(ref_time)))
+        else:
+            offsets.append('NA')
+
+    return offsets
 
 
 ## Get file with time offsets for each experiment host (TASK)
@@ -70,11 +188,13 @@ TMP_CONF_FILE = '___oldconfig.py'
 #  @param pkt_filter tcpdump filter string to filter braoadcast ping packets
 #  @param baseline_host Host we compute offset against (default is first router)
 #  @param out_dir Output directory for results
+#  @param jobs Number of worker processes that read the tcpdump files of
+#              the hosts in parallel (default is '0' which means one per CPU)
 @task
 def get_clock_offsets(exp_list='experiments_completed.txt',
                       test_id='', pkt_filter='',
                       baseline_host='',
-                      out_dir=''):
+                      out_dir='', jobs='0'):
     "Get clock offsets for all hosts"
 
     if len(out_dir) > 0 and out_dir[-1] != '/':
@@ -92,9 +212,6 @@ def get_clock_offsets(exp_list='experiments_completed.txt',
     if len(test_id_arr) == 0 or test_id_arr[0] == '':
         abort('Must specify test_id parameter')
 
-    # specify complete tcpdump parameter list
-    tcpdump_filter = '-tt -r - -n ' + pkt_filter
-
     for test_id in test_id_arr:
         test_id = test_id.rstrip()
 
@@ -110,37 +227,16 @@ def get_clock_offsets(exp_list='experiments_completed.txt',
         # was enabled
 
         dir_name = os.path.dirname(tcpdump_files[0])
-        # then look for tpconf_vars.log.gz file in that directory 
-        var_file = local('find -L %s -name "*tpconf_vars.log.gz"' % dir_name,
-                         capture=True)
+        # then look for old config in that directory 
+        oldconfig = get_old_config(dir_name)
 
-	bc_addr = ''
+        bc_addr = ''
         router = ''
 
-        if len(var_file) > 0:
+        if oldconfig is not None:
             # new approach without using config.py
-            # XXX no caching here yet, assume we only generate clockoffset file once
-            # per experiment 
-
-            # unzip archived file
-            local('gzip -cd %s > %s' % (var_file, TMP_CONF_FILE))
-
-            # load the TPCONF_variables into oldconfig
-            oldconfig = imp.load_source('oldconfig', TMP_CONF_FILE)
-
-            # remove temporary unzipped file 
-            try:
-                os.remove(TMP_CONF_FILE)
-                os.remove(TMP_CONF_FILE + 'c') # remove the compiled file as well
-            except OSError:
-                pass
-
-            try:
-                bc_addr = oldconfig.TPCONF_bc_ping_address
-            except AttributeError:
-                pass
-
-            router_name = oldconfig.TPCONF_router[0].split(':')[0]
+            bc_addr = oldconfig.get('TPCONF_bc_ping_address', '')
+            router_name = oldconfig['TPCONF_router'][0].split(':')[0]
             
         else:
             # old approach using config.py
@@ -156,77 +252,41 @@ def get_clock_offsets(exp_list='experiments_completed.txt',
             # assume default multicast address 
             bc_addr = '224.0.1.199' 
 
-        # specify complete tcpdump parameter list
-        if pkt_filter != '':
-            tcpdump_filter = '-tt -r - -n ' + pkt_filter
-        else:
-            tcpdump_filter = '-tt -r - -n ' + 'icmp and dst host ' + bc_addr
-
         if baseline_host == '':
             baseline_host = router_name 
 
         #
-        # now read timestamps from each host's tcpdump
+        # now read timestamps from each host's tcpdump (in parallel)
         #
 
-        # map of host names (or IPs) and sequence numbers to timestamps
+        hosts = [ re.sub('.*_([a-z0-9\.]*)_ctl.dmp.gz', '\\1', tcpdump_file, 1)
+                  for tcpdump_file in tcpdump_files ]
+        ping_times = read_all_ping_times(tcpdump_files, bc_addr, pkt_filter, jobs)
+
+        # map of host names (or IPs) to sequence numbers and timestamps
+        # (if we have multiple files for a host the last one counts)
         host_times = {}
-        for tcpdump_file in tcpdump_files:
-            host = local(
-                'echo %s | sed "s/.*_\([a-z0-9\.]*\)_ctl.dmp.gz/\\1/"' %
-                tcpdump_file,
-                capture=True)
-            host_times[host] = {}
-            #print(host)
-            #print(host_times)
-
-            # We pipe gzcat through to tcpdump. Note, since tcpdump exits early
-            # (due to "-c num_samples") gzcat's pipe will collapse and gzcat
-            # will complain bitterly. So we dump its stderr to stderrhack.
-            init_zcat = Popen(['zcat ' + tcpdump_file], stdin=None,
-                              stdout=PIPE, stderr=stderrhack, shell=True)
-            init_tcpdump = Popen(['tcpdump ' + tcpdump_filter],
-                                 stdin=init_zcat.stdout,
-                                 stdout=PIPE,
-                                 stderr=stderrhack,
-                                 shell=True)
-
-            for line in init_tcpdump.stdout.read().splitlines():
-                _time = line.split(" ")[0]
-                _seq = int(line.split(" ")[11].replace(',', ''))
-                host_times[host][_seq] = _time
-
-        #print(host_times)
-
-        # get time differences and get host list
-        diffs = {}
-        ref_times = {}
-        host_str = ''
+        for host, times in zip(hosts, ping_times):
+            host_times[host] = times
+
+        # get host list
         host_list = sorted(host_times.keys())
+        host_str = ''.join([ ' ' + host for host in host_list ])
         # getting hosts from the config is problematic if different 
         # experiments with different configs in same directory 
         #host_list = sorted(config.TPCONF_router + config.TPCONF_hosts)
 
-        for host in host_list:
-            host_str += ' ' + host
-            if host not in host_times:
-                continue
-            for seq in sorted(host_times[host].keys()):
-                if seq not in diffs:
-                    diffs[seq] = {}
-                if baseline_host in host_times and seq in host_times[
-                        baseline_host]:
-                    diffs[seq][host] = float(host_times[host][seq]) - \
-                        float(host_times[baseline_host][seq])
-                    ref_times[seq] = host_times[baseline_host][seq]
-                else:
-                    # this should only happen if TPCONF_router was
-                    # modified
-                    warn('Cant find baseline host %s timestamp data' % baseline_host)
-                    diffs[seq][host] = None
-                    ref_times[seq] = None
-
-        #print(diffs)
+        if baseline_host in host_times:
+            ref_seqs, ref_times = host_times[baseline_host]
+        else:
+            # this should only happen if TPCONF_router was modified
+            warn('Cant find baseline host %s timestamp data' % baseline_host)
+            ref_seqs, ref_times = ([], [])
+
+        # columns of the offset table, join each host's timestamps with the
+        # baseline host's timestamps on the sequence numbers
+        columns = [ join_ping_times(ref_seqs, ref_times, host_times[host])
+                    for host in host_list ]
 
         if out_dir == '' or out_dir[0] != '/':
               dir_name = os.path.dirname(tcpdump_files[0])
@@ -234,28 +294,111 @@ def get_clock_offsets(exp_list='experiments_completed.txt',
         mkdir_p(out_dir)
         out_name = out_dir + test_id + CLOCK_OFFSET_FILE_EXT
 
-        # write table of offsets (rows = time, cols = hosts)
-        f = open(out_name, 'w')
+        # write table of offsets (rows = time, cols = hosts). write to temporary
+        # file first, so parallel processes never read an incomplete file
+        f = open(out_name + '.%i' % os.getpid(), 'w')
         f.write('# ref_time' + host_str + '\n')
-        for seq in sorted(diffs.keys()):
-            if ref_times[seq] is not None:
-                f.write(ref_times[seq])
-            else:
-                # this case should not never happen
-                continue
+        for row, ref_time in enumerate(ref_times):
+            f.write(ref_time + ' ' + ' '.join([ column[row] for column in columns ]) +
+                    '\n')
 
-            f.write(' ')
+        f.close()
+        os.rename(out_name + '.%i' % os.getpid(), out_name)
 
-            for host in host_list:
-                if host in diffs[seq] and diffs[seq][host] is not None:
-                    f.write('{0:.6f}'.format(diffs[seq][host]))
-                else:
-                    f.write('NA')
-                if host != host_list[-1]:
-                    f.write(' ')
-            f.write('\n')
 
-        f.close()
+## Clock offset tables. Index is the clock offset file name, value is a pair of
+## the file's modification time and a map of host names to pairs of arrays
+## (reference times, offsets)
+offset_tables = {}
+
+
+## Read table of clock offsets. If there is no offset for a host at a reference
+## time, the last offset measured for the host is used (0 if there is none)
+#  @param offs_fname Clock offset file name
+#  @return Map of host names to pairs of arrays (reference times, offsets)
+def read_offset_table(offs_fname):
+    try:
+        with open(offs_fname) as f:
+            offs_lines = f.read().splitlines()
+    except IOError:
+        abort('Cannot open file %s' % offs_fname)
+
+    # first line is # ref_time <host> ...
+    hosts = offs_lines[0].rstrip().split(' ')[2:]
+    ref_times = array('d')
+    offsets = [ array('d') for host in hosts ]
+    last_offs = [ 0.0 ] * len(hosts)
+
+    for line in offs_lines[1:]:
+        fields = line.rstrip().split(' ')
+        ref_times.append(float(fields[0]))
+        for i, offs in enumerate(fields[1:len(hosts) + 1]):
+            # XXX instead of using the instantenous offset values we may
+            # want to do something better in the future, such as using
+            # a weighted moving average etc.
+            if offs != 'NA':
+                last_offs[i] = float(offs)
+            offsets[i].append(last_offs[i])
+
+    table = {}
+    for host, host_offsets in zip(hosts, offsets):
+        table[host] = (ref_times, host_offsets)
+
+    return table
+
+
+## Get clock offsets of a host. The offset table of an experiment is only read
+## once (or again if the clock offset file changed)
+#  @param offs_fname Clock offset file name
+#  @param host_name Host name
+#  @return Pair of arrays (reference times, offsets)
+def get_offset_table(offs_fname, host_name):
+    mtime = os.stat(offs_fname).st_mtime
+    entry = offset_tables.get(offs_fname, None)
+    if entry is None or entry[0] != mtime:
+        entry = (mtime, read_offset_table(offs_fname))
+        offset_tables[offs_fname] = entry
+
+    table = entry[1]
+    if host_name not in table:
+        abort('No clock offsets for host %s in %s' % (host_name, offs_fname))
+
+    return table[host_name]
+
+
+## Correct timestamps. Each offset is valid from the time it was observed until
+## the time the next offset is observed (a timestamp equal to a reference time
+## still uses the previous offset). Timestamps before the first reference time
+## use the first offset. If the timestamps are sorted, the range of timestamps
+## that use the same offset is found with bisect and corrected in one go,
+## otherwise the offset is looked up for each timestamp.
+#  @param table Pair of arrays (reference times, offsets)
+#  @param times List of timestamps
+#  @return List of corrected timestamps
+def correct_times(table, times):
+    ref_times, offsets = table
+    if len(ref_times) == 0 or len(times) == 0:
+        return times
+
+    if times != sorted(times):
+        return [ time - offsets[max(bisect_left(ref_times, time) - 1, 0)]
+                 for time in times ]
+
+    corrected = []
+    last = len(ref_times) - 1
+    pos = 0
+    while pos < len(times):
+        idx = max(bisect_left(ref_times, times[pos]) - 1, 0)
+        # offset idx is used up to and including the next reference time
+        if idx < last:
+            end = bisect_right(times, ref_times[idx + 1], pos)
+        else:
+            end = len(times)
+        offset = offsets[idx]
+        corrected.extend([ time - offset for time in islice(times, pos, end) ])
+        pos = end
+
+    return corrected
 
 
 ## Adjust timestamps in interim data file (TASK)
@@ -305,65 +448,35 @@ def adjust_timestamps(test_id='', file_name='', host_name='', sep=' ', out_dir='
 
         return new_fname
 
-    host_times = []
-    last_offs = 0.0
-    try:
-        with open(offs_fname) as f:
-            offs_lines = f.readlines()
-
-            # find column (note # is first column in first row
-            host_col = -1
-            for col in offs_lines[0].rstrip().split(' '):
-                if col == host_name:
-                    break
-
-                host_col += 1
+    # nothing to do if the file was already corrected with the current clock
+    # offsets
+    cache = ExtractCache('adjust_timestamps')
+    if not cache.need_update([ new_fname ], [ file_name, offs_fname ], 
+                             (host_name, sep)):
+        return new_fname
 
-            #print(host_name)
-            #print(host_col)
+    table = get_offset_table(offs_fname, host_name)
 
-            for line in offs_lines[1:]:
-                line = line.rstrip()
-                ref_time = line.split(' ')[0]
-                offs = line.split(' ')[host_col]
-                # if we have no data our offset for correction will be the
-                # last offset != zero otherwise it will be the offset measured
-                if offs == 'NA':
-                    offs = last_offs
-                else:
-                    offs = float(offs)
-                    last_offs = offs
+    # correct the file in chunks of lines, so memory does not grow with the
+    # size of the file
+    try:
+        with open(file_name, 'r') as f, open(new_fname, 'w') as fout:
+            while True:
+                lines = list(islice(f, CORRECT_CHUNK_LINES))
+                if len(lines) == 0:
+                    break
 
-                # XXX instead of using the instantenous offset values we may
-                # want to do something better in the future, such as using
-                # a weighted moving average etc.
-                host_times.append((ref_time, offs))
+                rows = [ line.rstrip('\r\n').split(sep, 1) for line in lines ]
+                rows = [ row for row in rows if row[0] != '' or len(row) > 1 ]
+                times = [ float(row[0]) for row in rows ]
+                corrected = correct_times(table, times)
 
+                fout.writelines([ '{0:.6f}'.format(new_time) + sep + 
+                                  (row[1] if len(row) > 1 else '') + '\n'
+                                  for new_time, row in zip(corrected, rows) ])
     except IOError:
-        abort('Cannot open file %s' % offs_fname)
-
-    reader = csv.reader(open(file_name, 'r'), delimiter=sep)
-    fout = open(new_fname, 'w')
-
-    # index to curr_ref_time
-    curr = 0
-    for line in reader:
-        time = line[0]
-
-        # find the right time, we assume here that each offset is
-        # valid from the time it was observed until the time the next
-        # offset is observed
-        while host_times[curr][0] < time or host_times[curr][0] == 'NA':
-            curr += 1
-        if curr > 0 and host_times[curr - 1][0] != 'NA':
-            curr -= 1
-
-        new_time = float(time) - host_times[curr][1]
-
-        fout.write('{0:.6f}'.format(new_time) + sep)
-        fout.write(sep.join(line[1:]))
-        fout.write('\n')
+        abort('Cannot open file %s' % file_name)
 
-    fout.close()
+    cache.commit()
 
     return new_fname
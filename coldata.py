@@ -0,0 +1,362 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package coldata
+# Typed column files for extracted data files. A column file is a sidecar of a
+# text data file (<data file>.col) that stores the same data as float64 columns,
+# so the data does not have to be parsed again when it is read the next time.
+# The text data files are always kept, the plot scripts still read them.
+#
+# A column file starts with a text header:
+#
+#   TEACUP_COLUMNS <version>
+#   source <data file name> <data file size> <data file modification time>
+#   flow <flow key or ->
+#   rows <number of rows>
+#   columns <comma-separated column names>
+#   data <padding>
+#
+# The header is padded with spaces to a multiple of 8 bytes. It is followed by
+# the columns, each column is an array of <rows> little-endian float64 values.
+# Missing values (rows with fewer columns) and non-numeric values are stored
+# as NaN.
+#
+# $Id$
+
+import os
+import re
+import sys
+import mmap
+import struct
+from array import array
+from fabric.api import warn
+import config
+
+
+## Column file name extension
+COLUMN_FILE_EXT = '.col'
+## Column file format version
+COLUMN_FILE_VERSION = 1
+## Regular expression that matches the flow tuple in data file names
+FLOW_KEY_REGEX = '_([0-9]*\.[0-9]*\.[0-9]*\.[0-9]*_[0-9]*_[0-9]*\.[0-9]*\.[0-9]*\.[0-9]*_[0-9]*)'
+
+_nan = float('nan')
+
+
+## Return true if column files should be written for data files that are read
+## (TPCONF_column_files in config.py, disabled by default)
+#  @return True if column files are enabled, otherwise False
+def column_files_enabled():
+    try:
+        return bool(int(config.TPCONF_column_files))
+    except AttributeError:
+        return False
+
+
+## Get name of column file for data file
+#  @param data_file Data file name
+#  @return Column file name
+def get_column_file_name(data_file):
+    return data_file + COLUMN_FILE_EXT
+
+
+## Get flow key from data file name
+#  @param data_file Data file name
+#  @return Flow key (<src>_<sport>_<dst>_<dport>) or '-' if there is none
+def get_flow_key(data_file):
+    res = re.search(FLOW_KEY_REGEX, os.path.basename(data_file))
+    if res:
+        return res.group(1)
+    return '-'
+
+
+## Column of a column file, values are read from the memory-mapped file on access.
+## Supports len() and indexing, so it can be used with bisect.
+class Column:
+
+    ## Create column
+    #  @param buf Memory-mapped file
+    #  @param offset Offset of first value in file
+    #  @param rows Number of values
+    def __init__(self, buf, offset, rows):
+        self.buf = buf
+        self.offset = offset
+        self.rows = rows
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.to_array()[i]
+        if i < 0:
+            i += self.rows
+        if i < 0 or i >= self.rows:
+            raise IndexError('column index out of range')
+        return struct.unpack_from('<d', self.buf, self.offset + 8 * i)[0]
+
+    def __iter__(self):
+        return iter(self.to_array())
+
+    ## Copy all values of the column
+    #  @return Values as array of doubles
+    def to_array(self):
+        a = array('d')
+        a.fromstring(self.buf[self.offset:self.offset + 8 * self.rows])
+        if sys.byteorder != 'little':
+            a.byteswap()
+        return a
+
+
+## Columns of a data file held in memory
+class ColumnData:
+
+    ## Create column data
+    #  @param columns List of columns (arrays of doubles)
+    #  @param names List of column names
+    #  @param flow Flow key
+    def __init__(self, columns, names, flow='-'):
+        self.columns = columns
+        self.names = names
+        self.flow = flow
+        if len(columns) > 0:
+            self.rows = len(columns[0])
+        else:
+            self.rows = 0
+
+    ## Get column
+    #  @param col Column number (starting with 0, negative numbers count from
+    #             the last column) or column name
+    #  @return Column
+    def get_column(self, col):
+        if not isinstance(col, int):
+            col = self.names.index(col)
+        return self.columns[col]
+
+    ## Get values of column
+    #  @param col Column number or column name
+    #  @return Array of doubles
+    def get_values(self, col):
+        return self.get_column(col)
+
+    ## Get number of columns
+    #  @return Number of columns
+    def num_columns(self):
+        return len(self.names)
+
+    def close(self):
+        pass
+
+
+## Memory-mapped column file
+class ColumnFile(ColumnData):
+
+    ## Open column file
+    #  @param fname Column file name
+    def __init__(self, fname):
+        self.fname = fname
+        self.source = None
+        self.flow = '-'
+        self.names = []
+        self.rows = 0
+
+        with open(fname, 'rb') as f:
+            magic = f.readline().split()
+            if len(magic) != 2 or magic[0] != 'TEACUP_COLUMNS' or \
+               int(magic[1]) != COLUMN_FILE_VERSION:
+                raise ValueError('%s is not a column file' % fname)
+
+            while True:
+                line = f.readline()
+                if line == '':
+                    raise ValueError('Truncated column file %s' % fname)
+                fields = line.split(' ', 1)
+                key = fields[0].strip()
+                val = fields[1].strip() if len(fields) > 1 else ''
+                if key == 'data':
+                    break
+                elif key == 'source':
+                    name, size, mtime = val.rsplit(' ', 2)
+                    self.source = (name, int(size), mtime)
+                elif key == 'flow':
+                    self.flow = val
+                elif key == 'rows':
+                    self.rows = int(val)
+                elif key == 'columns':
+                    self.names = val.split(',') if val != '' else []
+
+            offset = f.tell()
+            size = offset + 8 * self.rows * len(self.names)
+            if os.fstat(f.fileno()).st_size < size:
+                raise ValueError('Truncated column file %s' % fname)
+
+            if size > offset:
+                self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                # mmap does not support empty files
+                self.buf = ''
+
+        self.columns = [ Column(self.buf, offset + 8 * self.rows * i, self.rows)
+                         for i in range(len(self.names)) ]
+
+    ## Check whether column file was created from the current version of a data file
+    #  @param data_file Data file name
+    #  @return True if column file is up to date, otherwise False
+    def is_current(self, data_file):
+        if self.source is None:
+            return False
+        try:
+            st = os.stat(data_file)
+        except OSError:
+            return False
+        return self.source[1] == st.st_size and self.source[2] == repr(st.st_mtime)
+
+    def get_values(self, col):
+        return self.get_column(col).to_array()
+
+    def close(self):
+        if not isinstance(self.buf, str):
+            self.buf.close()
+
+
+## Parse text data file
+#  @param data_file Data file name
+#  @param sep Column separator (None means any whitespace)
+#  @return ColumnData
+def parse_data_file(data_file, sep=None):
+    columns = []
+    rows = 0
+
+    with open(data_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line == '':
+                continue
+            fields = line.split(sep)
+            if len(fields) > len(columns):
+                # new columns are NaN for the previous rows
+                for i in range(len(fields) - len(columns)):
+                    columns.append(array('d', [_nan]) * rows)
+            for i in range(len(columns)):
+                if i < len(fields):
+                    try:
+                        columns[i].append(float(fields[i]))
+                    except ValueError:
+                        # non-numeric values, such as NA or addresses
+                        columns[i].append(_nan)
+                else:
+                    columns[i].append(_nan)
+            rows += 1
+
+    names = [ 'c%i' % (i + 1) for i in range(len(columns)) ]
+    return ColumnData(columns, names, get_flow_key(data_file))
+
+
+## Write column file for data file (the file is written under a temporary
+## name first, so readers never see a partially written file)
+#  @param data_file Data file name
+#  @param data ColumnData with the data of the data file
+#  @return Column file name
+def write_column_file(data_file, data):
+    fname = get_column_file_name(data_file)
+    tmp_fname = '%s.%i' % (fname, os.getpid())
+    st = os.stat(data_file)
+
+    header = 'TEACUP_COLUMNS %i\n' % COLUMN_FILE_VERSION
+    header += 'source %s %i %s\n' % (data_file, st.st_size, repr(st.st_mtime))
+    header += 'flow %s\n' % data.flow
+    header += 'rows %i\n' % data.rows
+    header += 'columns %s\n' % ','.join(data.names)
+    header += 'data'
+    header += ' ' * ((8 - (len(header) + 1) % 8) % 8) + '\n'
+
+    with open(tmp_fname, 'wb') as f:
+        f.write(header)
+        for col in data.columns:
+            if not isinstance(col, array):
+                col = array('d', col)
+            if sys.byteorder != 'little':
+                col = array('d', col)
+                col.byteswap()
+            col.tofile(f)
+
+    os.rename(tmp_fname, fname)
+
+    return fname
+
+
+## Open column file of data file if it exists and is up to date
+#  @param data_file Data file name
+#  @return ColumnFile or None
+def load_column_file(data_file):
+    fname = get_column_file_name(data_file)
+    if not os.path.isfile(fname):
+        return None
+
+    try:
+        data = ColumnFile(fname)
+    except (ValueError, IOError, mmap.error) as e:
+        warn('Ignoring column file %s: %s' % (fname, str(e)))
+        return None
+
+    if not data.is_current(data_file):
+        data.close()
+        return None
+
+    return data
+
+
+## Read data file. Uses the column file of the data file if it is up to date,
+## otherwise parses the text data file (and writes the column file if
+## column files are enabled)
+#  @param data_file Data file name
+#  @param sep Column separator of the data file (None means any whitespace)
+#  @return ColumnData or ColumnFile
+def read_data_file(data_file, sep=None):
+    data = load_column_file(data_file)
+    if data is not None:
+        return data
+
+    data = parse_data_file(data_file, sep)
+    if column_files_enabled():
+        try:
+            write_column_file(data_file, data)
+        except (IOError, OSError) as e:
+            warn('Cannot write column file for %s: %s' % (data_file, str(e)))
+
+    return data
+
+
+## Return number of rows of data file if known from its column file
+#  @param data_file Data file name
+#  @return Number of rows or -1 if unknown
+def get_num_rows(data_file):
+    data = load_column_file(data_file)
+    if data is None:
+        return -1
+    rows = data.rows
+    data.close()
+    return rows
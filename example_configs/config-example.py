@@ -165,6 +165,35 @@ TPCONF_bc_ping_address = '224.0.1.199'
 # as the EStats logger on Windows. The default value is 10ms.
 TPCONF_web10g_poll_interval = 10 
 
+# Write typed column files (<data file>.col) for data files the analysis reads,
+# so the data is not parsed again when re-plotting. The text data files are
+# kept. The default value is 0 (no column files).
+#TPCONF_column_files = 1
+
+# Reuse extracted data files if the input files, extractor parameters and
+# extractor versions have not changed since they were extracted (the extracted
+# files are recorded in teacup_extract_cache.txt in the directory of the
+# extracted files). If set to 0, extracted data files are reused only with
+# replot_only=1. The default value is 1.
+#TPCONF_extract_cache = 0
+
+# Aggregate data over time windows (e.g. throughput from packet sizes) in
+# analyse.py and only pass the aggregated data to the plot script. If set to 0,
+# the plot script aggregates the data. The default value is 1.
+#TPCONF_aggregate_data = 0
+
+# Run the R plot scripts in one long-lived R process per analysis process
+# (plot_worker.R) instead of starting R CMD BATCH for every plot. If set to 0,
+# or if the R process cannot be started, R CMD BATCH is used. The default
+# value is 1.
+#TPCONF_plot_worker = 0
+
+# Record the extracted data files and the experiment parameters in a metrics
+# database in each result directory (teacup_metrics.db), so analyse_cmpexp and
+# analyse_2d_density can select data files without searching the result
+# directory and counting lines. The default value is 1.
+#TPCONF_metrics_db = 0
+
 # List of router queues/pipes
 
 # Each entry is a tuple. The first value is the queue number and the second value
@@ -0,0 +1,299 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package extractcache
+# Cache of extracted data files. For each extracted file the manifest stores
+# a key computed from the identity (name, size, modification time) of the input
+# files, the name and version of the extractor and the extractor parameters,
+# and the size and modification time the extracted file had when it was
+# written. An extracted file is only reused if the key matches and the file has
+# not been modified since. 
+#
+# Each directory with extracted files has its own manifest. The manifest is
+# shared by parallel processes, it is rewritten under a lock on every commit
+# (entries of files that no longer exist are dropped).
+#
+# $Id$
+
+import os
+import fcntl
+import hashlib
+import config
+from fabric.api import warn
+
+
+## Manifest file name
+MANIFEST_FILE_NAME = 'teacup_extract_cache.txt'
+## Versions of the extractors. The version of an extractor must be increased
+## whenever a change of the extractor or the code it uses changes the extracted
+## files, so that previously extracted files become stale. Extractors not listed
+## have version 1.
+EXTRACTOR_VERSIONS = {
+    'adjust_timestamps': 1,
+    'extract_ackseq': 1,
+    'extract_bursts': 1,
+    'extract_dash_goodput': 1,
+    'extract_dupACKs_bursts': 1,
+    'extract_incast': 1,
+    'extract_incast_iqtimes': 1,
+    'extract_incast_restimes': 1,
+    'extract_pktloss': 1,
+    'extract_pktsizes': 1,
+    'extract_rtt': 1,
+    'extract_siftr': 1,
+    'extract_web10g': 1,
+}
+
+## Manifest cache. Index is the directory name, value is a pair of the
+## identity (inode, size, modification time) of the manifest file read and a
+## dictionary with extracted file name (without directory) as index and tuple
+## of (key, size, modification time) as value
+manifests = {}
+
+
+## Get name of manifest file for an extracted file
+#  @param fname Extracted file name
+#  @return Pair of manifest file name and directory name
+def get_manifest_name(fname):
+    dir_name = os.path.dirname(fname)
+    if dir_name == '':
+        dir_name = '.'
+
+    return (os.path.join(dir_name, MANIFEST_FILE_NAME), dir_name)
+
+
+## Parse manifest lines
+#  @param lines Lines of manifest file
+#  @param entries Dictionary the entries are added to
+def parse_manifest(lines, entries):
+    for line in lines:
+        fields = line.split()
+        if len(fields) == 4:
+            entries[fields[0]] = (fields[1], int(fields[2]), fields[3])
+
+
+## Read manifest file of directory if exists and was changed since it was read
+#  @param dir_name Directory name
+def read_manifest(dir_name):
+    mname = os.path.join(dir_name, MANIFEST_FILE_NAME)
+
+    try:
+        with open(mname, 'r') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            st = os.fstat(f.fileno())
+            ident = (st.st_ino, st.st_size, st.st_mtime)
+            if dir_name in manifests and manifests[dir_name][0] == ident:
+                fcntl.flock(f, fcntl.LOCK_UN)
+                return
+            lines = f.readlines()
+            fcntl.flock(f, fcntl.LOCK_UN)
+    except IOError:
+        return
+
+    entries = {}
+    parse_manifest(lines, entries)
+    manifests[dir_name] = (ident, entries)
+
+
+## Rewrite manifest file of directory with new entries. Entries of files that
+## no longer exist are dropped.
+#  @param dir_name Directory name
+#  @param entries List of (file name, key) tuples of files in the directory
+def write_manifest(dir_name, entries):
+    mname = os.path.join(dir_name, MANIFEST_FILE_NAME)
+
+    new_entries = {}
+    for (fname, key) in entries:
+        try:
+            st = os.stat(fname)
+        except OSError:
+            # extractor did not create the file
+            continue
+
+        new_entries[os.path.basename(fname)] = (key, st.st_size, repr(st.st_mtime))
+
+    if len(new_entries) == 0:
+        return
+
+    try:
+        while True:
+            f = open(mname, 'a+')
+            fcntl.flock(f, fcntl.LOCK_EX)
+            # another process may have replaced the file before we got the lock
+            try:
+                if os.stat(mname).st_ino == os.fstat(f.fileno()).st_ino:
+                    break
+            except OSError:
+                pass
+            f.close()
+
+        try:
+            f.seek(0)
+            all_entries = {}
+            parse_manifest(f.readlines(), all_entries)
+            all_entries.update(new_entries)
+
+            lines = []
+            for name in sorted(all_entries.keys()):
+                if os.path.exists(os.path.join(dir_name, name)):
+                    key, size, mtime = all_entries[name]
+                    lines.append('%s %s %i %s\n' % (name, key, size, mtime))
+
+            # written under a temporary name first, so readers never see a
+            # partially written file
+            tmp_name = '%s.%i' % (mname, os.getpid())
+            with open(tmp_name, 'w') as tmp:
+                tmp.writelines(lines)
+            os.rename(tmp_name, mname)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+    except (IOError, OSError) as e:
+        warn('Cannot write extraction cache manifest %s: %s' % (mname, str(e)))
+        return
+
+    if dir_name in manifests:
+        manifests[dir_name][1].update(new_entries)
+    else:
+        manifests[dir_name] = (None, new_entries)
+
+
+## Perform manifest lookup
+#  @param fname Extracted file name
+#  @return Tuple of (key, size, modification time) or None
+def lookup_manifest(fname):
+    dir_name = get_manifest_name(fname)[1]
+    name = os.path.basename(fname)
+
+    # load manifest (again) if file is not in cache
+    if dir_name not in manifests or name not in manifests[dir_name][1]:
+        read_manifest(dir_name)
+
+    if dir_name not in manifests:
+        return None
+
+    return manifests[dir_name][1].get(name, None)
+
+
+## Return true if the extraction cache is used (TPCONF_extract_cache in
+## config.py, enabled by default)
+#  @return True if cache is enabled, otherwise False
+def extract_cache_enabled():
+    try:
+        return bool(int(config.TPCONF_extract_cache))
+    except AttributeError:
+        return True
+
+
+## Compute cache key
+#  @param extractor Extractor name
+#  @param params Tuple of extractor parameters that influence the output
+#  @param in_files List of input file names
+#  @return Key
+def get_cache_key(extractor, params, in_files):
+    h = hashlib.sha1()
+    h.update('%s %i\n' % (extractor, EXTRACTOR_VERSIONS.get(extractor, 1)))
+    h.update(repr(tuple(params)) + '\n')
+    for in_file in in_files:
+        try:
+            st = os.stat(in_file)
+            h.update('%s %i %s\n' % (in_file, st.st_size, repr(st.st_mtime)))
+        except OSError:
+            h.update('%s missing\n' % in_file)
+
+    return h.hexdigest()
+
+
+## Extraction cache used by one extractor. Outputs are checked with need_update(),
+## after the outputs have been written they are recorded with commit().
+class ExtractCache:
+
+    ## Create extraction cache
+    #  @param extractor Extractor name
+    #  @param replot_only '0' extract data again unless the cached data is up to
+    #                     date, '1' also reuse extracted files that are not in
+    #                     the manifest (e.g. extracted by older versions)
+    def __init__(self, extractor, replot_only='0'):
+        self.extractor = extractor
+        self.replot_only = replot_only
+        self.enabled = extract_cache_enabled()
+        self.pending = []
+
+    ## Check if extracted file is up to date 
+    #  @param out_file Extracted file name
+    #  @param key Cache key
+    #  @return True if file can be reused, otherwise False
+    def _is_current(self, out_file, key):
+        try:
+            st = os.stat(out_file)
+        except OSError:
+            return False
+
+        entry = lookup_manifest(out_file)
+        if entry is None:
+            # legacy behaviour of replot_only for files not in the manifest
+            return self.replot_only == '1'
+
+        return entry == (key, st.st_size, repr(st.st_mtime))
+
+    ## Check whether extracted files must be (re)created. If so, the files are
+    ## remembered and recorded in the manifest by commit().
+    #  @param out_files List of extracted file names
+    #  @param in_files List of input file names
+    #  @param params Tuple of extractor parameters that influence the output
+    #  @param force If True the files must be extracted in any case
+    #  @return True if the files must be extracted, otherwise False
+    def need_update(self, out_files, in_files, params=(), force=False):
+        if not self.enabled:
+            if force:
+                return True
+            for out_file in out_files:
+                if self.replot_only == '0' or not os.path.isfile(out_file):
+                    return True
+            return False
+
+        key = get_cache_key(self.extractor, params, in_files)
+        update = force
+        for out_file in out_files:
+            if not update and not self._is_current(out_file, key):
+                update = True
+                break
+
+        if update:
+            self.pending += [ (out_file, key) for out_file in out_files ]
+
+        return update
+
+    ## Record all extracted files in the manifest
+    def commit(self):
+        if self.enabled and len(self.pending) > 0:
+            by_dir = {}
+            for (out_file, key) in self.pending:
+                dir_name = get_manifest_name(out_file)[1]
+                by_dir.setdefault(dir_name, []).append((out_file, key))
+            for dir_name in sorted(by_dir.keys()):
+                write_manifest(dir_name, by_dir[dir_name])
+        self.pending = []
@@ -132,6 +132,16 @@ try:
 except ImportError:
     pass
 
+try:
+    from analyse import build_flow_index
+except ImportError:
+    pass
+
+try:
+    from analyse import extract_tcp_logs
+except ImportError:
+    pass
+
 try:
     from analyse import extract_pktloss, analyse_pktloss
 except ImportError:
@@ -30,6 +30,12 @@
 # $Id: filefinder.py 1287 2015-04-29 05:27:00Z szander $
 
 import os
+import re
+import atexit
+import fcntl
+import cPickle
+from fnmatch import fnmatchcase
+from subprocess import Popen, PIPE
 import config
 from fabric.api import task, warn, local, run, execute, abort, hosts, env
 from internalutil import _list
@@ -43,14 +49,23 @@ CACHE_FILE_NAME = 'teacup_dir_cache.txt'
 ## Cache
 dir_cache = {}
 
-## Read cachfile if exists
+## Position in cache file up to which we have read the file (the cache
+## file can be shared by parallel processes)
+cache_file_pos = 0
+
+## Read cachfile if exists (only the part not read yet)
 def read_dir_cache():
+    global cache_file_pos
 
     if not os.path.isfile(CACHE_FILE_NAME):
         return
 
     with open(CACHE_FILE_NAME, 'r') as f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        f.seek(cache_file_pos)
         lines = f.readlines()
+        cache_file_pos = f.tell()
+        fcntl.flock(f, fcntl.LOCK_UN)
         for line in lines:
             fields = line.split()
             dir_cache[fields[0]] = fields[1]
@@ -59,11 +74,18 @@ def read_dir_cache():
 ## Append to cache if entry not in there yet 
 #  @param test_id Test ID
 #  @param directory Directory which has files of the experiment with ID = test ID
-def append_dir_cache(test_id, directory):
+#  @param replace If True replace an existing entry (the last entry in the cache
+#                 file is used)
+def append_dir_cache(test_id, directory, replace=False):
 
-    if test_id not in dir_cache:
+    if test_id not in dir_cache or (replace and dir_cache[test_id] != directory):
+        # lock, so lines of parallel processes are not mixed up 
         with open(CACHE_FILE_NAME, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
             f.write('%s %s\n' % (test_id, directory))
+            f.flush()
+            fcntl.flock(f, fcntl.LOCK_UN)
+        dir_cache[test_id] = directory
 
 
 ## Perform cache lookup, if we have entry for test id return directory. Otherwise
@@ -71,8 +93,8 @@ def append_dir_cache(test_id, directory):
 #  @param test_id Test ID
 def lookup_dir_cache(test_id):
 
-    # load cache first if cache is empty
-    if len(dir_cache) == 0:
+    # load cache (again) if test id is not in cache
+    if test_id not in dir_cache:
         read_dir_cache()
 
     if test_id in dir_cache:
@@ -81,6 +103,277 @@ def lookup_dir_cache(test_id):
         return '.'
 
 
+#
+# Directory index functions
+#
+
+## Index file name
+INDEX_FILE_NAME = 'teacup_dir_index.pickle'
+## Index of directories. Index is the directory name, value is a tuple of 
+## the directory's modification time, the list of all entries and the list of
+## subdirectories
+dir_index = {}
+## True if the index was loaded from the index file
+dir_index_loaded = False
+## True if the index was changed since it was loaded or saved
+dir_index_changed = False
+
+
+## Load index file if exists, the index file is updated when the process exits
+def load_dir_index():
+    global dir_index, dir_index_loaded
+
+    dir_index_loaded = True
+    atexit.register(save_dir_index)
+    if not os.path.isfile(INDEX_FILE_NAME):
+        return
+
+    try:
+        with open(INDEX_FILE_NAME, 'rb') as f:
+            dir_index = cPickle.load(f)
+    except Exception as e:
+        warn('Ignoring index file %s: %s' % (INDEX_FILE_NAME, str(e)))
+        dir_index = {}
+
+
+## Save index file (the file is written under a temporary name first, so
+## parallel processes never read a partially written file)
+def save_dir_index():
+    global dir_index_changed
+
+    if not dir_index_changed:
+        return
+
+    tmp_name = '%s.%i' % (INDEX_FILE_NAME, os.getpid())
+    try:
+        with open(tmp_name, 'wb') as f:
+            cPickle.dump(dir_index, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_name, INDEX_FILE_NAME)
+        dir_index_changed = False
+    except (IOError, OSError) as e:
+        warn('Cannot write index file %s: %s' % (INDEX_FILE_NAME, str(e)))
+
+
+## Get entries of directory from the index, the directory is (re)read if it is
+## not indexed yet or was modified since it was indexed
+#  @param dir_name Directory name
+#  @return Pair of list of entries and list of subdirectories (following
+#          symbolic links), or None if directory cannot be read
+def get_dir_entries(dir_name):
+    global dir_index_changed
+
+    try:
+        mtime = os.stat(dir_name).st_mtime
+    except OSError:
+        return None
+
+    entry = dir_index.get(dir_name, None)
+    if entry is not None and entry[0] == mtime:
+        return (entry[1], entry[2])
+
+    try:
+        names = os.listdir(dir_name)
+    except OSError:
+        return None
+
+    subdirs = [ name for name in names if os.path.isdir(os.path.join(dir_name, name)) ]
+    dir_index[dir_name] = (mtime, names, subdirs)
+    dir_index_changed = True
+
+    return (names, subdirs)
+
+
+#
+# File map functions
+#
+
+## Maps of the files below search directories. Index is the search directory,
+## value is a FileMap
+file_maps = {}
+
+
+## Map of all files below a search directory, built once from the directory
+## index. Files are looked up by test ID and file extension, the files found are
+## kept, and on each lookup only directories modified since are read again
+class FileMap:
+
+    ## Constructor
+    #  @param search_dir Directory from where we start the search
+    def __init__(self, search_dir):
+        ## Directory from where we start the search
+        self.search_dir = search_dir
+        ## Index is directory name, value is the directory's index entry
+        ## (modification time, list of entries, list of subdirectories)
+        self.listings = {}
+        ## List of pairs of path and name of all entries in the order find
+        ## would list them
+        self.entries = []
+        ## Index is test ID, value is pair of list of entries starting with
+        ## the test ID and dictionary with file extension as index and list of
+        ## files found as value
+        self.test_ids = {}
+
+        self.scan()
+
+    ## Walk the directory tree using the directory index
+    def scan(self):
+        self.listings = {}
+        self.entries = []
+        # directories already visited (symbolic links may cause loops)
+        visited = set()
+
+        def _walk(dir_name):
+            try:
+                st = os.stat(dir_name)
+            except OSError:
+                return
+            if (st.st_dev, st.st_ino) in visited:
+                return
+            visited.add((st.st_dev, st.st_ino))
+
+            if get_dir_entries(dir_name) is None:
+                return
+
+            self.listings[dir_name] = dir_index[dir_name]
+            names = dir_index[dir_name][1]
+            subdirs = set(dir_index[dir_name][2])
+            for name in names:
+                path = os.path.join(dir_name, name)
+                self.entries.append((path[2:] if path.startswith('./') else path, name))
+                if name in subdirs:
+                    _walk(path)
+
+        name = os.path.basename(self.search_dir.rstrip('/'))
+        self.entries.append((self.search_dir, name))
+        _walk(self.search_dir)
+
+    ## Read directories modified since the last lookup again and forget the
+    ## files found for test IDs matching added or removed entries
+    def refresh(self):
+        changed = []
+        for dir_name, listing in self.listings.items():
+            try:
+                if os.stat(dir_name).st_mtime == listing[0]:
+                    continue
+            except OSError:
+                pass
+            changed.append((dir_name, listing))
+
+        if len(changed) == 0:
+            return
+
+        self.scan()
+
+        diff = set()
+        for dir_name, old_listing in changed:
+            new_listing = self.listings.get(dir_name, None)
+            if new_listing is None or new_listing[2] != old_listing[2]:
+                # subdirectories added or removed
+                self.test_ids = {}
+                return
+            diff.update(set(new_listing[1]) ^ set(old_listing[1]))
+
+        for test_id in self.test_ids.keys():
+            pattern = test_id + '*'
+            for name in diff:
+                if fnmatchcase(name, pattern):
+                    del self.test_ids[test_id]
+                    break
+
+    ## Find files by name
+    #  @param pattern Shell pattern the file names must match
+    #  @param entries List of entries to search (default is all entries)
+    #  @return List of files found
+    def find(self, pattern, entries=None):
+        if entries is None:
+            entries = self.entries
+
+        return [ path for path, name in entries if fnmatchcase(name, pattern) ]
+
+    ## Find files of experiment
+    #  @param test_id Test ID
+    #  @param file_ext Characteristic rightmost part of file
+    #  @return List of files whose name matches <test_id>*<file_ext>
+    def lookup(self, test_id, file_ext):
+        self.refresh()
+
+        if test_id not in self.test_ids:
+            entries = [ (path, name) for path, name in self.entries
+                        if fnmatchcase(name, test_id + '*') ]
+            self.test_ids[test_id] = (entries, {})
+
+        entries, files = self.test_ids[test_id]
+        if file_ext not in files:
+            files[file_ext] = self.find(test_id + '*' + file_ext, entries)
+
+        return list(files[file_ext])
+
+
+## Get map of files below search directory
+#  @param search_dir Directory from where we start the search
+#  @return FileMap for search_dir
+def get_file_map(search_dir):
+
+    if not dir_index_loaded:
+        load_dir_index()
+
+    # like find, search current directory if no directory is specified
+    if search_dir == '':
+        search_dir = '.'
+
+    if search_dir not in file_maps:
+        file_maps[search_dir] = FileMap(search_dir)
+
+    return file_maps[search_dir]
+
+
+## Find files by name like find -L <search_dir> -name <pattern> | sed -e "s/^\.\///"
+## but using the directory index
+#  @param search_dir Directory from where we start the search
+#  @param pattern Shell pattern the file names must match
+#  @return List of files found 
+def find_files(search_dir, pattern):
+
+    file_map = get_file_map(search_dir)
+    file_map.refresh()
+
+    return file_map.find(pattern)
+
+
+## Find files of experiment like find_files(search_dir, '<test_id>*<file_ext>')
+#  @param search_dir Directory from where we start the search
+#  @param test_id Test ID
+#  @param file_ext Characteristic rightmost part of file
+#  @return List of files found 
+def find_testid_files(search_dir, test_id, file_ext):
+
+    return get_file_map(search_dir).lookup(test_id, file_ext)
+
+
+## Apply shell commands that used to be piped after find to list of files. Only
+## grep -v "<pattern>" and LC_ALL=C sort are emulated, other commands are
+## executed in a shell.
+#  @param file_list List of file names
+#  @param pipe_cmd One or more shell commands separated by |
+#  @return Filtered list of files
+def apply_pipe_cmd(file_list, pipe_cmd):
+
+    cmds = [ cmd.strip() for cmd in pipe_cmd.split('|') if cmd.strip() != '' ]
+    for cmd in cmds:
+        res = re.match('^grep -v "([^"]*)"$', cmd)
+        if res:
+            regex = re.compile(res.group(1))
+            file_list = [ f for f in file_list if not regex.search(f) ]
+        elif cmd == 'LC_ALL=C sort' or cmd == 'sort':
+            file_list = sorted(file_list)
+        else:
+            proc = Popen(cmd, shell=True, stdin=PIPE, stdout=PIPE)
+            out = proc.communicate(''.join([ f + '\n' for f in file_list ]))[0]
+            file_list = _list(out)
+
+    return file_list
+
+
 ## Filter out duplicates (if we accidentally have copies lying around in 
 #  different subdirectories)
 #  @param file_list List of file names
@@ -103,8 +396,8 @@ def filter_duplicates(file_list):
 #  @param test_id Semicolon separated list of test ids
 #  @param file_ext Characteristic rightmost part of file (file extension) we are
 #                  searching for
-#  @param pipe_cmd One or more shell command that are executed in pipe with the
-#                  find command
+#  @param pipe_cmd One or more shell commands that are applied to the list
+#                  of files found (see apply_pipe_cmd())
 #  @param search_dir Directory from where we start the search
 #  @param no_abort Set to false means abort if no matching files are found (default)
 #                  Set to true means don't abort if no matching files are found.
@@ -115,8 +408,10 @@ def get_testid_file_list(file_list_fname='', test_id='', file_ext='', pipe_cmd='
     file_list = []
 
     # if search dir is not specified try to find it in cache
+    cached_dir = False
     if search_dir == '.':
         search_dir = lookup_dir_cache(test_id)
+        cached_dir = search_dir != '.'
 
     if file_list_fname == '':
         # read from test_id list specified, this always overrules list in file if
@@ -127,15 +422,16 @@ def get_testid_file_list(file_list_fname='', test_id='', file_ext='', pipe_cmd='
         if len(test_id_arr) == 0 or test_id_arr[0] == '':
             abort('Must specify test_id parameter')
 
-        if pipe_cmd != '':
-            pipe_cmd = ' | ' + pipe_cmd
-
         for test_id in test_id_arr:
-            _files = _list(
-                local(
-                    'find -L %s -name "%s*%s" -print | sed -e "s/^\.\///"%s' %
-                    (search_dir, test_id, file_ext, pipe_cmd),
-                    capture=True))
+            _files = apply_pipe_cmd(
+                find_testid_files(search_dir, test_id, file_ext), pipe_cmd)
+
+            if len(_files) == 0 and cached_dir:
+                # files were moved, search again from current directory 
+                _files = apply_pipe_cmd(
+                    find_testid_files('.', test_id, file_ext), pipe_cmd)
+                if len(_files) > 0:
+                    append_dir_cache(test_id, os.path.dirname(_files[0]), True)
 
             _files = filter_duplicates(_files)
  
@@ -152,11 +448,7 @@ def get_testid_file_list(file_list_fname='', test_id='', file_ext='', pipe_cmd='
                 lines = f.readlines()
             for fname in lines:
                 fname = fname.rstrip()
-                _files = _list(
-                    local(
-                        'find -L %s -name "%s" -print | sed -e "s/^\.\///"' %
-                        (search_dir, fname),
-                        capture=True))
+                _files = find_files(search_dir, fname)
 
                 _files = filter_duplicates(_files)
 
@@ -169,8 +461,6 @@ def get_testid_file_list(file_list_fname='', test_id='', file_ext='', pipe_cmd='
             abort('Cannot open experiment list file %s' % file_list_fname)
 
     if not no_abort and len(file_list) == 0:
-        abort('Cannot find any matching data files.\n'
-              'Remove outdated teacup_dir_cache.txt if files were moved.') 
+        abort('Cannot find any matching data files.') 
 
     return file_list
-
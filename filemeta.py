@@ -0,0 +1,283 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package filemeta
+# Metadata sidecars of extracted data files. The sidecar (<data file>.meta)
+# stores the number of rows, the time range and the minimum, maximum and mean
+# of each value column of the data file. The extract functions write the
+# sidecars for their data files, so the number of rows and time range of a
+# data file are known without reading the data file again.
+#
+# The sidecar is a text file:
+#
+#   # version <version>
+#   # source <data file name> <data file size> <data file modification time>
+#   rows <number of rows>
+#   tmin <minimum timestamp or NA>
+#   tmax <maximum timestamp or NA>
+#   col <index> <minimum> <maximum> <mean>
+#
+# with one col line for each value column (the index starts with 2 for the
+# first value column). Lines with commas are split on commas, other lines on
+# white space. Non-numeric values are ignored. 
+#
+# $Id$
+
+import os
+from fabric.api import warn
+
+
+## Metadata file name extension
+META_FILE_EXT = '.meta'
+## Metadata file format version
+META_FILE_VERSION = 1
+
+
+## Metadata of a data file
+class FileMeta:
+
+    ## Create metadata
+    #  @param rows Number of rows
+    #  @param tmin Minimum timestamp or None
+    #  @param tmax Maximum timestamp or None
+    #  @param cols List of (minimum, maximum, mean) of value columns, entries
+    #              are None for columns without numeric values
+    def __init__(self, rows=0, tmin=None, tmax=None, cols=[]):
+        self.rows = rows
+        self.tmin = tmin
+        self.tmax = tmax
+        self.cols = cols
+
+    ## Get duration of data
+    #  @return Time between first and last timestamp 
+    def duration(self):
+        if self.tmin is None:
+            return 0.0
+        return self.tmax - self.tmin
+
+
+## Get name of metadata file for data file
+#  @param data_file Data file name
+#  @return Metadata file name
+def get_meta_file_name(data_file):
+    return data_file + META_FILE_EXT
+
+
+## Compute metadata of a data file in one pass
+#  @param data_file Data file name
+#  @return FileMeta
+def compute_file_meta(data_file):
+    rows = 0
+    tmin = None
+    tmax = None
+    vmin = []
+    vmax = []
+    vsum = []
+    vcnt = []
+
+    with open(data_file, 'r') as f:
+        for line in f:
+            rows += 1
+            if ',' in line:
+                fields = line.split(',')
+            else:
+                fields = line.split()
+
+            for i in range(len(fields)):
+                try:
+                    v = float(fields[i])
+                except ValueError:
+                    continue
+                if v != v:
+                    continue
+
+                if i == 0:
+                    if tmin is None or v < tmin:
+                        tmin = v
+                    if tmax is None or v > tmax:
+                        tmax = v
+                    continue
+
+                while len(vcnt) < i:
+                    vmin.append(None)
+                    vmax.append(None)
+                    vsum.append(0.0)
+                    vcnt.append(0)
+                j = i - 1
+                if vcnt[j] == 0 or v < vmin[j]:
+                    vmin[j] = v
+                if vcnt[j] == 0 or v > vmax[j]:
+                    vmax[j] = v
+                vsum[j] += v
+                vcnt[j] += 1
+
+    cols = []
+    for j in range(len(vcnt)):
+        if vcnt[j] > 0:
+            cols.append((vmin[j], vmax[j], vsum[j] / vcnt[j]))
+        else:
+            cols.append((None, None, None))
+
+    return FileMeta(rows, tmin, tmax, cols)
+
+
+## Format value for metadata file
+#  @param v Value or None
+#  @return String
+def _format_value(v):
+    if v is None:
+        return 'NA'
+    return repr(v)
+
+
+## Parse value from metadata file
+#  @param s String
+#  @return Value or None
+def _parse_value(s):
+    if s == 'NA':
+        return None
+    return float(s)
+
+
+## Read metadata file of data file
+#  @param data_file Data file name
+#  @return FileMeta or None if there is no metadata file or it is outdated
+def read_meta_file(data_file):
+    try:
+        st = os.stat(data_file)
+        with open(get_meta_file_name(data_file), 'r') as f:
+            lines = f.readlines()
+    except (IOError, OSError):
+        return None
+
+    if len(lines) < 5 or \
+       lines[0] != '# version %i\n' % META_FILE_VERSION or \
+       lines[1] != '# source %s %i %r\n' % (os.path.basename(data_file),
+                                           st.st_size, st.st_mtime):
+        return None
+
+    meta = FileMeta()
+    meta.cols = []
+    try:
+        for line in lines[2:]:
+            fields = line.split()
+            if fields[0] == 'rows':
+                meta.rows = int(fields[1])
+            elif fields[0] == 'tmin':
+                meta.tmin = _parse_value(fields[1])
+            elif fields[0] == 'tmax':
+                meta.tmax = _parse_value(fields[1])
+            elif fields[0] == 'col':
+                meta.cols.append(tuple([ _parse_value(x) for x in fields[2:5] ]))
+    except (IndexError, ValueError):
+        warn('Ignoring invalid metadata file for %s' % data_file)
+        return None
+
+    return meta
+
+
+## Write metadata file for data file (the file is written under a temporary
+## name first, so readers never see a partially written file)
+#  @param data_file Data file name
+#  @param meta FileMeta
+#  @param st Result of os.stat() for data file before the metadata was computed
+#  @return Metadata file name
+def write_meta_file(data_file, meta, st):
+    meta_file = get_meta_file_name(data_file)
+    tmp_name = '%s.%i' % (meta_file, os.getpid())
+    with open(tmp_name, 'w') as f:
+        f.write('# version %i\n' % META_FILE_VERSION)
+        f.write('# source %s %i %r\n' % (os.path.basename(data_file), st.st_size,
+                                        st.st_mtime))
+        f.write('rows %i\n' % meta.rows)
+        f.write('tmin %s\n' % _format_value(meta.tmin))
+        f.write('tmax %s\n' % _format_value(meta.tmax))
+        for i in range(len(meta.cols)):
+            f.write('col %i %s\n' % (i + 2, ' '.join([ _format_value(x)
+                                                      for x in meta.cols[i] ])))
+    os.rename(tmp_name, meta_file)
+
+    return meta_file
+
+
+## Get metadata of data file. The metadata is read from the metadata file if
+## it is up to date, otherwise it is computed and the metadata file is written.
+#  @param data_file Data file name
+#  @return FileMeta
+def get_file_meta(data_file):
+    meta = read_meta_file(data_file)
+    if meta is not None:
+        return meta
+
+    st = os.stat(data_file)
+    meta = compute_file_meta(data_file)
+    try:
+        write_meta_file(data_file, meta, st)
+    except (IOError, OSError) as e:
+        warn('Cannot write metadata file for %s: %s' % (data_file, str(e)))
+
+    return meta
+
+
+## Write metadata files for data files (at the time the data files are written)
+#  @param data_files List of data file names
+def write_meta_files(data_files):
+    for data_file in data_files:
+        try:
+            get_file_meta(data_file)
+        except (IOError, OSError) as e:
+            warn('Cannot get metadata of %s: %s' % (data_file, str(e)))
+
+
+## Check time window against the time range of the data files. If the start of
+## the time window is after the end of all data, the plot scripts plot from the
+## start of the data instead (there is nothing else to plot).
+#  @param file_names List of data file names
+#  @param stime Start time of time window (relative to the start of the data)
+#  @param etime End time of time window (0.0 means the end of the data)
+#  @param per_file True if time is relative to the start of each data file,
+#                  False if relative to the start of all data
+def check_time_window(file_names, stime, etime, per_file=True):
+    if etime > 0.0 and etime <= stime:
+        warn('End time %s must be larger than start time %s' % (etime, stime))
+        return
+
+    if stime <= 0.0:
+        return
+
+    metas = [ get_file_meta(f) for f in file_names ]
+    metas = [ m for m in metas if m.tmin is not None ]
+    if len(metas) == 0:
+        return
+
+    if per_file:
+        duration = max([ m.duration() for m in metas ])
+    else:
+        duration = max([ m.tmax for m in metas ]) - min([ m.tmin for m in metas ])
+
+    if stime > duration:
+        warn('Start time %s is after the end of the data (%.3f seconds)' %
+             (stime, duration))
@@ -25,46 +25,207 @@
 # SUCH DAMAGE.
 #
 ## @package flowcache
-# Functions to cache flows of experiments 
+# Functions to cache flows of experiments. The flows of each file (e.g.
+# tcpdump file) and the per-flow statistics are stored in an sqlite database
+# keyed by the absolute file name plus the size and modification time of the
+# file, so entries of files that changed are ignored. The database can be used
+# by parallel processes, entries are loaded per file when they are looked up.
 #
 # $Id: flowcache.py 1257 2015-04-20 08:20:40Z szander $
 
 import os
+import sqlite3
 import config
 from fabric.api import task, warn, local, run, execute, abort, hosts, env
 
 
-## Cache file name
+## Cache database file name
+CACHE_DB_NAME = 'teacup_flow_cache.db'
+## Cache file name of older versions (imported into the database once)
 CACHE_FILE_NAME = 'teacup_flow_cache.txt'
-## Flow cache. Index is the file name for which we have flows cached 
-## (e.g. tcpdump file), value is a list of flows (which can be empty) 
+## Seconds to wait for a lock held by another process
+CACHE_DB_TIMEOUT = 600
+
+## Database connection and the process id it was opened by (connections
+## cannot be shared with forked worker processes)
+db_conn = None
+db_conn_pid = None
+
+## Flow cache of this process. Index is the file name for which we have flows
+## cached (e.g. tcpdump file), value is a tuple of the file's identity
+## (size, modification time), the list of flows (which can be empty) and a map
+## of flows to (packets, bytes, first timestamp, last timestamp) tuples or None
+## if there are no statistics
 flow_cache = {}
 
-## Read cache file if exists
-def read_flow_cache():
 
-    if not os.path.isfile(CACHE_FILE_NAME):
-        return
+## Get identity of file
+#  @param fname File name
+#  @return Tuple of (absolute name, size, modification time), size and modification
+#          time are None if the file does not exist
+def _file_id(fname):
+    path = os.path.abspath(fname)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (path, None, None)
+
+    return (path, st.st_size, repr(st.st_mtime))
+
+
+## Get database connection, creates the database if it does not exist
+#  @return Connection
+def get_db():
+    global db_conn, db_conn_pid
+
+    if db_conn is not None and db_conn_pid == os.getpid():
+        return db_conn
+
+    new_db = not os.path.isfile(CACHE_DB_NAME)
+    db_conn = sqlite3.connect(CACHE_DB_NAME, timeout=CACHE_DB_TIMEOUT)
+    db_conn_pid = os.getpid()
+    db_conn.text_factory = str
+
+    with db_conn:
+        db_conn.execute('CREATE TABLE IF NOT EXISTS files ('
+                        'id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, '
+                        'size INTEGER, mtime TEXT, has_stats INTEGER NOT NULL)')
+        db_conn.execute('CREATE TABLE IF NOT EXISTS flows ('
+                        'file_id INTEGER NOT NULL, pos INTEGER NOT NULL, '
+                        'flow TEXT NOT NULL, pkts INTEGER, bytes INTEGER, '
+                        'first REAL, last REAL, PRIMARY KEY (file_id, pos))')
+
+    if new_db and os.path.isfile(CACHE_FILE_NAME):
+        import_flow_cache_file(CACHE_FILE_NAME, db_conn)
+
+    return db_conn
+
+
+## Store flows of a file in the database (replaces an existing entry)
+#  @param file_id Tuple of (absolute name, size, modification time)
+#  @param flows List of flows
+#  @param stats Map of flows to (packets, bytes, first timestamp, last timestamp)
+#               tuples or None
+#  @param db Database connection (the caller commits the transaction)
+def _store_flows(file_id, flows, stats, db):
+    path, size, mtime = file_id
+
+    # delete an existing entry first. the first DELETE opens the write
+    # transaction, so parallel processes storing the same file (both missed
+    # on lookup) are serialised and the second one replaces the first entry
+    db.execute('DELETE FROM flows WHERE file_id IN '
+               '(SELECT id FROM files WHERE path = ?)', (path, ))
+    db.execute('DELETE FROM files WHERE path = ?', (path, ))
+
+    cur = db.execute('INSERT INTO files (path, size, mtime, has_stats) '
+                     'VALUES (?, ?, ?, ?)', 
+                     (path, size, mtime, int(stats is not None)))
+    fid = cur.lastrowid
+
+    rows = []
+    for pos, flow in enumerate(flows):
+        if stats is not None:
+            pkts, bytes, first, last = stats[flow]
+        else:
+            pkts, bytes, first, last = (None, None, None, None)
+        rows.append((fid, pos, flow, pkts, bytes, first, last))
+    db.executemany('INSERT INTO flows VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+
+## Import cache file of older versions. Entries of files that do not exist
+## anymore are ignored
+#  @param cache_file_name Cache file name
+#  @param db Database connection
+def import_flow_cache_file(cache_file_name, db):
+    try:
+        # import all entries in one transaction
+        with open(cache_file_name, 'r') as f, db:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 0:
+                    continue
 
-    with open(CACHE_FILE_NAME, 'r') as f:
-        lines = f.readlines()
-        for line in lines:
-            fields = line.split()
-            if len(fields) == 2:
-                flow_cache[fields[0]] = fields[1].split(';')
-            else:
-                flow_cache[fields[0]] = []
+                file_id = _file_id(fields[0])
+                if file_id[1] is None:
+                    continue
 
+                # files without flows have empty statistics
+                flows = []
+                stats = {}
+                if len(fields) >= 2:
+                    flows = fields[1].split(';')
+                    stats = None
+                if len(fields) == 3:
+                    stats = {}
+                    for flow, stat in zip(flows, fields[2].split(';')):
+                        pkts, bytes, first, last = stat.split(',')
+                        stats[flow] = (int(pkts), int(bytes), float(first), float(last))
 
-## Append to cache if entry not in there yet. note that flows may be empty in which
-## case the flow field in the cache file will be empty
+                _store_flows(file_id, flows, stats, db)
+    except (IOError, ValueError) as e:
+        warn('Cannot import flow cache file %s: %s' % (cache_file_name, str(e)))
+
+
+## Load cache entry of a file from the database
+#  @param fname File name
+#  @return Tuple of (identity, flows, stats) or None if there is no entry for the
+#          current version of the file
+def _load_flows(fname):
+    file_id = _file_id(fname)
+    if file_id[1] is None:
+        return None
+
+    db = get_db()
+    row = db.execute('SELECT id, size, mtime, has_stats FROM files WHERE path = ?',
+                     (file_id[0], )).fetchone()
+    if row is None or (row[1], row[2]) != file_id[1:]:
+        return None
+
+    flows = []
+    stats = {} if row[3] else None
+    for flow, pkts, bytes, first, last in db.execute(
+            'SELECT flow, pkts, bytes, first, last FROM flows WHERE file_id = ? '
+            'ORDER BY pos', (row[0], )):
+        flows.append(flow)
+        if stats is not None:
+            stats[flow] = (pkts, bytes, first, last)
+
+    return (file_id[1:], flows, stats)
+
+
+## Add flows of a file to the cache. note that flows may be empty
 #  @param fname File name
 #  @param flows List of flows (5-tuples)
-def append_flow_cache(fname, flows):
+#  @param stats Map of flows to (packets, bytes, first timestamp, last timestamp)
+#               tuples (optional)
+def append_flow_cache(fname, flows, stats=None):
 
-    if fname not in flow_cache:
-        with open(CACHE_FILE_NAME, 'a') as f:
-            f.write('%s %s\n' % (fname, ';'.join(flows)))
+    if lookup_flow_cache(fname) is None:
+        file_id = _file_id(fname)
+        # the with statement commits the transaction, so concurrent readers
+        # never see an incomplete entry
+        db = get_db()
+        with db:
+            _store_flows(file_id, flows, stats, db)
+        flow_cache[fname] = (file_id[1:], flows, stats)
+
+
+## Get current cache entry of a file
+#  @param fname File name
+#  @return Tuple of (identity, flows, stats) or None
+def _lookup(fname):
+    entry = flow_cache.get(fname, None)
+    if entry is not None and entry[0] == _file_id(fname)[1:]:
+        return entry
+
+    # load entry from database if not cached or file changed
+    entry = _load_flows(fname)
+    if entry is not None:
+        flow_cache[fname] = entry
+    elif fname in flow_cache:
+        del flow_cache[fname]
+
+    return entry
 
 
 ## Perform cache lookup. If we have entry for file name return list of flows that can be
@@ -73,12 +234,21 @@ def append_flow_cache(fname, flows):
 #  @return List of flows (semicolon separated) or None
 def lookup_flow_cache(fname):
 
-    # load cache first if cache is empty
-    if len(flow_cache) == 0:
-        read_flow_cache()
-
-    if fname in flow_cache:
-        return flow_cache[fname]
+    entry = _lookup(fname)
+    if entry is not None:
+        return entry[1]
     else:
-        return None 
+        return None
+
 
+## Perform cache lookup of flow statistics
+#  @param fname File name for which we want to know flow statistics
+#  @return Map of flows to (packets, bytes, first timestamp, last timestamp) tuples
+#          or None if there are no statistics for the file 
+def lookup_flow_stats(fname):
+
+    entry = _lookup(fname)
+    if entry is not None:
+        return entry[2]
+    else:
+        return None
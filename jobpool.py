@@ -0,0 +1,160 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package jobpool
+# Run analysis tasks in parallel in a pool of worker processes
+#
+# $Id$
+
+import sys
+import signal
+import traceback
+from multiprocessing import Pool, current_process
+from fabric.api import warn, puts, abort, execute
+
+
+## Job that executes a task. Jobs are passed to worker processes, so tasks
+## are specified by module and name (task objects cannot be pickled)
+class Job:
+
+    ## Create job
+    #  @param module Name of module with the task (e.g. 'analyse')
+    #  @param name Name of the task function (e.g. 'extract_rtt')
+    #  @param args Positional parameters of the task
+    #  @param kwargs Keyword parameters of the task
+    def __init__(self, module, name, *args, **kwargs):
+        self.module = module
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+
+    ## Job description used in messages
+    def __str__(self):
+        if len(self.args) > 0:
+            return '%s %s' % (self.name, self.args[0])
+        elif 'test_id' in self.kwargs:
+            return '%s %s' % (self.name, self.kwargs['test_id'])
+        return self.name
+
+    ## Get the task function
+    def get_function(self):
+        __import__(self.module)
+        return getattr(sys.modules[self.module], self.name)
+
+    ## Execute the task
+    def run(self):
+        execute(self.get_function(), *self.args, **self.kwargs)
+
+
+## Job that calls a plain (non-task) function, e.g. an internal extract function
+class FunctionJob(Job):
+
+    ## Call the function
+    def run(self):
+        self.get_function()(*self.args, **self.kwargs)
+
+
+## Initialise worker process
+def _init_worker():
+    # Ctrl-C is handled by the main process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+## Run job in worker process
+#  @param job Job
+#  @return Tuple of (job description, error message or '')
+def _run_job(job):
+    try:
+        job.run()
+    except SystemExit:
+        # Fabric's abort() raises SystemExit, the error message has already been
+        # printed
+        return (str(job), 'aborted')
+    except Exception:
+        return (str(job), traceback.format_exc())
+
+    return (str(job), '')
+
+
+## Run jobs. With one worker jobs are executed in order in this process (the
+## behaviour is the same as calling execute() for each job), otherwise jobs are
+## distributed over a pool of worker processes.
+#  @param jobs List of Job objects
+#  @param num_workers Number of worker processes
+def run_jobs(jobs, num_workers='1'):
+
+    num_workers = int(num_workers)
+    if num_workers < 1:
+        abort('Number of jobs must be at least 1')
+
+    # worker processes cannot have worker processes themselves
+    if current_process().daemon:
+        num_workers = 1
+
+    if num_workers == 1:
+        for i, job in enumerate(jobs):
+            job.run()
+            puts('Completed job %i of %i: %s' % (i + 1, len(jobs), job))
+        return
+
+    num_workers = min(num_workers, len(jobs))
+    if num_workers == 0:
+        return
+
+    puts('Running %i jobs with %i workers' % (len(jobs), num_workers))
+
+    pool = Pool(num_workers, _init_worker)
+    errors = []
+    done = 0
+    try:
+        # the timeout makes get() interruptible by Ctrl-C
+        results = pool.imap_unordered(_run_job, jobs, 1)
+        while True:
+            try:
+                desc, error = results.next(86400 * 365)
+            except StopIteration:
+                break
+
+            done += 1
+            if error != '':
+                errors.append((desc, error))
+                warn('Job %s failed' % desc)
+            puts('Completed job %i of %i: %s' % (done, len(jobs), desc))
+
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        pool.join()
+        abort('Interrupted')
+
+    pool.join()
+
+    if len(errors) > 0:
+        for desc, error in errors:
+            if error != 'aborted':
+                warn('Job %s failed:\n%s' % (desc, error))
+        abort('%i of %i jobs failed: %s' % (len(errors), len(jobs),
+              ', '.join([ desc for desc, error in errors ])))
@@ -0,0 +1,443 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package metricsdb
+# Metrics database. Each result directory has an SQLite database
+# (teacup_metrics.db) that holds one row per extracted data file, i.e. per
+# (experiment, flow, metric) where the metric is identified by the file
+# extension, with the number of rows and the time range (taken from the
+# metadata files, see filemeta). The database also holds the experiment
+# parameters decoded from the test IDs (the short names and values used in the
+# test IDs). The extract functions record their data files when they are
+# written, so analyse_cmpexp and analyse_2d_density can select the experiments
+# by parameter values and the data files of an experiment with indexed queries
+# instead of matching test IDs with regular expressions, searching the result
+# directory and counting lines of each file. When an extract function has
+# finished, the (experiment, metric) pairs it extracted are recorded together
+# with the source filter, so completely extracted experiments can be skipped.
+#
+# Entries are checked against the size and modification time of the data file
+# before they are used, outdated entries are recomputed.
+#
+# $Id$
+
+import os
+import re
+import sqlite3
+from fabric.api import warn
+import config
+
+from coldata import FLOW_KEY_REGEX
+from filemeta import get_file_meta, write_meta_files
+
+
+## Database file name (one database in each result directory)
+METRICS_DB_NAME = 'teacup_metrics.db'
+## Default test ID prefix (see build_match_strings())
+TEST_ID_PREFIX = '[0-9]{8}\-[0-9]{6}_experiment_'
+## Seconds to wait for the database lock held by another process
+LOCK_TIMEOUT = 60.0
+
+## Database schema
+_schema = [
+    'CREATE TABLE IF NOT EXISTS experiments (test_id TEXT PRIMARY KEY, prefix TEXT)',
+    'CREATE TABLE IF NOT EXISTS params (test_id TEXT, name TEXT, value TEXT, '
+    'PRIMARY KEY (test_id, name))',
+    'CREATE INDEX IF NOT EXISTS params_name_value ON params (name, value)',
+    'CREATE TABLE IF NOT EXISTS metrics (file_name TEXT PRIMARY KEY, test_id TEXT, '
+    'flow TEXT, metric TEXT, size INTEGER, mtime TEXT, rows INTEGER, tmin REAL, '
+    'tmax REAL)',
+    'CREATE INDEX IF NOT EXISTS metrics_test_id ON metrics (test_id, metric)',
+    'CREATE TABLE IF NOT EXISTS extractions (test_id TEXT, metric TEXT, '
+    'source_filter TEXT, PRIMARY KEY (test_id, metric))',
+]
+
+## Open databases. Index is the directory name, value is MetricsDB or None
+## if the database cannot be opened
+metrics_dbs = {}
+
+
+## Return true if the metrics database is used (TPCONF_metrics_db in
+## config.py, enabled by default)
+#  @return True if metrics database is enabled, otherwise False
+def metrics_db_enabled():
+    try:
+        return bool(int(config.TPCONF_metrics_db))
+    except AttributeError:
+        return True
+
+
+## Decode experiment parameters from test ID. After the test ID prefix the test
+## ID consists of <name>_<value> pairs separated by underscores.
+#  @param test_id Test ID
+#  @param test_id_prefix Regular expression matching the test ID prefix
+#  @return Test ID prefix and list of (name, value) tuples, or ('', []) if
+#          the test ID prefix does not match
+def decode_test_id(test_id, test_id_prefix=TEST_ID_PREFIX):
+    res = re.search(test_id_prefix, test_id)
+    if res == None:
+        return ('', [])
+
+    prefix = test_id[:res.end()]
+    fields = test_id[res.end():].lstrip('_').split('_')
+
+    return (prefix, zip(fields[::2], fields[1::2]))
+
+
+## Split data file name into test ID, flow and metric (the file extension
+## following the flow)
+#  @param data_file Data file name
+#  @return Tuple of (test ID, flow, metric) or None if file name has no flow
+def split_data_file_name(data_file):
+    name = os.path.basename(data_file)
+    res = re.search(FLOW_KEY_REGEX, name)
+    if res == None:
+        return None
+
+    return (name[:res.start()], res.group(1), name[res.end():])
+
+
+## Metrics database of one result directory
+class MetricsDB:
+
+    ## Open database, the database is created if it does not exist
+    #  @param dir_name Result directory
+    def __init__(self, dir_name):
+        self.dir_name = dir_name
+        # connections must not be used across fork()
+        self.pid = os.getpid()
+        self.conn = sqlite3.connect(os.path.join(dir_name, METRICS_DB_NAME),
+                                    timeout=LOCK_TIMEOUT)
+        self.conn.text_factory = str
+        with self.conn:
+            for stmt in _schema:
+                self.conn.execute(stmt)
+
+    ## Record experiments and their parameters
+    #  @param test_ids List of test IDs
+    #  @param test_id_prefix Regular expression matching the test ID prefix
+    def record_experiments(self, test_ids, test_id_prefix=TEST_ID_PREFIX):
+        with self.conn:
+            for test_id in test_ids:
+                (prefix, params) = decode_test_id(test_id, test_id_prefix)
+                self.conn.execute('INSERT OR REPLACE INTO experiments VALUES (?, ?)',
+                                  (test_id, prefix))
+                self.conn.execute('DELETE FROM params WHERE test_id = ?', (test_id, ))
+                self.conn.executemany('INSERT INTO params VALUES (?, ?, ?)',
+                                      [ (test_id, n, v) for (n, v) in params ])
+
+    ## Select experiments by parameter values
+    #  @param test_ids List of test IDs to select from
+    #  @param variables List of (name, value) tuples, the experiments must have all
+    #                   parameters, an empty value matches any value
+    #  @return List of (test ID, map of parameter names to values) tuples of the
+    #          selected experiments in the order of test_ids
+    def select_experiments(self, test_ids, variables):
+        queries = []
+        args = []
+        for (name, value) in variables:
+            if value == '':
+                queries.append('SELECT test_id FROM params WHERE name = ?')
+                args.append(name)
+            else:
+                queries.append('SELECT test_id FROM params WHERE name = ? AND '
+                               'value = ?')
+                args += [ name, value ]
+
+        cur = self.conn.execute(' INTERSECT '.join(queries), args)
+        matched = set([ test_id for (test_id, ) in cur.fetchall() ])
+
+        selected = []
+        for test_id in test_ids:
+            if test_id in matched:
+                cur = self.conn.execute('SELECT name, value FROM params WHERE '
+                                        'test_id = ?', (test_id, ))
+                selected.append((test_id, dict(cur.fetchall())))
+
+        return selected
+
+    ## Record data file, the statistics are taken from the metadata file
+    #  @param data_file Data file name
+    #  @param st Result of os.stat() for data file
+    #  @return Number of rows
+    def record_file(self, data_file, st):
+        (test_id, flow, metric) = split_data_file_name(data_file)
+        meta = get_file_meta(data_file)
+        (rows, tmin, tmax) = (meta.rows, meta.tmin, meta.tmax)
+
+        with self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO experiments VALUES (?, ?)',
+                              (test_id, decode_test_id(test_id)[0]))
+            self.conn.execute('INSERT OR REPLACE INTO metrics VALUES '
+                              '(?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                              (data_file, test_id, flow, metric, st.st_size,
+                               repr(st.st_mtime), rows, tmin, tmax))
+
+        return rows
+
+    ## Record that extraction of experiment and metric has finished
+    #  @param test_id Test ID
+    #  @param metric Metric (file extension following the flow)
+    #  @param source_filter Source filter used for extraction
+    def record_extraction(self, test_id, metric, source_filter):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO extractions VALUES (?, ?, ?)',
+                              (test_id, metric, source_filter))
+
+    ## Check if experiment has been extracted completely. Extraction must have
+    ## finished with the same source filter or without source filter, and
+    ## the data files of all flows must still exist
+    #  @param test_id Test ID
+    #  @param ext File extension (the metric must end with it)
+    #  @param source_filter Source filter
+    #  @return True if extracted, otherwise False
+    def is_extracted(self, test_id, ext, source_filter):
+        cur = self.conn.execute('SELECT source_filter FROM extractions WHERE '
+                                'test_id = ? AND substr(metric, -?) = ?',
+                                (test_id, len(ext), ext))
+        filters = [ sfil for (sfil, ) in cur.fetchall() ]
+        if len(filters) == 0:
+            return False
+        for sfil in filters:
+            if sfil != '' and sfil != source_filter:
+                return False
+
+        cur = self.conn.execute('SELECT file_name FROM metrics WHERE test_id = ? '
+                                'AND substr(metric, -?) = ?',
+                                (test_id, len(ext), ext))
+        for (data_file, ) in cur.fetchall():
+            if not os.path.isfile(data_file):
+                return False
+
+        return True
+
+    ## Remove data file
+    #  @param data_file Data file name
+    def remove_file(self, data_file):
+        with self.conn:
+            self.conn.execute('DELETE FROM metrics WHERE file_name = ?', (data_file, ))
+
+    ## Get number of rows of data file, recomputed if data file has changed
+    #  @param data_file Data file name
+    #  @return Number of rows or -1 if data file does not exist
+    def get_rows(self, data_file):
+        try:
+            st = os.stat(data_file)
+        except OSError:
+            self.remove_file(data_file)
+            return -1
+
+        row = self.conn.execute('SELECT size, mtime, rows FROM metrics WHERE '
+                                'file_name = ?', (data_file, )).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == repr(st.st_mtime):
+            return row[2]
+
+        return self.record_file(data_file, st)
+
+    ## Get data files of experiment
+    #  @param test_id Test ID
+    #  @param ext File extension (the metric must end with it)
+    #  @return Sorted list of data file names that exist
+    def get_files(self, test_id, ext):
+        cur = self.conn.execute('SELECT file_name FROM metrics WHERE test_id = ? '
+                                'AND substr(metric, -?) = ? ORDER BY file_name',
+                                (test_id, len(ext), ext))
+        files = []
+        for (data_file, ) in cur.fetchall():
+            if os.path.isfile(data_file):
+                files.append(data_file)
+            else:
+                self.remove_file(data_file)
+
+        return files
+
+    def close(self):
+        self.conn.close()
+
+
+## Get metrics database of directory
+#  @param dir_name Directory name
+#  @return MetricsDB or None if database cannot be opened
+def get_metrics_db(dir_name):
+    if dir_name == '':
+        dir_name = '.'
+    dir_name = os.path.normpath(dir_name)
+
+    db = metrics_dbs.get(dir_name, None)
+    if dir_name not in metrics_dbs or (db is not None and db.pid != os.getpid()):
+        try:
+            metrics_dbs[dir_name] = MetricsDB(dir_name)
+        except sqlite3.Error as e:
+            warn('Cannot open metrics database in %s: %s' % (dir_name, str(e)))
+            metrics_dbs[dir_name] = None
+
+    return metrics_dbs[dir_name]
+
+
+## Write metadata files of data files and record the data files in the
+## metrics databases of their directories. Files without flow in the name
+## are not recorded.
+#  @param data_files List of data file names
+def record_data_files(data_files):
+    write_meta_files(data_files)
+
+    if not metrics_db_enabled():
+        return
+
+    for data_file in data_files:
+        if split_data_file_name(data_file) is None:
+            continue
+
+        db = get_metrics_db(os.path.dirname(data_file))
+        if db is None:
+            continue
+
+        try:
+            db.record_file(data_file, os.stat(data_file))
+        except (OSError, IOError, sqlite3.Error) as e:
+            warn('Cannot record %s in metrics database: %s' % (data_file, str(e)))
+
+
+## Record the data files returned by an extract function and write their
+## metadata files. The extract function must have finished, the experiments
+## and metrics of the data files are recorded as extracted.
+#  @param out_files Map of flow names to file names or lists of file names
+#  @param source_filter Source filter used by the extract function
+def record_out_files(out_files, source_filter=''):
+    data_files = []
+    for name in out_files:
+        if isinstance(out_files[name], list):
+            data_files += out_files[name]
+        else:
+            data_files.append(out_files[name])
+
+    record_data_files(data_files)
+
+    if not metrics_db_enabled():
+        return
+
+    extractions = set()
+    for data_file in data_files:
+        split = split_data_file_name(data_file)
+        if split is not None:
+            extractions.add((os.path.dirname(data_file), split[0], split[2]))
+
+    for (dir_name, test_id, metric) in extractions:
+        db = get_metrics_db(dir_name)
+        if db is None:
+            continue
+
+        try:
+            db.record_extraction(test_id, metric, source_filter)
+        except sqlite3.Error as e:
+            warn('Cannot record extraction in metrics database: %s' % str(e))
+
+
+## Check if experiment has been extracted completely for a metric (see
+## MetricsDB.is_extracted())
+#  @param res_dir Result directory
+#  @param test_id Test ID
+#  @param ext File extension
+#  @param source_filter Source filter
+#  @return True if extracted, False if not or we don't know
+def lookup_extracted(res_dir, test_id, ext, source_filter):
+    if not metrics_db_enabled():
+        return False
+
+    db = get_metrics_db(res_dir)
+    if db is None:
+        return False
+
+    try:
+        return db.is_extracted(test_id, ext, source_filter)
+    except sqlite3.Error as e:
+        warn('Cannot query metrics database: %s' % str(e))
+        return False
+
+
+## Select experiments by parameter values. All experiments are recorded in the
+## database first.
+#  @param res_dir Result directory
+#  @param experiments List of test IDs
+#  @param variables List of (name, value) tuples, an empty value matches any value
+#  @param test_id_prefix Regular expression matching the test ID prefix
+#  @return List of (test ID, map of parameter names to values) tuples of the
+#          selected experiments, or None if the database cannot be used
+def lookup_experiments(res_dir, experiments, variables,
+                       test_id_prefix=TEST_ID_PREFIX):
+    if not metrics_db_enabled() or len(variables) == 0:
+        return None
+
+    db = get_metrics_db(res_dir)
+    if db is None:
+        return None
+
+    try:
+        db.record_experiments(experiments, test_id_prefix)
+        return db.select_experiments(experiments, variables)
+    except sqlite3.Error as e:
+        warn('Cannot select experiments from metrics database: %s' % str(e))
+        return None
+
+
+## Look up data files of experiment in metrics database
+#  @param res_dir Result directory
+#  @param test_id Test ID
+#  @param ext File extension
+#  @return Sorted list of data file names, or empty list if unknown
+def lookup_data_files(res_dir, test_id, ext):
+    if not metrics_db_enabled():
+        return []
+
+    db = get_metrics_db(res_dir)
+    if db is None:
+        return []
+
+    try:
+        return db.get_files(test_id, ext)
+    except sqlite3.Error as e:
+        warn('Cannot query metrics database: %s' % str(e))
+        return []
+
+
+## Get number of rows of data file from metrics database or metadata file, the
+## database is updated if the data file is not recorded yet or has changed
+#  @param data_file Data file name
+#  @return Number of rows
+def get_data_file_rows(data_file):
+    db = None
+    if metrics_db_enabled() and split_data_file_name(data_file) is not None:
+        db = get_metrics_db(os.path.dirname(data_file))
+
+    if db is not None:
+        try:
+            rows = db.get_rows(data_file)
+            if rows >= 0:
+                return rows
+        except sqlite3.Error as e:
+            warn('Cannot query metrics database: %s' % str(e))
+
+    return get_file_meta(data_file).rows
@@ -0,0 +1,155 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package oldconfig
+# Functions to access the TPCONF_ variables archived in the experiment
+# directory (<test_id_prefix>_tpconf_vars.log.gz) 
+#
+# $Id$
+
+import os
+import re
+import ast
+import gzip
+import cPickle
+from fabric.api import warn
+
+from filefinder import find_files
+
+
+## Variables we need from the archived config
+OLD_CONFIG_VARS = ('TPCONF_host_internal_ip', 'TPCONF_hosts', 'TPCONF_router',
+                   'TPCONF_bc_ping_address')
+## Cache file name (one cache file in each experiment directory)
+CACHE_FILE_NAME = 'teacup_tpconf_vars.pickle'
+## Cache. Index is the directory name, value is the dictionary of variables
+## or None if there is no tpconf_vars file in the directory 
+old_config_cache = {}
+
+
+## Parse archived TPCONF_ variables. The file has one line per variable of the
+## form <name> = <repr of value> (see dump_config_vars()). Only literal values
+## are evaluated, the file is never executed. 
+#  @param var_file Name of gzipped tpconf_vars file
+#  @param names Names of variables to extract
+#  @return Dictionary of variables (variables not found are not in dictionary)
+def parse_config_vars(var_file, names=OLD_CONFIG_VARS):
+    config_vars = {}
+    assignment = re.compile('^(TPCONF_\w+)\s*=\s*(.*)$')
+
+    f = gzip.open(var_file, 'rb')
+    try:
+        for line in f:
+            res = assignment.match(line.rstrip())
+            if res is None or res.group(1) not in names:
+                continue
+
+            try:
+                config_vars[res.group(1)] = ast.literal_eval(res.group(2))
+            except (ValueError, SyntaxError):
+                warn('Cannot parse %s in %s' % (res.group(1), var_file))
+    finally:
+        f.close()
+
+    return config_vars
+
+
+## Read variables from cache file in experiment directory
+#  @param cache_file Cache file name
+#  @param var_file Name of tpconf_vars file
+#  @param st Result of os.stat() for var_file
+#  @return Dictionary of variables or None if cache file does not exist or
+#          is not valid for var_file
+def read_cache_file(cache_file, var_file, st):
+    try:
+        with open(cache_file, 'rb') as f:
+            (source, size, mtime, config_vars) = cPickle.load(f)
+    except (IOError, EOFError, ValueError, TypeError, cPickle.UnpicklingError):
+        return None
+
+    if source != os.path.basename(var_file) or size != st.st_size or \
+       mtime != st.st_mtime:
+        return None
+
+    return config_vars
+
+
+## Write variables to cache file in experiment directory (the file is written
+## under a temporary name first, so parallel processes never read a partially
+## written file). If the directory is not writable we simply have no cache.
+#  @param cache_file Cache file name
+#  @param var_file Name of tpconf_vars file
+#  @param st Result of os.stat() for var_file
+#  @param config_vars Dictionary of variables
+def write_cache_file(cache_file, var_file, st, config_vars):
+    tmp_name = '%s.%i' % (cache_file, os.getpid())
+    try:
+        with open(tmp_name, 'wb') as f:
+            cPickle.dump((os.path.basename(var_file), st.st_size, st.st_mtime,
+                         config_vars), f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_name, cache_file)
+    except (IOError, OSError):
+        try:
+            os.remove(tmp_name)
+        except OSError:
+            pass
+
+
+## Get archived TPCONF_ variables for experiment directory
+#  @param dir_name Experiment directory
+#  @return Dictionary of variables or None if there is no tpconf_vars file
+#          (experiment run with TEACUP version before 0.9)
+def get_old_config(dir_name):
+    global old_config_cache
+
+    if dir_name in old_config_cache:
+        return old_config_cache[dir_name]
+
+    var_files = sorted(find_files(dir_name, '*tpconf_vars.log.gz'))
+    if len(var_files) == 0:
+        old_config_cache[dir_name] = None
+        return None
+
+    var_file = var_files[0]
+    if dir_name == '':
+        cache_file = CACHE_FILE_NAME
+    else:
+        cache_file = os.path.join(dir_name, CACHE_FILE_NAME)
+
+    try:
+        st = os.stat(var_file)
+    except OSError:
+        old_config_cache[dir_name] = None
+        return None
+
+    config_vars = read_cache_file(cache_file, var_file, st)
+    if config_vars is None:
+        config_vars = parse_config_vars(var_file)
+        write_cache_file(cache_file, var_file, st, config_vars)
+
+    old_config_cache[dir_name] = config_vars
+
+    return config_vars
@@ -0,0 +1,285 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package pcapconsumers
+# Packet consumers for the metrics extracted from tcpdump files. The output
+# of each consumer is identical to the output of the tcpdump pipeline it
+# replaces.
+#
+# $Id$
+
+import re
+from collections import deque
+from pcapreader import PcapConsumer, pcap_file_header, pcap_record, \
+                       IPPROTO_TCP, IPPROTO_UDP, TH_PUSH, TH_ACK
+
+
+## Number of output lines buffered before they are appended to a file
+## (we cannot keep a file open for each of hundreds of flows)
+FLUSH_LINES = 4096
+
+
+## Consumer that writes text lines into an output file
+class LineWriterConsumer(PcapConsumer):
+
+    ## Create consumer
+    #  @param out_file Output file name
+    def __init__(self, out_file):
+        self.out_file = out_file
+        self.lines = []
+
+    def start(self, reader):
+        # create/truncate output file
+        open(self.out_file, 'wb').close()
+
+    ## Queue line for writing
+    #  @param line Line including trailing newline
+    def write(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= FLUSH_LINES:
+            self.flush()
+
+    ## Append queued lines to output file
+    def flush(self):
+        if len(self.lines) > 0:
+            with open(self.out_file, 'ab') as f:
+                f.writelines(self.lines)
+            self.lines = []
+
+    def finish(self):
+        self.flush()
+
+
+## TCP and UDP flows with statistics, replaces
+## tcpdump -nr - "tcp" | awk '{ if ( $2 == "IP" ) { print $3 " " $5 " tcp" } }' | 
+## sed "s/://" | sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | LC_ALL=C sort -u
+## and the same for "udp". Register with PcapDemux.add_all().
+class FlowStatsConsumer(PcapConsumer):
+
+    def __init__(self):
+        ## map of (src, sport, dst, dport, proto) to [ packets, bytes, first, last ]
+        self.stats = {}
+
+    def packet(self, pkt):
+        if pkt.sport is None:
+            return
+        if pkt.proto == IPPROTO_TCP:
+            proto = 'tcp'
+        elif pkt.proto == IPPROTO_UDP:
+            proto = 'udp'
+        else:
+            return
+
+        key = (pkt.src, pkt.sport, pkt.dst, pkt.dport, proto)
+        t = pkt.time()
+        stat = self.stats.get(key)
+        if stat is None:
+            self.stats[key] = [ 1, pkt.iplen, t, t ]
+        else:
+            stat[0] += 1
+            stat[1] += pkt.iplen
+            if t < stat[2]:
+                stat[2] = t
+            if t > stat[3]:
+                stat[3] = t
+
+    ## Get flows and statistics
+    #  @return Tuple of list of flows (TCP flows sorted first, then UDP flows sorted)
+    #          with format <src>,<src_port>,<dst>,<dst_port>,<proto> and map of flows 
+    #          to (packets, bytes, first timestamp, last timestamp) tuples
+    def get_flows(self):
+        tcp_flows = []
+        udp_flows = []
+        stats = {}
+        for key, stat in self.stats.items():
+            flow = '%s,%i,%s,%i,%s' % key
+            stats[flow] = tuple(stat)
+            if key[4] == 'tcp':
+                tcp_flows.append(flow)
+            else:
+                udp_flows.append(flow)
+
+        return (sorted(tcp_flows) + sorted(udp_flows), stats)
+
+
+## Packet sizes, replaces
+## tcpdump -v -tt | awk '{ print $1 " " $NF }' | grep ")$" | sed -e "s/)//" (IP length) and
+## tcpdump -e -tt | grep "ethertype IP" | awk '{ print $1 " " $9 }' | sed -e "s/://"
+## (link-layer length)
+class PktSizeConsumer(LineWriterConsumer):
+
+    ## Create consumer
+    #  @param out_file Output file name
+    #  @param link_len '0' IP length, '1' link-layer length
+    def __init__(self, out_file, link_len='0'):
+        LineWriterConsumer.__init__(self, out_file)
+        self.link_len = link_len
+
+    def packet(self, pkt):
+        if self.link_len == '0':
+            self.write('%s %i\n' % (pkt.ts(), pkt.iplen))
+        else:
+            self.write('%s %i\n' % (pkt.ts(), pkt.wirelen))
+
+
+## Pure ACKs (tcp[tcpflags] == tcp-ack) with ACK number relative to the first ACK,
+## replaces tcpdump -S -tt | awk '{ ... print $1 " " $(i+1) - <base ACK> ... }'
+class AckSeqConsumer(LineWriterConsumer):
+
+    def __init__(self, out_file):
+        LineWriterConsumer.__init__(self, out_file)
+        self.base_ack = None
+
+    def packet(self, pkt):
+        if pkt.proto != IPPROTO_TCP or pkt.flags != TH_ACK:
+            return
+
+        if self.base_ack is None:
+            self.base_ack = pkt.ack
+
+        self.write('%s %i\n' % (pkt.ts(), pkt.ack - self.base_ack))
+
+
+## Consumer that writes all packets it gets into a tcpdump file,
+## replaces tcpdump -w
+class PcapWriterConsumer(LineWriterConsumer):
+
+    def start(self, reader):
+        if reader is not None:
+            header = pcap_file_header(reader.snaplen, reader.linktype)
+        else:
+            header = pcap_file_header()
+        with open(self.out_file, 'wb') as f:
+            f.write(header)
+
+    def packet(self, pkt):
+        self.write(pcap_record(pkt))
+
+
+## Translation table that emulates tcpdump -A, non-printable characters
+## except tab, space and newline are printed as '.'
+_ascii_table = ''.join([ chr(c) if (c > 32 and c < 127) or chr(c) in '\t \n' else '.'
+                         for c in range(256) ])
+
+
+## Render packet like tcpdump -A prints it (without link-layer header)
+#  @param pkt Packet
+#  @return List of output lines
+def tcpdump_ascii_lines(pkt):
+    text = pkt.data[pkt.ip_off:]
+    # tcpdump does not print carriage returns in front of newlines
+    text = text.replace('\r\n', '\n').translate(_ascii_table)
+
+    header = '%s IP %s.%i > %s.%i: tcp' % (pkt.ts(), pkt.src, pkt.sport, pkt.dst, pkt.dport)
+    return [ header ] + text.split('\n')
+
+
+## Emulates grep -B <before> <pattern> | egrep "IP" on tcpdump -A output.
+## Returns the awk-style fields of each selected line.
+class GrepContext:
+
+    ## Create grep context
+    #  @param pattern Pattern string (no regex)
+    #  @param before Number of lines printed before a matching line
+    def __init__(self, pattern, before):
+        self.pattern = pattern
+        self.ctx = deque(maxlen=before)
+
+    ## Feed next output line
+    #  @param line Line
+    #  @return List of field lists of the selected lines containing 'IP'
+    def feed(self, line):
+        if line.find(self.pattern) == -1:
+            self.ctx.append(line)
+            return []
+
+        # context lines are only printed once
+        selected = list(self.ctx) + [ line ]
+        self.ctx.clear()
+
+        return [ l.split() for l in selected if l.find('IP') >= 0 ]
+
+
+## Return awk field
+#  @param fields List of fields
+#  @param n Field number (starting with 1)
+#  @return Field or empty string
+def _awk_field(fields, n):
+    if len(fields) >= n:
+        return fields[n - 1]
+    return ''
+
+
+## Incast queries, replaces
+## tcpdump -A -tt "tcp[tcpflags] & tcp-push != 0" | grep -B 5 "GET" | egrep "IP" |
+## awk '{ print $1 " " $5; }' | sed 's/\.\([0-9]*\):/ \1/'
+class IncastQueryConsumer(LineWriterConsumer):
+
+    def __init__(self, out_file):
+        LineWriterConsumer.__init__(self, out_file)
+        self.grep = GrepContext('GET', 5)
+        self.sed = re.compile('\.([0-9]*):')
+
+    def packet(self, pkt):
+        if pkt.proto != IPPROTO_TCP or pkt.flags is None or pkt.flags & TH_PUSH == 0:
+            return
+
+        for line in tcpdump_ascii_lines(pkt):
+            for fields in self.grep.feed(line):
+                out = _awk_field(fields, 1) + ' ' + _awk_field(fields, 5)
+                self.write(self.sed.sub(' \\1', out, 1) + '\n')
+
+
+## Incast requests and responses between querier and one responder, replaces
+## tcpdump -A -tt "host <h> && port <p> && tcp[tcpflags] & tcp-push != 0" |
+## grep -B 10 "GET" | egrep "IP" | awk '{ print $1 " " $3 " " $5; }' | sed 's/://'
+## followed by the last packet (tcpdump ... | tail -1). Register with
+## PcapDemux.add_host_port(). The lines are kept in memory.
+class IncastResponseConsumer(PcapConsumer):
+
+    def __init__(self):
+        self.grep = GrepContext('GET', 10)
+        self.lines = []
+        self.last = None
+
+    def packet(self, pkt):
+        if pkt.proto != IPPROTO_TCP or pkt.flags is None or pkt.flags & TH_PUSH == 0:
+            return
+
+        for line in tcpdump_ascii_lines(pkt):
+            for fields in self.grep.feed(line):
+                self.lines.append(self._format(fields))
+
+        self.last = '%s %s.%i %s.%i' % (pkt.ts(), pkt.src, pkt.sport, pkt.dst, pkt.dport)
+
+    def _format(self, fields):
+        out = _awk_field(fields, 1) + ' ' + _awk_field(fields, 3) + ' ' + \
+              _awk_field(fields, 5)
+        return out.replace(':', '', 1)
+
+    def finish(self):
+        if self.last is not None:
+            self.lines.append(self.last)
@@ -0,0 +1,934 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package pcapreader
+# Native reader and demultiplexer for (gzip-compressed) tcpdump files.
+# Each file is decompressed and decoded only once, and each packet is handed
+# to all consumers registered for the packet's flow.
+#
+# $Id$
+
+import os
+import gzip
+import shutil
+import socket
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from fabric.api import warn, abort, puts
+
+
+## Magic number of pcap files with microsecond timestamps
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+## Magic number of pcap files with nanosecond timestamps
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+
+## Link-layer types we can decode
+DLT_NULL = 0
+DLT_EN10MB = 1
+DLT_RAW = 101
+DLT_LINUX_SLL = 113
+## DLT_RAW is 12 or 14 on some platforms
+DLT_RAW_ALT = (12, 14)
+
+## Ethertype of IPv4
+ETHERTYPE_IP = 0x0800
+
+## IP protocol numbers
+IPPROTO_ICMP = 1
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+## TCP flags
+TH_FIN = 0x01
+TH_SYN = 0x02
+TH_RST = 0x04
+TH_PUSH = 0x08
+TH_ACK = 0x10
+
+## Size of chunks read from the (decompressed) file
+READ_CHUNK_SIZE = 1048576
+## Largest record we accept, anything larger means the file is corrupt
+MAX_RECORD_SIZE = 262144
+
+## Extension of flow index files
+INDEX_FILE_EXT = '.idx'
+## Version of flow index file format
+INDEX_VERSION = 2
+## Number of offsets or timestamps packed or unpacked at once when writing or
+## reading flow index files
+INDEX_CHUNK_ITEMS = 65536
+
+## Cache of IPv4 addresses in dotted notation
+_addr_cache = {}
+
+
+## Convert 4-byte packed IPv4 address into dotted notation
+#  @param packed Packed address
+#  @return Address string
+def _ntoa(packed):
+    addr = _addr_cache.get(packed)
+    if addr is None:
+        addr = socket.inet_ntoa(packed)
+        _addr_cache[packed] = addr
+
+    return addr
+
+
+## Open tcpdump file, which can be gzip-compressed or uncompressed
+#  @param fname File name
+#  @return File object
+def open_pcap(fname):
+    f = open(fname, 'rb')
+    magic = f.read(2)
+    if magic == '\x1f\x8b':
+        f.close()
+        f = gzip.open(fname, 'rb')
+    else:
+        f.seek(0)
+
+    return f
+
+
+## Decoded IPv4 packet
+class Packet:
+
+    ## Fill in packet from pcap record
+    #  @param offset Offset of record in uncompressed file
+    #  @param sec Timestamp seconds
+    #  @param usec Timestamp microseconds
+    #  @param wirelen Length of packet on the wire
+    #  @param data Captured bytes (including link-layer header)
+    #  @param ip_off Offset of IP header in data
+    def __init__(self, offset, sec, usec, wirelen, data, ip_off):
+        self.offset = offset
+        self.sec = sec
+        self.usec = usec
+        self.wirelen = wirelen
+        self.data = data
+        self.ip_off = ip_off
+        ## transport protocol fields are None if not present or not captured
+        self.sport = None
+        self.dport = None
+        self.flags = None
+        self.seq = None
+        self.ack = None
+        self.payload_off = None
+
+    ## Timestamp in the format printed by tcpdump -tt
+    def ts(self):
+        return '%d.%06d' % (self.sec, self.usec)
+
+    ## Timestamp as float
+    def time(self):
+        return self.sec + self.usec / 1000000.0
+
+    ## Captured transport payload bytes (empty if not captured)
+    def payload(self):
+        if self.payload_off is None:
+            return ''
+        return self.data[self.payload_off:]
+
+
+## Sequential reader for tcpdump files
+class PcapReader:
+
+    ## Open file and read global header
+    #  @param fname File name
+    def __init__(self, fname):
+        self.fname = fname
+        self.f = open_pcap(fname)
+
+        hdr = self.f.read(24)
+        if len(hdr) < 24:
+            abort('File %s is not a tcpdump file' % fname)
+
+        self.endian = '<'
+        magic = struct.unpack('<I', hdr[:4])[0]
+        if magic != PCAP_MAGIC_USEC and magic != PCAP_MAGIC_NSEC:
+            self.endian = '>'
+            magic = struct.unpack('>I', hdr[:4])[0]
+            if magic != PCAP_MAGIC_USEC and magic != PCAP_MAGIC_NSEC:
+                abort('File %s is not a tcpdump file' % fname)
+
+        self.nsec = (magic == PCAP_MAGIC_NSEC)
+        (self.version_major, self.version_minor, self.thiszone, self.sigfigs,
+         self.snaplen, self.linktype) = struct.unpack(self.endian + 'HHiIII', hdr[4:])
+
+        ## offset of the first record in the uncompressed file
+        self.data_offset = 24
+
+    ## Close file
+    def close(self):
+        self.f.close()
+
+    ## Iterate over all records
+    #  @return Generator of (offset, sec, usec, wirelen, data) tuples, where
+    #          timestamps are always in microseconds (like tcpdump -tt prints them)
+    def records(self):
+        hdr_fmt = self.endian + 'IIII'
+        nsec = self.nsec
+        offset = self.data_offset
+        buf = ''
+        pos = 0
+
+        while True:
+            if len(buf) - pos < 16:
+                chunk = self.f.read(READ_CHUNK_SIZE)
+                if chunk == '':
+                    break
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+
+            sec, frac, caplen, wirelen = struct.unpack_from(hdr_fmt, buf, pos)
+            if caplen > MAX_RECORD_SIZE:
+                abort('File %s is corrupt at offset %i' % (self.fname, offset))
+
+            end = pos + 16 + caplen
+            if end > len(buf):
+                chunk = self.f.read(READ_CHUNK_SIZE)
+                if chunk == '':
+                    # like tcpdump we silently ignore a truncated last record
+                    break
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+
+            if nsec:
+                frac //= 1000
+
+            yield (offset, sec, frac, wirelen, buf[pos + 16:end])
+
+            offset += 16 + caplen
+            pos = end
+
+    ## Iterate over records at given offsets. Uncompressed files are read with
+    ## seeks, compressed files are decompressed up to each record but only the
+    ## records at the offsets are returned.
+    #  @param offsets Sorted list of record offsets
+    #  @return Generator of (offset, sec, usec, wirelen, data) tuples
+    def records_at(self, offsets):
+        hdr_fmt = self.endian + 'IIII'
+        nsec = self.nsec
+        compressed = isinstance(self.f, gzip.GzipFile)
+        pos = self.data_offset
+
+        for offset in offsets:
+            if compressed:
+                # gzip's seek() reads in small pieces, skip in large chunks
+                while pos < offset:
+                    skipped = len(self.f.read(min(offset - pos, READ_CHUNK_SIZE)))
+                    if skipped == 0:
+                        break
+                    pos += skipped
+            else:
+                self.f.seek(offset)
+            hdr = self.f.read(16)
+            if len(hdr) < 16:
+                abort('File %s is shorter than its index' % self.fname)
+
+            sec, frac, caplen, wirelen = struct.unpack(hdr_fmt, hdr)
+            if caplen > MAX_RECORD_SIZE:
+                abort('File %s is corrupt at offset %i' % (self.fname, offset))
+            if nsec:
+                frac //= 1000
+
+            data = self.f.read(caplen)
+            pos = offset + 16 + len(data)
+
+            yield (offset, sec, frac, wirelen, data)
+
+    ## Iterate over all IPv4 packets
+    #  @param offsets If specified only read records at these offsets
+    #  @return Generator of decoded packets
+    def packets(self, offsets=None):
+        linktype = self.linktype
+        if offsets is None:
+            records = self.records()
+        else:
+            records = self.records_at(offsets)
+
+        for (offset, sec, usec, wirelen, data) in records:
+            pkt = decode_packet(linktype, offset, sec, usec, wirelen, data)
+            if pkt is not None:
+                yield pkt
+
+
+## Get offset of IPv4 header for given link-layer type
+#  @param linktype Link-layer type
+#  @param data Captured bytes
+#  @return Offset of IP header or -1 if packet is not IPv4
+def get_ip_offset(linktype, data):
+    if linktype == DLT_EN10MB:
+        # note that like tcpdump filters without 'vlan' we do not look into
+        # VLAN-tagged frames
+        if len(data) < 14 or data[12:14] != '\x08\x00':
+            return -1
+        return 14
+    elif linktype == DLT_LINUX_SLL:
+        if len(data) < 16 or data[14:16] != '\x08\x00':
+            return -1
+        return 16
+    elif linktype == DLT_NULL:
+        # address family is in host byte order of capturing host
+        if len(data) < 4 or data[:4] not in ('\x02\x00\x00\x00', '\x00\x00\x00\x02'):
+            return -1
+        return 4
+    elif linktype == DLT_RAW or linktype in DLT_RAW_ALT:
+        return 0
+
+    return -1
+
+
+## Decode IPv4 packet
+#  @param linktype Link-layer type
+#  @param offset Offset of record in uncompressed file
+#  @param sec Timestamp seconds
+#  @param usec Timestamp microseconds
+#  @param wirelen Length of packet on the wire
+#  @param data Captured bytes
+#  @return Packet or None if the packet is not an IPv4 packet
+def decode_packet(linktype, offset, sec, usec, wirelen, data):
+    ip_off = get_ip_offset(linktype, data)
+    if ip_off < 0 or len(data) < ip_off + 20:
+        return None
+
+    vihl = ord(data[ip_off])
+    if vihl >> 4 != 4:
+        return None
+    ihl = (vihl & 0x0f) * 4
+
+    pkt = Packet(offset, sec, usec, wirelen, data, ip_off)
+    (pkt.iplen, pkt.ipid, frag) = struct.unpack_from('!HHH', data, ip_off + 2)
+    pkt.proto = ord(data[ip_off + 9])
+    pkt.src = _ntoa(data[ip_off + 12:ip_off + 16])
+    pkt.dst = _ntoa(data[ip_off + 16:ip_off + 20])
+
+    # only the first fragment carries the transport header
+    if frag & 0x1fff != 0:
+        return pkt
+
+    t_off = ip_off + ihl
+    if pkt.proto == IPPROTO_TCP:
+        if len(data) >= t_off + 14:
+            (pkt.sport, pkt.dport, pkt.seq, pkt.ack, doff, pkt.flags) = \
+                struct.unpack_from('!HHIIBB', data, t_off)
+            pkt.payload_off = min(t_off + (doff >> 4) * 4, len(data))
+    elif pkt.proto == IPPROTO_UDP:
+        if len(data) >= t_off + 4:
+            (pkt.sport, pkt.dport) = struct.unpack_from('!HH', data, t_off)
+            pkt.payload_off = min(t_off + 8, len(data))
+    elif pkt.proto == IPPROTO_ICMP:
+        if len(data) >= t_off + 8:
+            pkt.payload_off = t_off
+
+    return pkt
+
+
+## Build global header of tcpdump file as written by tcpdump -w
+#  @param snaplen Snap length
+#  @param linktype Link-layer type
+#  @return Header bytes
+def pcap_file_header(snaplen=65535, linktype=DLT_EN10MB):
+    return struct.pack('=IHHiIII', PCAP_MAGIC_USEC, 2, 4, 0, 0, snaplen, linktype)
+
+
+## Build record for packet as written by tcpdump -w
+#  @param pkt Packet
+#  @return Record bytes
+def pcap_record(pkt):
+    return struct.pack('=IIII', pkt.sec, pkt.usec, len(pkt.data), pkt.wirelen) + \
+           pkt.data
+
+
+## Writer for tcpdump files, writes the same format as tcpdump -w
+class PcapWriter:
+
+    ## Create file
+    #  @param fname File name
+    #  @param snaplen Snap length
+    #  @param linktype Link-layer type
+    def __init__(self, fname, snaplen=65535, linktype=DLT_EN10MB):
+        self.f = open(fname, 'wb')
+        self.f.write(pcap_file_header(snaplen, linktype))
+
+    ## Write packet
+    #  @param pkt Packet
+    def write(self, pkt):
+        self.f.write(pcap_record(pkt))
+
+    ## Close file
+    def close(self):
+        self.f.close()
+
+
+## Get name of uncompressed copy of tcpdump file
+#  @param fname tcpdump file name
+#  @return Name of uncompressed file (same as fname if fname is not compressed)
+def get_uncompressed_name(fname):
+    if fname.endswith('.gz'):
+        return fname[:-3]
+    return fname
+
+
+## Get name of flow index file
+#  @param fname tcpdump file name
+#  @return Index file name
+def get_index_name(fname):
+    return get_uncompressed_name(fname) + INDEX_FILE_EXT
+
+
+## Get size and modification time of file as string
+#  @param fname File name
+#  @return String <size> <mtime>
+def _file_id(fname):
+    st = os.stat(fname)
+    return '%i %i' % (st.st_size, int(st.st_mtime))
+
+
+## Write 64-bit unsigned integers or doubles in little endian byte order
+#  @param f File object
+#  @param fmt Struct format character ('Q' or 'd')
+#  @param values Sequence of values
+def _write_items(f, fmt, values):
+    for i in xrange(0, len(values), INDEX_CHUNK_ITEMS):
+        chunk = values[i:i + INDEX_CHUNK_ITEMS]
+        f.write(struct.pack('<%i%s' % (len(chunk), fmt), *chunk))
+
+
+## Read 64-bit unsigned integers or doubles in little endian byte order
+#  @param f File object
+#  @param fmt Struct format character ('Q' or 'd')
+#  @param cnt Number of values
+#  @return List of values
+def _read_items(f, fmt, cnt):
+    values = []
+    while cnt > 0:
+        n = min(cnt, INDEX_CHUNK_ITEMS)
+        data = f.read(n * 8)
+        if len(data) != n * 8:
+            raise ValueError('Truncated index file %s' % f.name)
+        values.extend(struct.unpack('<%i%s' % (n, fmt), data))
+        cnt -= n
+
+    return values
+
+
+## Per-flow index of a tcpdump file. For each flow (5-tuple) the index stores the
+## offsets of the flow's packets in the uncompressed tcpdump data and the packet
+## timestamps, so the packets of a flow can be read without decoding the whole
+## file. The packets are read from the tcpdump file itself or, if one was created
+## with build_index(), from an uncompressed copy of it.
+##
+## The index file starts with a text header:
+##   TEACUP_PCAP_INDEX <version> 8 8 little
+##   source <tcpdump file> <size> <mtime>
+##   pcap <uncompressed file> <size> <mtime>    (only if there is a copy)
+##   flow <src>,<src_port>,<dst>,<dst_port>,<proto> <packets> <bytes> <first> <last>
+##   ...
+##   data
+## followed by the offsets (64-bit unsigned integers) and timestamps (doubles)
+## of each flow (in header order) in little endian byte order. The packets of
+## each flow are sorted by timestamp.
+class PcapIndex:
+
+    ## Read index header
+    #  @param index_file Index file name
+    def __init__(self, index_file):
+        self.index_file = index_file
+        ## uncompressed copy of tcpdump file ('' if there is no copy)
+        self.pcap_file = ''
+        self.pcap_id = ''
+        ## flows in order of the index file
+        self.flows = []
+        ## map of flows to (packets, bytes, first timestamp, last timestamp) tuples
+        self.stats = {}
+        ## map of flows to offset of arrays in index file
+        self.positions = {}
+
+        with open(index_file, 'rb') as f:
+            fields = f.readline().split()
+            if fields != [ 'TEACUP_PCAP_INDEX', str(INDEX_VERSION), '8', '8', 'little' ]:
+                raise ValueError('Unsupported index file %s' % index_file)
+
+            counts = []
+            while True:
+                line = f.readline()
+                if line == '':
+                    raise ValueError('Truncated index file %s' % index_file)
+                fields = line.split()
+                if fields[0] == 'source':
+                    self.source_file = fields[1]
+                    self.source_id = fields[2] + ' ' + fields[3]
+                elif fields[0] == 'pcap':
+                    self.pcap_file = fields[1]
+                    self.pcap_id = fields[2] + ' ' + fields[3]
+                elif fields[0] == 'flow':
+                    flow = fields[1]
+                    self.flows.append(flow)
+                    self.stats[flow] = (int(fields[2]), int(fields[3]),
+                                        float(fields[4]), float(fields[5]))
+                    counts.append(int(fields[2]))
+                elif fields[0] == 'data':
+                    break
+
+            pos = f.tell()
+            for flow, cnt in zip(self.flows, counts):
+                self.positions[flow] = pos
+                pos += cnt * 16
+
+    ## Check if index is still valid for tcpdump file
+    #  @param fname tcpdump file name
+    #  @return True if index matches the tcpdump file
+    def is_valid(self, fname):
+        try:
+            return _file_id(fname) == self.source_id
+        except OSError:
+            return False
+
+    ## Get name of the file the indexed packets are read from
+    #  @param fname tcpdump file name
+    #  @return Uncompressed copy if it exists and is unchanged, otherwise fname
+    def get_pcap_file(self, fname):
+        if self.pcap_file != '':
+            try:
+                if _file_id(self.pcap_file) == self.pcap_id:
+                    return self.pcap_file
+            except OSError:
+                pass
+
+        return fname
+
+    ## Get offsets and timestamps of the packets of a flow
+    #  @param flow Flow <src>,<src_port>,<dst>,<dst_port>,<proto>
+    #  @return Pair of lists (offsets, timestamps) sorted by timestamp
+    def get_packets(self, flow):
+        if flow not in self.positions:
+            return ([], [])
+
+        cnt = self.stats[flow][0]
+        with open(self.index_file, 'rb') as f:
+            f.seek(self.positions[flow])
+            offsets = _read_items(f, 'Q', cnt)
+            times = _read_items(f, 'd', cnt)
+
+        return (offsets, times)
+
+    ## Get offsets of the packets of a flow inside a time window
+    #  @param flow Flow <src>,<src_port>,<dst>,<dst_port>,<proto>
+    #  @param stime Start time (absolute), 0.0 means start of file
+    #  @param etime End time (absolute), 0.0 means end of file
+    #  @return List of offsets
+    def get_offsets(self, flow, stime=0.0, etime=0.0):
+        (offsets, times) = self.get_packets(flow)
+        start = 0
+        end = len(times)
+        if stime > 0.0:
+            start = bisect_left(times, stime)
+        if etime > 0.0:
+            end = bisect_right(times, etime)
+
+        return offsets[start:end]
+
+    ## Get flows and flow statistics
+    #  @return Tuple of list of flows (TCP flows sorted first, then UDP flows sorted)
+    #          and map of flows to (packets, bytes, first timestamp, last timestamp)
+    def get_flows(self):
+        tcp_flows = sorted([ flow for flow in self.flows if flow.endswith(',tcp') ])
+        udp_flows = sorted([ flow for flow in self.flows if flow.endswith(',udp') ])
+
+        return (tcp_flows + udp_flows, self.stats)
+
+
+## Collects the offsets and timestamps of the packets of each flow while a
+## tcpdump file is read and writes the flow index
+class PcapIndexBuilder:
+
+    def __init__(self):
+        ## map of flows to offsets (doubles are exact for offsets below 2^53
+        ## and, unlike array('L'), 64 bits on all platforms)
+        self.offsets = {}
+        ## map of flows to timestamps
+        self.times = {}
+        ## map of flows to [ packets, bytes, first timestamp, last timestamp ]
+        self.stats = {}
+
+    ## Add packet
+    #  @param pkt Packet
+    def add(self, pkt):
+        if pkt.sport is None:
+            return
+        if pkt.proto == IPPROTO_TCP:
+            flow = '%s,%i,%s,%i,tcp' % (pkt.src, pkt.sport, pkt.dst, pkt.dport)
+        elif pkt.proto == IPPROTO_UDP:
+            flow = '%s,%i,%s,%i,udp' % (pkt.src, pkt.sport, pkt.dst, pkt.dport)
+        else:
+            return
+
+        t = pkt.time()
+        stat = self.stats.get(flow)
+        if stat is None:
+            self.offsets[flow] = array('d')
+            self.times[flow] = array('d')
+            stat = self.stats[flow] = [ 0, 0, t, t ]
+
+        self.offsets[flow].append(pkt.offset)
+        self.times[flow].append(t)
+        stat[0] += 1
+        stat[1] += pkt.iplen
+        if t < stat[2]:
+            stat[2] = t
+        if t > stat[3]:
+            stat[3] = t
+
+    ## Write index file (under a temporary name first, so parallel processes
+    ## never read a partially written index)
+    #  @param fname tcpdump file name
+    #  @param pcap_file Uncompressed copy of tcpdump file ('' if there is none)
+    #  @return PcapIndex
+    def write(self, fname, pcap_file=''):
+        index_file = get_index_name(fname)
+        tmp_name = '%s.%i' % (index_file, os.getpid())
+
+        flows = sorted(self.stats.keys())
+        with open(tmp_name, 'wb') as f:
+            f.write('TEACUP_PCAP_INDEX %i 8 8 little\n' % INDEX_VERSION)
+            f.write('source %s %s\n' % (fname, _file_id(fname)))
+            if pcap_file != '':
+                f.write('pcap %s %s\n' % (pcap_file, _file_id(pcap_file)))
+            for flow in flows:
+                f.write('flow %s %i %i %.6f %.6f\n' % ((flow, ) + tuple(self.stats[flow])))
+            f.write('data\n')
+            for flow in flows:
+                offsets = self.offsets[flow]
+                times = self.times[flow]
+                # timestamps of a flow are usually, but not always, sorted
+                if any(times[i] > times[i + 1] for i in xrange(len(times) - 1)):
+                    pairs = sorted(zip(times, offsets))
+                    times = [ p[0] for p in pairs ]
+                    offsets = [ p[1] for p in pairs ]
+                _write_items(f, 'Q', [ int(offset) for offset in offsets ])
+                _write_items(f, 'd', times)
+        os.rename(tmp_name, index_file)
+
+        return PcapIndex(index_file)
+
+
+## Load flow index for tcpdump file
+#  @param fname tcpdump file name
+#  @return PcapIndex or None if there is no valid index
+def load_index(fname):
+    index_file = get_index_name(fname)
+    if not os.path.isfile(index_file):
+        return None
+
+    try:
+        index = PcapIndex(index_file)
+    except (ValueError, IndexError):
+        warn('Ignoring invalid index file %s' % index_file)
+        return None
+
+    if not index.is_valid(fname):
+        warn('Ignoring outdated index file %s' % index_file)
+        return None
+
+    return index
+
+
+## Build flow index for tcpdump file. Indexes are also built by PcapDemux the
+## first time it reads a tcpdump file, so this is only needed to build indexes
+## in advance or to create an uncompressed copy.
+#  @param fname tcpdump file name
+#  @param copy If True and the tcpdump file is compressed, an uncompressed copy
+#              is created next to it, so indexed packets are read with seeks
+#              instead of decompressing the file up to each packet
+#  @return PcapIndex
+def build_index(fname, copy=False):
+    pcap_file = ''
+
+    if copy and get_uncompressed_name(fname) != fname:
+        pcap_file = get_uncompressed_name(fname)
+        tmp_name = '%s.%i' % (pcap_file, os.getpid())
+        puts('Decompressing %s' % fname)
+        with open(tmp_name, 'wb') as f_out:
+            f_in = gzip.open(fname, 'rb')
+            shutil.copyfileobj(f_in, f_out, READ_CHUNK_SIZE)
+            f_in.close()
+        os.rename(tmp_name, pcap_file)
+
+    puts('Indexing %s' % fname)
+    builder = PcapIndexBuilder()
+    reader = PcapReader(fname)
+    for pkt in reader.packets():
+        builder.add(pkt)
+    reader.close()
+
+    return builder.write(fname, pcap_file)
+
+
+## Base class for packet consumers. A consumer is registered with a
+## PcapDemux for one tcpdump file and gets all packets matching the flow
+## keys it was registered with
+class PcapConsumer:
+
+    ## Called before the first packet is read
+    #  @param reader PcapReader or None if the tcpdump file does not exist
+    def start(self, reader):
+        pass
+
+    ## Called for each matching packet
+    #  @param pkt Packet
+    def packet(self, pkt):
+        pass
+
+    ## Called after the last packet was read
+    def finish(self):
+        pass
+
+
+## Consumers registered for one tcpdump file
+class _DemuxTable:
+
+    def __init__(self):
+        ## list of all consumers in order of registration
+        self.consumers = []
+        ## (src, sport, dst, dport) -> consumers
+        self.flows = {}
+        ## (src, sport) -> consumers
+        self.srcs = {}
+        ## (dst, dport) -> consumers
+        self.dsts = {}
+        ## (host, port) -> consumers, host and port can be source or destination
+        self.host_ports = {}
+        ## consumers that get every packet
+        self.all = []
+
+    def add(self, index, key, consumer):
+        if consumer not in self.consumers:
+            self.consumers.append(consumer)
+        index.setdefault(key, []).append(consumer)
+
+
+## Demultiplexer that reads each tcpdump file once and passes each packet to
+## all consumers registered for the packet's flow. Host addresses must be
+## in dotted notation, ports can be strings or integers.
+##
+## If a tcpdump file has a flow index, only the packets of the registered flows
+## are read. Otherwise the whole file is read and the index is built on the way,
+## so subsequent reads of the file use the index.
+class PcapDemux:
+
+    ## Create demultiplexer
+    #  @param stime Only pass packets with timestamps from this time (absolute),
+    #               0.0 means start of file
+    #  @param etime Only pass packets with timestamps up to this time (absolute),
+    #               0.0 means end of file
+    def __init__(self, stime=0.0, etime=0.0):
+        ## map of file names to _DemuxTable
+        self.files = {}
+        self.stime = float(stime)
+        self.etime = float(etime)
+
+    def _table(self, fname):
+        if fname not in self.files:
+            self.files[fname] = _DemuxTable()
+        return self.files[fname]
+
+    ## Register consumer for packets of one direction of a flow
+    ## (like filter 'src host <src> && src port <sport> && dst host <dst> && dst port <dport>')
+    #  @param fname tcpdump file name
+    #  @param flow Tuple of (src, sport, dst, dport)
+    #  @param consumer PcapConsumer
+    def add_flow(self, fname, flow, consumer):
+        src, sport, dst, dport = flow
+        table = self._table(fname)
+        table.add(table.flows, (src, int(sport), dst, int(dport)), consumer)
+
+    ## Register consumer for packets sent from an endpoint
+    ## (like filter 'src host <host> && src port <port>')
+    #  @param fname tcpdump file name
+    #  @param host Host address
+    #  @param port Port number
+    #  @param consumer PcapConsumer
+    def add_src(self, fname, host, port, consumer):
+        table = self._table(fname)
+        table.add(table.srcs, (host, int(port)), consumer)
+
+    ## Register consumer for packets sent to an endpoint
+    ## (like filter 'dst host <host> && dst port <port>')
+    #  @param fname tcpdump file name
+    #  @param host Host address
+    #  @param port Port number
+    #  @param consumer PcapConsumer
+    def add_dst(self, fname, host, port, consumer):
+        table = self._table(fname)
+        table.add(table.dsts, (host, int(port)), consumer)
+
+    ## Register consumer for packets sent from or to any of a list of endpoints
+    #  @param fname tcpdump file name
+    #  @param endpoints List of (direction, host, port) tuples, direction is
+    #                   'src' or 'dst'
+    #  @param consumer PcapConsumer
+    def add_endpoints(self, fname, endpoints, consumer):
+        for (direction, host, port) in endpoints:
+            if direction == 'src':
+                self.add_src(fname, host, port, consumer)
+            else:
+                self.add_dst(fname, host, port, consumer)
+
+    ## Register consumer for packets with host and port anywhere in the header
+    ## (like filter 'host <host> && port <port>')
+    #  @param fname tcpdump file name
+    #  @param host Host address
+    #  @param port Port number
+    #  @param consumer PcapConsumer
+    def add_host_port(self, fname, host, port, consumer):
+        table = self._table(fname)
+        table.add(table.host_ports, (host, int(port)), consumer)
+
+    ## Register consumer for all IPv4 packets
+    #  @param fname tcpdump file name
+    #  @param consumer PcapConsumer
+    def add_all(self, fname, consumer):
+        table = self._table(fname)
+        if consumer not in table.consumers:
+            table.consumers.append(consumer)
+        table.all.append(consumer)
+
+    ## Read all registered files once and feed consumers
+    def run(self):
+        for fname in sorted(self.files.keys()):
+            self._run_file(fname, self.files[fname])
+
+        self.files = {}
+
+    ## Read one file and feed consumers
+    #  @param fname tcpdump file name
+    #  @param table Consumers registered for the file
+    def _run_file(self, fname, table):
+        if not os.path.isfile(fname):
+            warn('File %s does not exist' % fname)
+            for consumer in table.consumers:
+                consumer.start(None)
+                consumer.finish()
+            return
+
+        # if there is an index, only read the packets of the registered flows
+        # (unless there are consumers for all packets), otherwise build the index
+        # while reading the file
+        index = load_index(fname)
+        builder = None
+        if index is not None:
+            reader = PcapReader(index.get_pcap_file(fname))
+            if len(table.all) == 0:
+                offsets = self._select_offsets(index, table)
+            else:
+                offsets = None
+        else:
+            reader = PcapReader(fname)
+            offsets = None
+            builder = PcapIndexBuilder()
+
+        for consumer in table.consumers:
+            consumer.start(reader)
+
+        flows = table.flows
+        srcs = table.srcs
+        dsts = table.dsts
+        host_ports = table.host_ports
+        all_consumers = table.all
+        stime = self.stime
+        etime = self.etime
+        window = stime > 0.0 or etime > 0.0
+
+        for pkt in reader.packets(offsets):
+            if builder is not None:
+                builder.add(pkt)
+
+            if window:
+                t = pkt.time()
+                if (stime > 0.0 and t < stime) or (etime > 0.0 and t > etime):
+                    continue
+
+            if pkt.sport is None:
+                hits = list(all_consumers)
+            else:
+                hits = []
+                if flows:
+                    hits.extend(flows.get((pkt.src, pkt.sport, pkt.dst, pkt.dport), ()))
+                if srcs:
+                    hits.extend(srcs.get((pkt.src, pkt.sport), ()))
+                if dsts:
+                    hits.extend(dsts.get((pkt.dst, pkt.dport), ()))
+                if host_ports:
+                    for key in ((pkt.src, pkt.sport), (pkt.src, pkt.dport),
+                                (pkt.dst, pkt.sport), (pkt.dst, pkt.dport)):
+                        hits.extend(host_ports.get(key, ()))
+                hits.extend(all_consumers)
+
+            if len(hits) == 1:
+                hits[0].packet(pkt)
+            elif len(hits) > 1:
+                # a consumer can be matched by several keys, but must see
+                # each packet only once
+                seen = set()
+                for consumer in hits:
+                    if id(consumer) not in seen:
+                        seen.add(id(consumer))
+                        consumer.packet(pkt)
+
+        reader.close()
+
+        if builder is not None:
+            try:
+                builder.write(fname)
+            except (IOError, OSError) as e:
+                warn('Cannot write index file %s: %s' % (get_index_name(fname), str(e)))
+
+        for consumer in table.consumers:
+            consumer.finish()
+
+    ## Select offsets of all packets of flows that match registered consumers
+    ## inside the time window
+    #  @param index PcapIndex
+    #  @param table Consumers registered for the file
+    #  @return Sorted list of record offsets
+    def _select_offsets(self, index, table):
+        offsets = []
+        for flow in index.flows:
+            (src, sport, dst, dport, proto) = flow.split(',')
+            sport = int(sport)
+            dport = int(dport)
+            if (src, sport, dst, dport) in table.flows or \
+               (src, sport) in table.srcs or (dst, dport) in table.dsts or \
+               (src, sport) in table.host_ports or (src, dport) in table.host_ports or \
+               (dst, sport) in table.host_ports or (dst, dport) in table.host_ports:
+                offsets.extend(index.get_offsets(flow, self.stime, self.etime))
+
+        offsets.sort()
+
+        return offsets
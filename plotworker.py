@@ -0,0 +1,203 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package plotworker
+# Long-lived R process that runs the plot scripts (plot_worker.R), so we do
+# not start R and load the R libraries again for every plot. If the worker
+# cannot be used the plot scripts are run with R CMD BATCH as before.
+#
+# $Id$
+
+import os
+import re
+import shlex
+import atexit
+from subprocess import Popen, PIPE
+from fabric.api import warn, local, puts, abort
+
+import config
+
+
+## Name of the worker script (in TPCONF_script_path)
+WORKER_SCRIPT = 'plot_worker.R'
+
+
+## Return true if the plot worker should be used (TPCONF_plot_worker in
+## config.py, enabled by default)
+#  @return True if plot worker is enabled, otherwise False
+def plot_worker_enabled():
+    try:
+        return str(config.TPCONF_plot_worker) == '1'
+    except AttributeError:
+        return True
+
+
+## R process running plot_worker.R
+class PlotWorker:
+
+    def __init__(self):
+        self.proc = None
+        # process that started the worker (forked processes need their own)
+        self.pid = os.getpid()
+
+    ## Start R
+    #  @return True if R was started, otherwise False
+    def start(self):
+        worker_script = os.path.join(config.TPCONF_script_path, WORKER_SCRIPT)
+        try:
+            self.proc = Popen(['R', '--vanilla', '--slave', '-f', worker_script],
+                              stdin=PIPE, stdout=PIPE, close_fds=True)
+        except OSError as e:
+            warn('Cannot start plot worker: %s' % str(e))
+            self.proc = None
+            return False
+
+        return True
+
+    ## Run plot script
+    #  @param script Plot script
+    #  @param env_vars List of (name, value) pairs of environment variables
+    #  @param rout_file File that gets the R output
+    #  @return True if the script completed, False if the script failed and
+    #          None if the worker died
+    def run(self, script, env_vars, rout_file):
+        if self.proc is None:
+            return None
+
+        lines = [ 'SCRIPT %s\n' % os.path.abspath(script),
+                  'ROUT %s\n' % os.path.abspath(rout_file),
+                  'CWD %s\n' % os.getcwd() ]
+        lines += [ 'ENV %s=%s\n' % (name, value) for name, value in env_vars ]
+        lines.append('END\n')
+
+        try:
+            self.proc.stdin.writelines(lines)
+            self.proc.stdin.flush()
+            while True:
+                line = self.proc.stdout.readline()
+                if line == '':
+                    break
+                if line.startswith('DONE '):
+                    return line.split()[1] == '0'
+        except IOError:
+            pass
+
+        # worker died
+        self.stop()
+        return None
+
+    ## Stop R
+    def stop(self):
+        if self.proc is None:
+            return
+
+        try:
+            self.proc.stdin.write('QUIT\n')
+            self.proc.stdin.close()
+        except IOError:
+            pass
+        self.proc.wait()
+        self.proc = None
+
+
+## Plot worker of this process
+plot_worker = None
+
+
+## Get plot worker of this process, start it if necessary
+#  @return PlotWorker or None if the worker cannot be started
+def get_plot_worker():
+    global plot_worker
+
+    if plot_worker is not None and plot_worker.pid == os.getpid():
+        if plot_worker.proc is None:
+            # worker failed to start or died before
+            return None
+        return plot_worker
+
+    plot_worker = PlotWorker()
+    if not plot_worker.start():
+        return None
+
+    return plot_worker
+
+
+## Stop plot worker of this process
+def stop_plot_worker():
+    if plot_worker is not None and plot_worker.pid == os.getpid():
+        plot_worker.stop()
+
+
+atexit.register(stop_plot_worker)
+
+
+## Parse environment variable assignments
+#  @param env Environment variable assignments as passed to the shell
+#             (e.g. TITLE="..." FNAMES="...")
+#  @return List of (name, value) pairs or None if the string has anything
+#          else but assignments
+def parse_env(env):
+    try:
+        words = shlex.split(env)
+    except ValueError:
+        return None
+
+    env_vars = []
+    for word in words:
+        res = re.match('^([A-Za-z_][A-Za-z0-9_]*)=(.*)$', word, re.DOTALL)
+        if res is None or res.group(2).find('\n') >= 0:
+            return None
+        env_vars.append((res.group(1), res.group(2)))
+
+    return env_vars
+
+
+## Run plot script, either in the plot worker or with R CMD BATCH
+#  @param env Environment variable assignments passed to the plot script
+#  @param plot_script Command that runs the plot script (e.g.
+#                     R CMD BATCH --vanilla <script>)
+#  @param rout_file File that gets the R output
+def run_plot_script(env, plot_script, rout_file):
+
+    res = re.match('^R CMD BATCH --vanilla (\S+\.R)$', plot_script.strip())
+    if res and plot_worker_enabled():
+        script = res.group(1)
+        env_vars = parse_env(env)
+        worker = None
+        if env_vars is not None:
+            worker = get_plot_worker()
+
+        if worker is not None:
+            puts('[localhost] plot: %s' % script)
+            ok = worker.run(script, env_vars, rout_file)
+            if ok == True:
+                return
+            elif ok == False:
+                abort('Plot script %s failed (see %s)' % (script, rout_file))
+
+            warn('Plot worker died, running plot script with R CMD BATCH')
+
+    local('%s %s %s' % (env, plot_script, rout_file))
@@ -0,0 +1,191 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package pointthin
+# Point thinning of time series before plotting (implements pthin() of
+# point_thinning.R), so the plot scripts do not have to load all data points
+#
+# $Id$
+
+import os
+import re
+from array import array
+
+from coldata import read_data_file
+from aggregate import MAX_VALUE
+
+
+## Extension for thinned data file
+PTHIN_FILE_EXT = '.pthin'
+
+
+## Get point thinning parameters from plot parameters
+#  @param plot_params Parameters passed to plot function via environment variables
+#  @return Pair of PTHIN_DIST and PTHIN_DIST_FAC (0 if not specified)
+def get_pthin_params(plot_params):
+    params = []
+    for name in ('PTHIN_DIST', 'PTHIN_DIST_FAC'):
+        res = re.search('(?:^|\s)%s=["\']?([0-9\.eE+-]+)' % name, plot_params)
+        if res:
+            params.append(float(res.group(1)))
+        else:
+            params.append(0.0)
+
+    return tuple(params)
+
+
+## Return true if points should be thinned
+#  @param plot_params Parameters passed to plot function via environment variables
+#  @return True if PTHIN_DIST or PTHIN_DIST_FAC is set, otherwise False
+def pthin_enabled(plot_params):
+    (dist, dist_fac) = get_pthin_params(plot_params)
+    return dist > 0 or dist_fac > 0
+
+
+## Thin out points. A point is kept if its distance on the x-axis or the
+## y-axis to the last point kept is at least the minimum distance. The first
+## point is always kept.
+#  @param times Timestamps
+#  @param values Values
+#  @param dist_x Minimum distance on x-axis
+#  @param dist_y Minimum distance on y-axis
+#  @return List of indices of points kept
+def thin_series(times, values, dist_x, dist_y):
+    if len(times) < 2:
+        return range(len(times))
+
+    keep = [ 0 ]
+    last_t = times[0]
+    last_v = values[0]
+    for i in xrange(1, len(times)):
+        t = times[i]
+        v = values[i]
+        if abs(t - last_t) >= dist_x or abs(v - last_v) >= dist_y:
+            keep.append(i)
+            last_t = t
+            last_v = v
+
+    return keep
+
+
+## Get minimum distances for thinning. With dist_fac the distances are a
+## fraction of the plotted x and y ranges.
+#  @param times Timestamps
+#  @param values Values (scaled)
+#  @param dist PTHIN_DIST
+#  @param dist_fac PTHIN_DIST_FAC
+#  @param stime Start time of plot window
+#  @param etime End time of plot window (0.0 means end of data)
+#  @param ymin Minimum value on y-axis (0 means minimum of data)
+#  @param ymax Maximum value on y-axis (0 means maximum of data)
+#  @return Pair of distances on x-axis and y-axis
+def get_pthin_dists(times, values, dist, dist_fac, stime=0.0, etime=0.0,
+                    ymin=0.0, ymax=0.0):
+    if dist > 0:
+        return (dist, dist)
+
+    if etime == 0:
+        etime = max(times) - min(times)
+    if ymin == 0:
+        ymin = min(values)
+    if ymax == 0:
+        ymax = max(values)
+
+    return (dist_fac * (etime - stime), dist_fac * (ymax - ymin))
+
+
+## Get name of thinned data file. A burst number at the end of the file
+## name stays at the end (plot_bursts.R gets it from the file name).
+#  @param data_file Data file name
+#  @return Thinned data file name
+def get_thin_file_name(data_file):
+    (root, ext) = os.path.splitext(data_file)
+    if ext[1:].isdigit():
+        return root + PTHIN_FILE_EXT + ext
+
+    return data_file + PTHIN_FILE_EXT
+
+
+## Thin out data files before plotting. The thinned files have the timestamp
+## in the first and the unscaled value in the second column (separated by a
+## space), so they are plotted with yindex 2 and the original yscaler. Values
+## filtered out by the plot scripts are removed before thinning, like the
+## plot scripts do.
+#  @param file_names List of data file names
+#  @param yindex Index of the value column (starting with 1)
+#  @param yscaler Scaler for values
+#  @param sep Column separator
+#  @param plot_params Parameters passed to plot function via environment variables
+#  @param stime Start time of plot window
+#  @param etime End time of plot window
+#  @param ymin Minimum value on y-axis
+#  @param ymax Maximum value on y-axis
+#  @return List of thinned file names
+def thin_files(file_names, yindex, yscaler, sep, plot_params, stime=0.0,
+               etime=0.0, ymin=0.0, ymax=0.0):
+    (dist, dist_fac) = get_pthin_params(plot_params)
+
+    out_files = []
+    for data_file in file_names:
+        data = read_data_file(data_file, sep)
+        all_times = data.get_values(0)
+        all_values = data.get_values(yindex - 1)
+
+        times = array('d')
+        values = array('d')
+        scaled = array('d')
+        const = len(all_values) > 1
+        first = all_values[0] if len(all_values) > 0 else None
+        for t, v in zip(all_times, all_values):
+            if v != first:
+                const = False
+            if v < MAX_VALUE:
+                times.append(t)
+                values.append(v)
+                scaled.append(v * yscaler)
+        data.close()
+
+        if len(times) == 0:
+            # nothing left to plot, let the plot script deal with it
+            rows = zip(all_times, all_values)
+        elif const:
+            # constant series are not thinned, so they can be omitted by
+            # the plot scripts
+            rows = zip(times, values)
+        else:
+            (dist_x, dist_y) = get_pthin_dists(times, scaled, dist, dist_fac,
+                                               stime, etime, ymin, ymax)
+            rows = [ (times[i], values[i]) for i in
+                     thin_series(times, scaled, dist_x, dist_y) ]
+
+        out_file = get_thin_file_name(data_file)
+        tmp_name = '%s.%i' % (out_file, os.getpid())
+        with open(tmp_name, 'w') as f:
+            f.writelines([ '%r %r\n' % row for row in rows ])
+        os.rename(tmp_name, out_file)
+        out_files.append(out_file)
+
+    return out_files
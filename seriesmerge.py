@@ -0,0 +1,120 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package seriesmerge
+# Time-ordered merge of the data files of several flows. The data files must
+# be sorted by time (the first column). The files are merged with a k-way
+# merge that only keeps one line per file in memory, so memory use does not
+# depend on the size of the files.
+#
+# $Id$
+
+import heapq
+
+
+## Get timestamp of data file line. Lines with commas are split on commas,
+## other lines on white space.
+#  @param line Line
+#  @return Timestamp or None if the line has no timestamp
+def get_line_time(line):
+    if ',' in line:
+        field = line.split(',', 1)[0]
+    else:
+        fields = line.split(None, 1)
+        if len(fields) == 0:
+            return None
+        field = fields[0]
+
+    try:
+        return float(field)
+    except ValueError:
+        return None
+
+
+## Read lines of data file. Lines without timestamp are skipped.
+#  @param data_file Data file name
+#  @param index Index of data file in list of merged files
+#  @return Generator of (time, index, line number, line) tuples
+def read_timed_lines(data_file, index):
+    with open(data_file, 'r') as f:
+        n = 0
+        for line in f:
+            t = get_line_time(line)
+            if t is None:
+                continue
+            if line[-1] != '\n':
+                line += '\n'
+            yield (t, index, n, line)
+            n += 1
+
+
+## Merge lines of data files by time. Lines with the same timestamp are
+## ordered by the position of the file in the list and their position in the file.
+#  @param data_files List of data file names
+#  @return Generator of (time, index, line number, line) tuples 
+def merge_lines(data_files):
+    return heapq.merge(*[ read_timed_lines(data_files[i], i)
+                          for i in range(len(data_files)) ])
+
+
+## Merge data files into one file sorted by time
+#  @param data_files List of data file names
+#  @param out_file Name of merged file
+def merge_files(data_files, out_file):
+    with open(out_file, 'w') as f:
+        f.writelines(( line for (t, i, n, line) in merge_lines(data_files) ))
+
+
+## Merge data files of cumulative counters into one file with the totals over all
+## files. For each timestamp the output has the sum of the latest values of all
+## files, i.e. the counters of the files are added up.
+#  @param data_files List of data file names
+#  @param out_file Name of merged file
+#  @param num_values Number of value columns (following the timestamp)
+#  @param fmt Format string for output lines (timestamp, values)
+def merge_totals(data_files, out_file, num_values=1, fmt='%f %i\n'):
+    last = [ [ 0.0 ] * num_values for i in range(len(data_files)) ]
+    total = [ 0.0 ] * num_values
+    curr_time = None
+
+    with open(out_file, 'w') as f:
+        for (t, i, n, line) in merge_lines(data_files):
+            if curr_time is not None and t != curr_time:
+                f.write(fmt % tuple([ curr_time ] + total))
+            curr_time = t
+
+            if ',' in line:
+                fields = line.split(',')
+            else:
+                fields = line.split()
+
+            for j in range(num_values):
+                v = float(fields[j + 1])
+                total[j] += v - last[i][j]
+                last[i][j] = v
+
+        if curr_time is not None:
+            f.write(fmt % tuple([ curr_time ] + total))
@@ -0,0 +1,99 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package siftrreader
+# Streaming reader for (gzip-compressed) SIFTR log files
+#
+# $Id$
+
+import gzip
+from fabric.api import abort
+
+
+## Number of columns in SIFTR log patched to output ERTT estimates
+SIFTR_PATCHED_COLUMNS = 27
+
+
+## Reader for SIFTR log files. The first line of a log has the enable
+## information (hz, tcp_rtt_scale etc.), then there is one line per packet and
+## the last line has the disable information. Data lines are comma-separated,
+## the columns are (starting with 1): 1 direction (i/o), 2 hash, 3 timestamp,
+## 4 local address, 5 local port, 6 foreign address, 7 foreign port, 8 ssthresh,
+## 9 cwnd, ..., 17 smoothed RTT, ..., 27 ERTT (patched siftr only)
+class SiftrReader:
+
+    ## Open log file and read the enable line
+    #  @param fname SIFTR log file name
+    def __init__(self, fname):
+        self.fname = fname
+        ## header fields <name>=<value>
+        self.header = {}
+        ## True if last line is the disable line (set after rows() finished)
+        self.complete = False
+        ## Number of columns of the first data line (set by rows())
+        self.columns = 0
+
+        self.f = gzip.open(fname, 'rb')
+        first = self.f.readline()
+        for field in first.split():
+            if field.find('=') > -1:
+                name, value = field.split('=', 1)
+                self.header[name] = value
+
+    ## Get value from enable line
+    #  @param name Name of value (e.g. 'hz')
+    #  @return Value as string
+    def get_header(self, name):
+        if name not in self.header:
+            abort('No %s in header of %s' % (name, self.fname))
+        return self.header[name]
+
+    ## Iterate over data lines. Like the original shell pipeline 
+    ## (zcat | grep -v enable | head -<lines - 3>) this stops before the last
+    ## data line, which may be incomplete, and the disable line.
+    #  @param directions Directions to include, string of 'i' and/or 'o'
+    #  @return Generator of lists of fields
+    def rows(self, directions='io'):
+        # lookahead of two lines, the last two lines are never returned
+        prev2 = None
+        prev1 = None
+        for line in self.f:
+            if line.find('enable') > -1:
+                continue
+
+            if prev2 is not None and prev2[0:1] != '' and prev2[0:1] in directions:
+                yield prev2.rstrip('\n').split(',')
+
+            prev2 = prev1
+            prev1 = line
+            if self.columns == 0 and prev2 is None:
+                self.columns = len(line.replace(',', ' ').split())
+
+        # the last line must be the disable line
+        self.complete = prev1 is not None and prev1.find('disable_time_secs') > -1
+
+    def close(self):
+        self.f.close()
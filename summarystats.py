@@ -0,0 +1,383 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package summarystats
+# Summary statistics (count, mean, median, quantiles, boxplot statistics,
+# minimum, maximum) of data files for the comparison plots. The statistics
+# are computed the same way plot_cmp_experiments.R processes the data files,
+# cached in sidecar files (<data file>.stats) and only the sidecar files are
+# passed to the plot script.
+#
+# $Id$
+
+import os
+import re
+import math
+from array import array
+
+from aggregate import read_series, diff_series, aggregate_series, \
+                      get_aggr_params
+
+
+## Extension for statistics file
+STATS_FILE_EXT = '.stats'
+## Statistics file format version
+STATS_FILE_VERSION = 1
+## Quantiles in statistics files
+STATS_QUANTILES = (0.01, 0.05, 0.1, 0.25, 0.75, 0.9, 0.95, 0.99)
+## Boxplot whiskers extend to the most extreme data point that is no more than
+## BOXPLOT_COEF times the interquartile range from the box (as in R)
+BOXPLOT_COEF = 1.5
+
+
+## Get numeric parameter from plot parameters
+#  @param plot_params Parameters passed to plot function via environment variables
+#  @param name Name of parameter
+#  @param default Default value
+#  @return Value of parameter
+def get_plot_param(plot_params, name, default=0.0):
+    res = re.search('(?:^|\s)%s=["\']?([0-9\.eE+-]+)' % name, plot_params)
+    if res:
+        return float(res.group(1))
+
+    return default
+
+
+## Compute quantile of sorted values (like R quantile() with default type 7)
+#  @param values Sorted values
+#  @param p Probability
+#  @return Quantile or None if there are no values
+def quantile(values, p):
+    n = len(values)
+    if n == 0:
+        return None
+
+    h = (n - 1) * p
+    lo = int(math.floor(h))
+    hi = min(lo + 1, n - 1)
+
+    return values[lo] + (h - lo) * (values[hi] - values[lo])
+
+
+## Compute median of sorted values
+#  @param values Sorted values
+#  @return Median or None if there are no values
+def median(values):
+    n = len(values)
+    if n == 0:
+        return None
+    if n % 2 == 1:
+        return values[n // 2]
+
+    return (values[n // 2 - 1] + values[n // 2]) / 2.0
+
+
+## Compute Tukey's five number summary of sorted values (like R fivenum())
+#  @param values Sorted values
+#  @return List of minimum, lower hinge, median, upper hinge, maximum
+def fivenum(values):
+    n = len(values)
+    n4 = math.floor((n + 3) / 2.0) / 2.0
+    d = [ 1, n4, (n + 1) / 2.0, n + 1 - n4, n ]
+
+    return [ 0.5 * (values[int(math.floor(x)) - 1] + values[int(math.ceil(x)) - 1])
+             for x in d ]
+
+
+## Compute boxplot statistics (like R boxplot.stats())
+#  @param values Values
+#  @param sorted_values Sorted values
+#  @param coef See BOXPLOT_COEF
+#  @return Pair of list of lower whisker, lower hinge, median, upper hinge,
+#          upper whisker and list of outliers (in the order of values)
+def boxplot_stats(values, sorted_values, coef=BOXPLOT_COEF):
+    stats = fivenum(sorted_values)
+    iqr = stats[3] - stats[1]
+    lo = stats[1] - coef * iqr
+    hi = stats[3] + coef * iqr
+
+    out = [ v for v in values if v < lo or v > hi ]
+    if len(out) > 0:
+        inside = [ v for v in sorted_values if v >= lo and v <= hi ]
+        stats[0] = inside[0]
+        stats[4] = inside[-1]
+
+    return (stats, out)
+
+
+## Process data file like plot_cmp_experiments.R does up to the point where
+## the time window is applied
+#  @param data_file Data file name
+#  @param params See get_stats_params()
+#  @return Tuple of timestamps, values, flag that is True if the values are
+#          constant, minimum and maximum timestamp before the timestamps are
+#          made relative, maximum of values (scaled and aggregated)
+def process_data_file(data_file, params):
+    (yindex, yscaler, sep, aggr, diff, win_size, int_factor) = params[:7]
+
+    (times, values, const) = read_series(data_file, yindex, yscaler, sep)
+    if len(times) == 0:
+        return (times, values, const, None, None, None)
+
+    tmin = min(times)
+    tmax = max(times)
+    ymax = max(values)
+
+    times = array('d', [ t - tmin for t in times ])
+    if diff == '1':
+        (times, values) = diff_series(times, values)
+    if aggr != '' and aggr != '0':
+        (times, values) = aggregate_series(times, values, aggr, win_size,
+                                           int_factor)
+        ymax = max(values) if len(values) > 0 else None
+
+    return (times, values, const, tmin, tmax, ymax)
+
+
+## Format value for statistics file (readable by R)
+#  @param v Value
+#  @return String
+def _format_value(v):
+    if v is None or v != v:
+        return 'NA'
+    if v == float('inf'):
+        return 'Inf'
+    if v == float('-inf'):
+        return '-Inf'
+    return repr(float(v))
+
+
+## Compute statistics of data file
+#  @param data_file Data file name
+#  @param params See get_stats_params()
+#  @param window Pair of start and end time of time window or None
+#  @param outlier_quant Remove values in the quantiles below outlier_quant and
+#                       above 1 - outlier_quant (0 means no values are removed)
+#  @return List of (name, value) pairs, the outliers have the name out
+def compute_stats(data_file, params, window=None, outlier_quant=0.0):
+    (times, values, const, tmin, tmax, ymax) = process_data_file(data_file, params)
+
+    stats = [ ('const', 1 if const else 0), ('tmin', tmin), ('tmax', tmax) ]
+    if params[3] != '' and params[3] != '0':
+        stats.append(('xmax_aggr', max(times) if len(times) > 0 else None))
+    else:
+        stats.append(('xmax_aggr', None))
+
+    if window is not None:
+        (stime, etime) = window
+        values = array('d', [ v for t, v in zip(times, values)
+                              if t >= stime and t <= etime ])
+        ymax = max(values) if len(values) > 0 else float('-inf')
+
+    sorted_values = sorted(values)
+    if outlier_quant > 0 and len(values) > 0:
+        ol = quantile(sorted_values, outlier_quant)
+        oh = quantile(sorted_values, 1 - outlier_quant)
+        values = array('d', [ v for v in values if v >= ol and v <= oh ])
+        sorted_values = sorted(values)
+        ymax = max(values)
+
+    n = len(values)
+    stats.append(('ymax', ymax))
+    stats.append(('n', n))
+    if n == 0:
+        return stats
+
+    stats.append(('mean', math.fsum(values) / n))
+    stats.append(('median', median(sorted_values)))
+    stats.append(('min', sorted_values[0]))
+    stats.append(('max', sorted_values[-1]))
+    for p in STATS_QUANTILES:
+        stats.append(('q%g' % p, quantile(sorted_values, p)))
+
+    (box, out) = boxplot_stats(values, sorted_values)
+    for name, v in zip(('box_lower', 'box_lq', 'box_median', 'box_uq',
+                        'box_upper'), box):
+        stats.append((name, v))
+    for v in out:
+        stats.append(('out', v))
+
+    return stats
+
+
+## Get statistics file name for data file
+#  @param data_file Data file name
+#  @return Statistics file name
+def get_stats_file_name(data_file):
+    return data_file + STATS_FILE_EXT
+
+
+## Read statistics file if it is up to date
+#  @param data_file Data file name
+#  @param key Parameters the statistics were computed with
+#  @param range_only If True only the parameters that affect the time range
+#                    must match
+#  @return Dictionary of statistics (outliers are not included) or None
+def read_stats_file(data_file, key, range_only=False):
+    stats_file = get_stats_file_name(data_file)
+    try:
+        st = os.stat(data_file)
+        with open(stats_file, 'r') as f:
+            lines = f.readlines()
+    except (IOError, OSError):
+        return None
+
+    header = {}
+    stats = {}
+    for line in lines:
+        if line.startswith('# '):
+            fields = line[2:].rstrip('\n').split(' ', 1)
+            if len(fields) == 2:
+                header[fields[0]] = fields[1]
+        else:
+            fields = line.split()
+            if len(fields) == 2 and fields[0] != 'out':
+                stats[fields[0]] = None if fields[1] == 'NA' else float(fields[1])
+
+    if header.get('version') != str(STATS_FILE_VERSION) or \
+       header.get('source') != '%s %i %r' % (os.path.basename(data_file),
+                                             st.st_size, st.st_mtime):
+        return None
+    if range_only:
+        if header.get('range') != repr(key[:7]):
+            return None
+    elif header.get('params') != repr(key):
+        return None
+
+    return stats
+
+
+## Write statistics file (the file is written under a temporary name first,
+## so readers never see a partially written file)
+#  @param data_file Data file name
+#  @param key Parameters the statistics were computed with
+#  @param stats List of (name, value) pairs
+#  @return Statistics file name
+def write_stats_file(data_file, key, stats):
+    stats_file = get_stats_file_name(data_file)
+    st = os.stat(data_file)
+    tmp_name = '%s.%i' % (stats_file, os.getpid())
+    with open(tmp_name, 'w') as f:
+        f.write('# version %i\n' % STATS_FILE_VERSION)
+        f.write('# source %s %i %r\n' % (os.path.basename(data_file), st.st_size,
+                                        st.st_mtime))
+        f.write('# range %r\n' % (key[:7], ))
+        f.write('# params %r\n' % (key, ))
+        f.writelines([ '%s %s\n' % (name, _format_value(v)) for name, v in stats ])
+    os.rename(tmp_name, stats_file)
+
+    return stats_file
+
+
+## Get parameters that affect the statistics
+#  @param yindex Index of the value column (starting with 1)
+#  @param yscaler Scaler for values
+#  @param sep Column separator
+#  @param aggr Aggregation (see get_metric_params())
+#  @param diff '1' use differences between consecutive values
+#  @param plot_params Parameters passed to plot function via environment variables
+#  @return Tuple of parameters or None if the statistics cannot be computed
+#          for these parameters
+def get_stats_params(yindex, yscaler, sep, aggr, diff, plot_params):
+    aggr_params = get_aggr_params(plot_params)
+    if aggr_params is None:
+        return None
+
+    # merging groups needs all values
+    if get_plot_param(plot_params, 'MERGE_GROUPS') != 0:
+        return None
+
+    return (int(yindex), float(yscaler), sep, aggr, diff, aggr_params[0],
+            aggr_params[1])
+
+
+## Get statistics files for data files. Like plot_cmp_experiments.R the time
+## window is only applied if it is inside the time range of the data.
+#  @param file_names List of data file names
+#  @param yindex Index of the value column (starting with 1)
+#  @param yscaler Scaler for values
+#  @param sep Column separator
+#  @param aggr Aggregation (see get_metric_params())
+#  @param diff '1' use differences between consecutive values
+#  @param omit_const '1' constant series are ignored
+#  @param stime Start time of time window
+#  @param etime End time of time window
+#  @param plot_params Parameters passed to plot function via environment variables
+#  @return List of statistics file names or None if the statistics cannot be
+#          computed for these parameters
+def get_stats_files(file_names, yindex, yscaler, sep, aggr, diff, omit_const='0',
+                    stime=0.0, etime=0.0, plot_params=''):
+    params = get_stats_params(yindex, yscaler, sep, aggr, diff, plot_params)
+    if params is None:
+        return None
+
+    outlier_quant = get_plot_param(plot_params, 'OUTLIER_QUANT')
+
+    # first get the time range of all data
+    tmin = None
+    tmax = None
+    xmax_aggr = None
+    for data_file in file_names:
+        stats = read_stats_file(data_file, params, range_only=True)
+        if stats is None:
+            # usually there is no time window, so keep the statistics
+            stats = compute_stats(data_file, params, None, outlier_quant)
+            write_stats_file(data_file, params + (None, outlier_quant), stats)
+            stats = dict(stats)
+        if omit_const == '1' and stats['const'] == 1:
+            continue
+        if stats['tmin'] is not None:
+            tmin = min(tmin, stats['tmin']) if tmin is not None else stats['tmin']
+            tmax = max(tmax, stats['tmax'])
+        if stats['xmax_aggr'] is not None:
+            xmax_aggr = max(xmax_aggr, stats['xmax_aggr'])
+
+    if aggr != '' and aggr != '0':
+        xmax = xmax_aggr if xmax_aggr is not None else 0.0
+    elif tmin is not None:
+        xmax = tmax - tmin
+    else:
+        xmax = 0.0
+
+    if stime < 0 or stime > xmax:
+        stime = 0.0
+    if etime <= 0 or etime > xmax:
+        etime = xmax
+    if stime > 0.0 or etime < xmax:
+        window = (stime, etime)
+    else:
+        window = None
+
+    # then get the statistics for the time window
+    key = params + (window, outlier_quant)
+    stats_files = []
+    for data_file in file_names:
+        if read_stats_file(data_file, key) is None:
+            write_stats_file(data_file, key,
+                             compute_stats(data_file, params, window, outlier_quant))
+        stats_files.append(get_stats_file_name(data_file))
+
+    return stats_files
@@ -0,0 +1,135 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (szander@swin.edu.au)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package web10greader
+# Streaming reader for (gzip-compressed) web10g and Windows estats logger files
+# with name-based access to the columns
+#
+# $Id$
+
+import re
+import gzip
+from itertools import chain
+from fabric.api import abort
+
+
+## Names of the first columns logged by web10g-logger for web10g 2.0.7 and by the
+## Windows estats logger (files of these loggers have no header line). Columns
+## not listed here can only be accessed by number.
+WEB10G_2_0_7_COLUMNS = [
+    'Timestamp', 'CID', 'LocalAddress', 'LocalPort', 'RemAddress', 'RemPort',
+    'SegsOut', 'DataSegsOut', 'DataOctetsOut', 'HCDataOctetsOut', 'SegsRetrans',
+    'OctetsRetrans', 'SegsIn', 'DataSegsIn', 'DataOctetsIn', 'HCDataOctetsIn',
+    'ElapsedSecs', 'ElapsedMicroSecs', 'StartTimeStamp', 'CurMSS', 'PipeSize',
+    'MaxPipeSize', 'SmoothedRTT', 'CurRTO', 'CongSignals', 'CurCwnd', 'CurSsthresh',
+    'Timeouts', 'CurRwinSent', 'MaxRwinSent', 'ZeroRwinSent', 'CurRwinRcvd',
+    'MaxRwinRcvd', 'ZeroRwinRcvd', 'SndLimTransRwin', 'SndLimTransCwnd',
+    'SndLimTransSnd', 'SndLimTimeRwin', 'SndLimTimeCwnd', 'SndLimTimeSnd',
+    'RetranThresh', 'NonRecovDAEpisodes', 'SumOctetsReordered', 'NonRecovDA',
+    'SampleRTT',
+]
+
+## Number of columns of web10g 2.0.7 logs
+WEB10G_2_0_7_NUM_COLUMNS = 122
+## Number of columns of web10g 2.0.9 logs
+WEB10G_2_0_9_NUM_COLUMNS = 128
+
+## Columns that identify a sample, consecutive samples of a flow with the same
+## values are duplicates (no data was sent or received since the last sample):
+## LocalAddress, LocalPort, RemAddress, RemPort, SegsOut, DataSegsOut, SegsIn,
+## DataSegsIn
+SAMPLE_KEY_COLUMNS = [ 3, 4, 5, 6, 7, 8, 13, 14 ]
+
+## Maximum number of error lines kept
+MAX_ERROR_LINES = 100
+
+
+## Reader for web10g logs. web10g-logger for web10g 2.0.9 logs a header line
+## with the column names, older loggers don't.
+class Web10gReader:
+
+    ## Open log file and detect the layout from the first line
+    #  @param fname web10g log file name
+    def __init__(self, fname):
+        self.fname = fname
+        ## error lines (at most MAX_ERROR_LINES), set by rows()
+        self.errors = []
+        ## number of error lines, set by rows()
+        self.num_errors = 0
+
+        self.f = gzip.open(fname, 'rb')
+        self.first = self.f.readline()
+        fields = self.first.rstrip('\n').split(',')
+        if fields[0] == 'Timestamp':
+            self.names = fields
+            if len(fields) == WEB10G_2_0_9_NUM_COLUMNS:
+                self.version = '2.0.9'
+            else:
+                self.version = 'unknown'
+        else:
+            self.names = WEB10G_2_0_7_COLUMNS
+            # Windows estats logger is equivalent to 2.0.7
+            self.version = '2.0.7'
+
+        self.columns = {}
+        for i, name in enumerate(self.names):
+            self.columns[name] = i + 1
+
+    ## Get column number
+    #  @param name Column name or number (starting with 1)
+    #  @return Column number (starting with 1)
+    def get_column(self, name):
+        name = name.strip()
+        if name.isdigit():
+            return int(name)
+        if name not in self.columns:
+            abort('Unknown attribute %s in web10g file %s (version %s)' % 
+                  (name, self.fname, self.version))
+        return self.columns[name]
+
+    ## Iterate over data lines. Like the original shell pipeline 
+    ## (zcat | egrep -v "[a-z]+" | sed '$d') this skips lines with lower case
+    ## letters (header and error messages) and the last data line, which may be
+    ## incomplete. Error lines are collected in self.errors. 
+    #  @return Generator of lists of fields
+    def rows(self):
+        error_re = re.compile('[a-z]+')
+        prev = None
+        for line in chain([ self.first ], self.f):
+            if error_re.search(line) is not None:
+                if line.find('runbg_wrapper.sh') == -1 and \
+                   line.find('Timestamp') == -1:
+                    self.num_errors += 1
+                    if len(self.errors) < MAX_ERROR_LINES:
+                        self.errors.append(line.rstrip('\n'))
+                continue
+
+            if prev is not None:
+                yield prev.rstrip('\n').split(',')
+            prev = line
+
+    def close(self):
+        self.f.close()